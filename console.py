@@ -0,0 +1,67 @@
+# console.py Non-blocking command reader for the USB serial console
+#
+# Lines typed into the REPL terminal while the game runs are collected one
+# character at a time, only when characters are waiting, and dispatched to
+# registered handlers. Polling costs one select call per loop, and where
+# ipoll() is available (MicroPython) it allocates nothing while idle.
+
+import sys
+import select
+
+
+class SerialConsole(object):
+    """
+    Register handlers with add(name, handler); a line "name args..." calls
+    handler(args) with the rest of the line as a string.
+    """
+
+    def __init__(self, stream=sys.stdin):
+        self.stream = stream
+        self.commands = {}
+        self._line = ""
+        self._poll = select.poll()
+        try:
+            self._poll.register(stream, select.POLLIN)
+        except OSError:
+            # Not a real stream (e.g. captured output on the host)
+            self._poll = None
+        # poll() builds a new list every call; ipoll() reuses the poller
+        self._ready = getattr(self._poll, "ipoll", None) or getattr(self._poll, "poll", None)
+        self.add("help", self._help)
+
+    def add(self, name, handler):
+        self.commands[name] = handler
+
+    def poll(self):
+        """
+        Read whatever is waiting and run any complete command. Never blocks.
+        """
+        while self._poll is not None and self._waiting():
+            char = self.stream.read(1)
+            if not char:
+                # End of input, e.g. stdin is not a terminal
+                self._poll.unregister(self.stream)
+                self._poll = None
+                return
+            if char in "\r\n":
+                line, self._line = self._line.strip(), ""
+                if line:
+                    self._run(line)
+            else:
+                self._line += char
+
+    def _waiting(self):
+        for _ in self._ready(0):
+            return True
+        return False
+
+    def _run(self, line):
+        name, _, args = line.partition(" ")
+        handler = self.commands.get(name)
+        if handler is None:
+            print("Unknown command: %s (try help)" % name)
+            return
+        handler(args)
+
+    def _help(self, args):
+        print("Commands: " + ", ".join(sorted(self.commands)))
@@ -0,0 +1,180 @@
+# detectors.py Gesture detectors for the analog inputs of Beep It
+#
+# The detectors here are fed one raw ADC reading at a time and keep their own
+# state, so InputManager only has to read the hardware and ask whether a new
+# gesture started.
+
+from array import array
+from utime import ticks_diff
+
+# Joystick settings (raw read_u16 counts)
+JOYSTICK_EMA_SHIFT = 3        # Baseline follows idle drift with alpha = 1/8
+JOYSTICK_FLICK_ON = 12000     # Deviation from baseline that counts as a flick
+JOYSTICK_FLICK_OFF = 5000     # Deviation below which the axis is back at rest
+JOYSTICK_REBASE_SAMPLES = 20  # Deflected this long means a new rest position
+
+# Slider settings (raw read_u16 counts, counts per second, milliseconds)
+SLIDER_HISTORY = 4            # Samples used for the velocity estimate
+SLIDER_VELOCITY_ON = 8000     # Faster than this is a slide
+SLIDER_VELOCITY_OFF = 3000    # Slower than this the slider has stopped
+SLIDER_SETTLE_MS = 150        # Stopped this long before a new slide can start
+
+SLIDER_REST = 0
+SLIDER_MOVING = 1
+SLIDER_SETTLED = 2
+
+
+class AxisBaseline(object):
+    """
+    Tracks the rest position of one joystick axis and detects fast deviations
+    from it. The baseline is an integer EMA (kept with 4 fractional bits) that
+    only moves while the axis is idle, so a flick never drags it along.
+    """
+
+    def __init__(self, value, on=JOYSTICK_FLICK_ON, off=JOYSTICK_FLICK_OFF,
+                 ema_shift=JOYSTICK_EMA_SHIFT, rebase=JOYSTICK_REBASE_SAMPLES):
+        self.on = on
+        self.off = off
+        self.ema_shift = ema_shift
+        self.rebase = rebase
+        self.seed(value)
+
+    def seed(self, value):
+        """
+        Restart tracking with value as the rest position
+        """
+        self._baseline = value << 4
+        self.active = False
+        self._active_count = 0
+
+    @property
+    def baseline(self):
+        return self._baseline >> 4
+
+    def update(self, value):
+        """
+        Feed one reading. Returns True only on the sample where the axis
+        leaves its rest position.
+        """
+        deviation = value - (self._baseline >> 4)
+        if deviation < 0:
+            deviation = -deviation
+
+        if self.active:
+            if deviation < self.off:
+                self.active = False
+                self._active_count = 0
+            else:
+                self._active_count += 1
+                if self._active_count >= self.rebase:
+                    # The stick is resting somewhere new, not being flicked
+                    self.seed(value)
+            return False
+
+        if deviation > self.on:
+            self.active = True
+            self._active_count = 0
+            return True
+
+        self._baseline += ((value << 4) - self._baseline) >> self.ema_shift
+        return False
+
+
+class JoystickDetector(object):
+    """
+    Flick detector for a two axis joystick that no longer rests at a
+    consistent value. Each axis keeps its own adaptive baseline; a flick is
+    reported once when either axis leaves rest, and again only after both
+    axes have returned.
+    """
+
+    def __init__(self, x_value, y_value):
+        self.x = AxisBaseline(x_value)
+        self.y = AxisBaseline(y_value)
+
+    @property
+    def active(self):
+        return self.x.active or self.y.active
+
+    def update(self, x_value, y_value):
+        was_active = self.active
+        x_flick = self.x.update(x_value)
+        y_flick = self.y.update(y_value)
+        return (x_flick or y_flick) and not was_active
+
+
+class SliderDetector(object):
+    """
+    Slide detector with an explicit rest / moving / settled state machine.
+    Velocity is estimated over the last few samples, and moving uses a higher
+    threshold than stopping so noise around either edge cannot re-trigger.
+    A slide is reported once, on the transition from rest to moving.
+    """
+
+    def __init__(self, value, now_ms, threshold, history=SLIDER_HISTORY,
+                 velocity_on=SLIDER_VELOCITY_ON, velocity_off=SLIDER_VELOCITY_OFF,
+                 settle_ms=SLIDER_SETTLE_MS):
+        self.threshold = threshold
+        self.velocity_on = velocity_on
+        self.velocity_off = velocity_off
+        self.settle_ms = settle_ms
+        self._values = array("l", [value] * history)
+        self._times = array("l", [now_ms] * history)
+        self._index = 0
+        self.state = SLIDER_REST
+        self.rest_value = value
+        self.velocity = 0
+        self.direction = 0
+        self._settled_at = now_ms
+
+    def _push(self, value, now_ms):
+        """
+        Store a sample and update the velocity estimate (counts per second)
+        """
+        size = len(self._values)
+        self._index = (self._index + 1) % size
+        self._values[self._index] = value
+        self._times[self._index] = now_ms
+        oldest = (self._index + 1) % size
+        dt = ticks_diff(now_ms, self._times[oldest])
+        if dt > 0:
+            self.velocity = (value - self._values[oldest]) * 1000 // dt
+        else:
+            self.velocity = 0
+
+    def update(self, value, now_ms):
+        """
+        Feed one reading taken at now_ms. Returns True only when a new slide
+        starts.
+        """
+        self._push(value, now_ms)
+        speed = self.velocity if self.velocity >= 0 else -self.velocity
+
+        if self.state == SLIDER_REST:
+            displacement = value - self.rest_value
+            if displacement < 0:
+                displacement = -displacement
+            if speed > self.velocity_on or displacement > self.threshold:
+                self.state = SLIDER_MOVING
+                self.direction = 1 if value > self.rest_value else -1
+                return True
+            return False
+
+        if self.state == SLIDER_MOVING:
+            if speed < self.velocity_off:
+                self.state = SLIDER_SETTLED
+                self._settled_at = now_ms
+            return False
+
+        # SLIDER_SETTLED
+        if speed > self.velocity_on:
+            self.state = SLIDER_MOVING
+            if (self.velocity > 0) != (self.direction > 0):
+                # Coming back the other way is a new slide
+                self.direction = -self.direction
+                return True
+            # Otherwise it is still the same slide, it only paused
+        elif ticks_diff(now_ms, self._settled_at) >= self.settle_ms:
+            self.state = SLIDER_REST
+            self.rest_value = value
+        return False
@@ -0,0 +1,91 @@
+# eventlog.py Deferred binary event log
+#
+# log() stores (ticks_ms, event code, two integer args) in a fixed size ring
+# and returns: nothing is formatted and nothing is printed. flush() turns the
+# entries into text later, when the loop has time to spare or on request,
+# so a slow USB host can only hold up the loop while it has nothing to do.
+# When the ring is full the oldest entries are overwritten and counted.
+
+from array import array
+from utime import ticks_ms, ticks_diff
+
+LEVEL_DEBUG = 10
+LEVEL_INFO = 20
+LEVEL_WARN = 30
+LEVELS = {"debug": LEVEL_DEBUG, "info": LEVEL_INFO, "warn": LEVEL_WARN}
+
+MAX_CODES = 32
+
+
+class EventLog(object):
+    """
+    Give each event code a level and a format with define(), then record
+    with log(code, a, b). Events below level are not stored.
+    """
+
+    def __init__(self, size=64, level=LEVEL_INFO):
+        self.size = size
+        self.level = level
+        self.ticks = array("L", [0] * size)
+        self.codes = bytearray(size)
+        self.args = array("l", [0] * (2 * size))
+        self.head = 0      # Next slot to write
+        self.count = 0     # Entries waiting to be flushed
+        self.dropped = 0   # Entries overwritten before they were flushed
+        self.levels = bytearray(MAX_CODES)
+        self.formats = [None] * MAX_CODES
+
+    def define(self, code, level, fmt, labels=None):
+        """
+        fmt takes up to two arguments, filled from the args given to log().
+        With labels, the first arg is an index into labels.
+        """
+        nargs = fmt.count("%") - 2 * fmt.count("%%")
+        self.levels[code] = level
+        self.formats[code] = (fmt, nargs, labels)
+
+    def log(self, code, a=0, b=0):
+        if self.levels[code] < self.level:
+            return
+        i = self.head
+        self.ticks[i] = ticks_ms()
+        self.codes[i] = code
+        self.args[2 * i] = a
+        self.args[2 * i + 1] = b
+        self.head = (i + 1) % self.size
+        if self.count == self.size:
+            self.dropped += 1
+        else:
+            self.count += 1
+
+    def flush(self, budget_ms=-1):
+        """
+        Print waiting entries, oldest first. With budget_ms >= 0, stop once
+        that long has been spent; the rest wait for the next flush.
+        """
+        start = ticks_ms()
+        if self.dropped:
+            print("(%d events dropped)" % self.dropped)
+            self.dropped = 0
+        while self.count:
+            i = (self.head - self.count) % self.size
+            self.count -= 1
+            print("%8d %s" % (self.ticks[i], self.format(self.codes[i], self.args[2 * i], self.args[2 * i + 1])))
+            if budget_ms >= 0 and ticks_diff(ticks_ms(), start) >= budget_ms:
+                break
+
+    def format(self, code, a, b):
+        fmt, nargs, labels = self.formats[code]
+        if labels is not None:
+            a = labels[a]
+        return fmt % (a, b)[:nargs]
+
+    def command(self, args):
+        """
+        Serial console handler: "log" flushes everything, "log debug",
+        "log info" or "log warn" sets the level
+        """
+        if args in LEVELS:
+            self.level = LEVELS[args]
+        else:
+            self.flush()
@@ -0,0 +1,17 @@
+# gesture_model.py Decision tree used by gestures.py
+#
+# Hand tuned: a starting point until enough recorded windows exist to train
+# on. Replace it with a trained tree by running
+#   python3 tools/train_gestures.py idle.csv bump.csv shake.csv --write
+# Each node is (feature, threshold, left, right); leaves are (-1, label, 0, 0).
+# Features: 0 activity, 1 peak, 2 crossings, 3 span, 4 gyro
+# Labels: 0 idle, 1 bump, 2 shake
+
+TREE = (
+    (0, 1500, 1, 2),
+    (1, 6000, 3, 4),
+    (2, 2, 4, 5),
+    (-1, 0, 0, 0),
+    (-1, 1, 0, 0),
+    (-1, 2, 0, 0),
+)
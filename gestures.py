@@ -0,0 +1,179 @@
+# gestures.py Window classifier for IMU gestures
+#
+# Touching the pad, flicking the joystick and sliding all jostle the box, so
+# the IMU sees them too. Rather than thresholding the acceleration magnitude,
+# each fixed window of accel + gyro samples is reduced to a handful of integer
+# features and labelled by a small decision tree. The tree lives in
+# gesture_model.py and is produced on the host by tools/train_gestures.py.
+
+from array import array
+
+try:
+    from utime import ticks_us, ticks_diff
+except ImportError:  # Host side training and evaluation
+    from time import perf_counter_ns
+
+    def ticks_us():
+        return perf_counter_ns() // 1000
+
+    def ticks_diff(new, old):
+        return new - old
+
+from gesture_model import TREE
+
+WINDOW_SHIFT = 6
+WINDOW = 1 << WINDOW_SHIFT   # Samples per window: 320 ms at 200 Hz
+SAMPLE_BYTES = 12            # One FIFO sample: accel x, y, z, gyro x, y, z
+CROSSING_DEADBAND = 2000     # Raw accel counts (~0.12 g at +/-2 g range)
+GESTURE_BUDGET_US = 10000    # CPU allowed per 320 ms window on the Pico
+
+# Labels
+IDLE = 0
+BUMP = 1
+SHAKE = 2
+LABELS = ("idle", "bump", "shake")
+
+# Features
+F_ACTIVITY = 0   # Mean absolute accel deviation from the window mean
+F_PEAK = 1       # Largest single sample deviation
+F_CROSSINGS = 2  # Direction reversals on the busiest accel axis
+F_SPAN = 3       # Samples deviating by more than half the peak
+F_GYRO = 4       # Mean absolute turn rate
+N_FEATURES = 5
+FEATURE_NAMES = ("activity", "peak", "crossings", "span", "gyro")
+
+
+def extract_features(samples, out):
+    """
+    Compute the features of one window. samples holds WINDOW interleaved
+    (ax, ay, az, gx, gy, gz) raw readings, out receives N_FEATURES integers.
+    Integer arithmetic only, and nothing is allocated.
+    """
+    mx = my = mz = 0
+    for i in range(0, WINDOW * 6, 6):
+        mx += samples[i]
+        my += samples[i + 1]
+        mz += samples[i + 2]
+    mx >>= WINDOW_SHIFT
+    my >>= WINDOW_SHIFT
+    mz >>= WINDOW_SHIFT
+
+    peak = gyro = 0
+    ax_sum = ay_sum = az_sum = 0
+    for i in range(0, WINDOW * 6, 6):
+        dx = abs(samples[i] - mx)
+        dy = abs(samples[i + 1] - my)
+        dz = abs(samples[i + 2] - mz)
+        ax_sum += dx
+        ay_sum += dy
+        az_sum += dz
+        deviation = dx + dy + dz
+        if deviation > peak:
+            peak = deviation
+        gyro += abs(samples[i + 3]) + abs(samples[i + 4]) + abs(samples[i + 5])
+    activity = (ax_sum + ay_sum + az_sum) >> WINDOW_SHIFT
+
+    # Reversals on the axis that moved the most, ignoring a deadband around
+    # the mean so sensor noise does not count.
+    axis, mean = 0, mx
+    if ay_sum > ax_sum and ay_sum >= az_sum:
+        axis, mean = 1, my
+    elif az_sum > ax_sum and az_sum > ay_sum:
+        axis, mean = 2, mz
+    crossings = side = span = 0
+    half_peak = peak >> 1
+    for i in range(0, WINDOW * 6, 6):
+        d = samples[i + axis] - mean
+        if d > CROSSING_DEADBAND:
+            if side < 0:
+                crossings += 1
+            side = 1
+        elif d < -CROSSING_DEADBAND:
+            if side > 0:
+                crossings += 1
+            side = -1
+        if abs(samples[i] - mx) + abs(samples[i + 1] - my) + abs(samples[i + 2] - mz) > half_peak:
+            span += 1
+
+    out[F_ACTIVITY] = activity
+    out[F_PEAK] = peak
+    out[F_CROSSINGS] = crossings
+    out[F_SPAN] = span
+    out[F_GYRO] = gyro >> WINDOW_SHIFT
+
+
+def predict(tree, features):
+    """
+    Walk a decision tree. Each node is (feature, threshold, left, right):
+    go left when features[feature] <= threshold. Leaves have feature -1 and
+    hold the label in threshold.
+    """
+    node = tree[0]
+    while node[0] >= 0:
+        node = tree[node[2]] if features[node[0]] <= node[1] else tree[node[3]]
+    return node[1]
+
+
+class GestureClassifier(object):
+    """
+    Collects samples into a window and labels each full window. The time
+    spent labelling is measured against GESTURE_BUDGET_US; report() prints
+    it.
+    """
+
+    def __init__(self, tree=TREE, budget_us=GESTURE_BUDGET_US):
+        self.tree = tree
+        self.budget_us = budget_us
+        self.samples = array("h", [0] * (WINDOW * 6))
+        self.features = array("l", [0] * N_FEATURES)
+        self.label = IDLE
+        self.windows = 0
+        self.last_us = 0
+        self.max_us = 0
+        self.overruns = 0
+        self._fill = 0
+
+    def restart(self):
+        """
+        Drop a partial window, e.g. after the FIFO overflowed. The last label
+        is stale by then too.
+        """
+        self._fill = 0
+        self.label = IDLE
+
+    def feed_fifo(self, buf, nbytes):
+        """
+        Add nbytes of raw FIFO data (whole samples) from buf. Returns the
+        label of the newest completed window, or -1 if none completed.
+        """
+        result = -1
+        samples = self.samples
+        for i in range(0, nbytes - nbytes % SAMPLE_BYTES, 2):
+            v = buf[i] << 8 | buf[i + 1]
+            if v & 0x8000:
+                v -= 0x10000
+            samples[self._fill] = v
+            self._fill += 1
+            if self._fill == WINDOW * 6:
+                self._fill = 0
+                result = self.classify()
+        return result
+
+    def classify(self):
+        """
+        Label the current window
+        """
+        start = ticks_us()
+        extract_features(self.samples, self.features)
+        self.label = predict(self.tree, self.features)
+        self.last_us = ticks_diff(ticks_us(), start)
+        if self.last_us > self.max_us:
+            self.max_us = self.last_us
+        if self.last_us > self.budget_us:
+            self.overruns += 1
+        self.windows += 1
+        return self.label
+
+    def report(self):
+        print("%d windows labelled, last %d us, worst %d us, %d over the %d us budget" % (
+            self.windows, self.last_us, self.max_us, self.overruns, self.budget_us))
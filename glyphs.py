@@ -0,0 +1,155 @@
+# glyphs.py User defined LCD characters loaded on demand, and a big font
+#
+# The HD44780 has eight user defined characters, codes 0 to 7, in CGRAM.
+# GlyphManager remembers which glyph each code holds, so drawing a glyph
+# that is already loaded costs no I2C traffic at all, and a new one replaces
+# the least recently used glyph that isn't pinned or already on the screen
+# being drawn. A glyph is 8 bytes, its rows from top to bottom, using the
+# low 5 bits.
+#
+# Screens are drawn into a bytearray of rows * columns character codes and
+# shown with I2cLcd.show():
+#   glyphs.begin()
+#   blank(screen)
+#   put_text(screen, columns, 0, b"Correct!")
+#   put_big_number(glyphs, screen, columns, score, 9, columns)
+#   lcd.show(screen)
+
+from array import array
+
+SLOTS = 8
+SOLID = 0xFF             # Solid block in the character ROM
+
+# Big digits are three columns by two rows, built from three glyphs and the
+# solid block. Each digit is its top row then its bottom row: T is a bar at
+# the top of the cell, B one at the bottom, X both, # solid.
+BIG_TOP = b"\x1f\x1f\x00\x00\x00\x00\x00\x00"
+BIG_BOTTOM = b"\x00\x00\x00\x00\x00\x00\x1f\x1f"
+BIG_BOTH = b"\x1f\x1f\x00\x00\x00\x00\x1f\x1f"
+BIG_DIGITS = (b"#T##B#", b"T#  # ", b"XX##BB", b"XX#BB#", b"#B#  #",
+              b"#XXBB#", b"#XX#B#", b"TT#  #", b"#X##B#", b"#X#BB#")
+BIG_WIDTH = 3
+
+# These three and the five icon glyphs below fill CGRAM exactly, so they
+# can all stay pinned and no screen has to upload one.
+BIG_GLYPHS = (BIG_TOP, BIG_BOTTOM, BIG_BOTH)
+
+# One cell icons for the actions, in the order of the inputs: a glyph, or
+# the code of a character in ROM A00 (slide is its right arrow).
+ICONS = (
+    b'\x00\x0e\x11\x15\x11\x0e\x00\x00',  # touch: a button
+    b'\x03\x03\x04\x04\x08\x1f\x1f\x00',  # flick: a tilted joystick
+    b'\x0a\x15\x00\x0e\x0e\x00\x15\x0a',  # shake: a block between wavy lines
+    0x7E,                                 # slide: an arrow
+    b'\x0e\x11\x17\x12\x10\x11\x0e\x00',  # twist: a turning arrow
+    b'\x00\x01\x03\x07\x0f\x1f\x00\x00',  # tilt: a slope
+)
+
+
+class GlyphManager(object):
+    """
+    Keeps track of lcd's CGRAM. Call begin() before drawing each screen and
+    load() for every glyph on it, and write the codes load() returns.
+    Pinned glyphs are never replaced.
+    """
+
+    def __init__(self, lcd):
+        self.lcd = lcd
+        self._glyphs = [None] * SLOTS
+        self._used = array("L", [0] * SLOTS)
+        self._pinned = bytearray(SLOTS)
+        self._uses = 0
+        self._screen = 0     # _uses when the screen being drawn was begun
+        self.uploads = 0
+        self.hits = 0
+
+    def begin(self):
+        self._uses += 1
+        self._screen = self._uses
+
+    def load(self, glyph, pin=False):
+        """
+        The character code of glyph, uploading it first if it isn't loaded
+        """
+        self._uses += 1
+        victim = -1
+        for slot in range(SLOTS):
+            held = self._glyphs[slot]
+            if held is glyph or held == glyph:
+                self.hits += 1
+                self._used[slot] = self._uses
+                if pin:
+                    self._pinned[slot] = 1
+                return slot
+            if (not self._pinned[slot] and self._used[slot] < self._screen and
+                    (victim < 0 or self._used[slot] < self._used[victim])):
+                victim = slot
+        if victim < 0:
+            raise ValueError("more than %d glyphs on one screen" % SLOTS)
+        self.lcd.custom_char(victim, glyph)
+        self.uploads += 1
+        self._glyphs[victim] = glyph
+        self._used[victim] = self._uses
+        self._pinned[victim] = 1 if pin else 0
+        return victim
+
+    def report(self):
+        print("glyph uploads %d, already loaded %d" % (self.uploads, self.hits))
+
+
+def blank(screen):
+    for i in range(len(screen)):
+        screen[i] = 0x20
+
+
+def put_text(screen, columns, row, text, column=0):
+    """
+    Write text into screen at row and column, cut off at the end of the row
+    """
+    start = row * columns + column
+    for i in range(min(len(text), columns - column)):
+        screen[start + i] = text[i]
+
+
+def put_big_number(glyphs, screen, columns, value, first, end):
+    """
+    Draw value in big digits across the two rows of screen, right aligned to
+    end with a blank column between digits. Draws nothing and returns False
+    if it would start before column first.
+    """
+    digits = 1
+    rest = value
+    while rest >= 10:
+        rest //= 10
+        digits += 1
+    x = end - digits * (BIG_WIDTH + 1) + 1
+    if x < first:
+        return False
+    top = glyphs.load(BIG_TOP, True)
+    bottom = glyphs.load(BIG_BOTTOM, True)
+    both = glyphs.load(BIG_BOTH, True)
+    x = end - BIG_WIDTH
+    while digits:
+        cells = BIG_DIGITS[value % 10]
+        for i in range(2 * BIG_WIDTH):
+            cell = cells[i]
+            if cell == 0x54:    # T
+                cell = top
+            elif cell == 0x42:  # B
+                cell = bottom
+            elif cell == 0x58:  # X
+                cell = both
+            elif cell == 0x23:  # #
+                cell = SOLID
+            screen[(i // BIG_WIDTH) * columns + x + i % BIG_WIDTH] = cell
+        value //= 10
+        digits -= 1
+        x -= BIG_WIDTH + 1
+    return True
+
+
+def put_icon(glyphs, screen, columns, icon, column, row=0):
+    """
+    Draw one of ICONS into screen at row and column, pinning its glyph
+    """
+    screen[row * columns + column] = icon if type(icon) is int else glyphs.load(icon, True)
@@ -0,0 +1,58 @@
+# heapcheck.py Per frame heap allocation check
+#
+# Wraps each pass of the main loop in gc.mem_alloc() readings. Frames that
+# handled no input should allocate nothing at all, so the garbage collector
+# never has to pause the game. With strict set, the first allocating idle
+# frame raises AssertionError, so a regression shows up straight away.
+
+import gc
+
+
+class HeapCheck(object):
+    """
+    Counts idle frames that allocated, and the largest allocation seen in
+    idle and busy frames
+    """
+
+    def __init__(self, strict=False):
+        self.strict = strict
+        self.reset()
+
+    def reset(self):
+        self.frames = 0
+        self.idle_frames = 0
+        self.allocating = 0    # Idle frames that allocated
+        self.skipped = 0       # Frames a collection ran in, which can't be measured
+        self.idle_max = 0
+        self.busy_max = 0
+        self._before = gc.mem_alloc()
+
+    def start(self):
+        self._before = gc.mem_alloc()
+
+    def end(self, idle):
+        """
+        Close the frame opened by start(). idle is True when the frame
+        handled no input and changed no state.
+        """
+        delta = gc.mem_alloc() - self._before
+        self.frames += 1
+        if delta < 0:
+            self.skipped += 1
+            return
+        if not idle:
+            if delta > self.busy_max:
+                self.busy_max = delta
+            return
+        self.idle_frames += 1
+        if delta:
+            self.allocating += 1
+            if delta > self.idle_max:
+                self.idle_max = delta
+            if self.strict:
+                raise AssertionError("idle frame allocated %d bytes" % delta)
+
+    def report(self):
+        print("frames %d, idle %d, idle frames allocating %d (max %d bytes), busy max %d bytes, skipped %d" % (
+            self.frames, self.idle_frames, self.allocating, self.idle_max, self.busy_max, self.skipped))
+        print("heap: %d bytes used, %d free" % (gc.mem_alloc(), gc.mem_free()))
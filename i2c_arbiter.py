@@ -0,0 +1,270 @@
+# i2c_arbiter.py I2C bus that rides out glitches and stuck devices
+#
+# I2CArbiter owns one machine.I2C and stands in for it, so drivers need no
+# changes. A transfer that fails with OSError may have got part way: some
+# nibbles of an LCD write reached the controller, or some bytes left the
+# IMU's FIFO. Sending it again would put the device out of step, so for
+# devices registered with add_device() a failure goes straight to recovery.
+# Only transfers to other devices, or ones registered with repeat=True, are
+# tried again, up to retries times, waiting backoff_us and doubling each
+# time, before recovering.
+#
+# recover() takes the pins over, clocks SCL until SDA is released (a device
+# reset or interrupted half way through sending a byte holds it low), sends
+# a stop condition, creates the I2C again and calls each device's reset
+# function, which starts the device from scratch whatever state it is in.
+# A reset that fails is run again from the start, up to retries times, and
+# can't start another recovery. Then the transfer gets one last try, and
+# only if that fails too does the OSError reach the driver. Recoveries run
+# in the middle of a frame, so they are only counted: report() prints them.
+#
+# A bus can be held while more urgent work runs: writes to it are copied
+# into a queue and sent, in order, when it is released. The game holds the
+# display's bus while it reads the sensors, so a screen drawn by an answer
+# goes out after the frame's readings rather than in the middle of them.
+# Reads, and writes without a stop, send the queue first and are never held.
+#
+#   bus = I2CArbiter(0, scl=5, sda=4, name="I2C0")
+#   lcd = I2cLcd(bus, ...)
+#   bus.add_device(0x27, lcd.reinit)   # LCD writes can't be repeated
+#   bus.hold()
+#   ...
+#   bus.release()
+
+from machine import I2C, Pin
+from utime import sleep_us, ticks_us, ticks_diff
+
+BACKOFF_MAX_US = 2000  # Longest wait between tries
+RECOVERY_CLOCKS = 9    # Enough to clock out any byte and its acknowledge
+CLOCK_US = 5           # Half an SCL period while recovering, 100 kHz
+
+# Transfers, for _run()
+_WRITE = 0
+_WRITEV = 1
+_READ = 2
+_READ_INTO = 3
+_WRITE_MEM = 4
+_READ_MEM = 5
+_READ_MEM_INTO = 6
+_SCAN = 7
+
+
+class I2CArbiter(object):
+    """
+    I2C bus bus_id on pins scl and sda with retries, recovery and holding.
+    Anything else is passed through to the I2C.
+    """
+
+    def __init__(self, bus_id, scl, sda, freq=400000, name=None, retries=3, backoff_us=100,
+                 queue_bytes=512):
+        self.bus_id = bus_id
+        self.scl = scl
+        self.sda = sda
+        self.freq = freq
+        self.name = name or "I2C%d" % bus_id
+        self.retries = retries
+        self.backoff_us = backoff_us
+        self._i2c = I2C(bus_id, scl=Pin(scl), sda=Pin(sda), freq=freq)
+        self._devices = {}  # addr: function that sets the device up again
+        self._repeat = {}   # addr: True if its transfers can be sent again
+        self._recovering = False
+        self._held = False
+        self._queue = bytearray(queue_bytes)  # addr, length (2 bytes), data
+        self._view = memoryview(self._queue)
+        self._queued = 0
+        # Counters
+        self.retried = 0      # Tries after the first
+        self.recoveries = 0
+        self.failures = 0     # Transfers that failed even after recovery
+        self.held_writes = 0
+        self.recovery_us = 0  # Last recovery
+        self.recovery_max_us = 0
+        self.recovery_total_us = 0
+        self.recovery_failures = 0  # Recoveries after which a device didn't answer
+
+    def __getattr__(self, name):
+        return getattr(self._i2c, name)
+
+    def add_device(self, addr, reset, repeat=False):
+        """
+        reset() sets the device at addr up again after the bus is recovered.
+        With repeat, a failed transfer to it is tried again before
+        recovering, which is only safe if sending it twice does no harm.
+        """
+        self._devices[addr] = reset
+        self._repeat[addr] = repeat
+
+    def hold(self):
+        self._held = True
+
+    def release(self):
+        self._held = False
+        self.flush()
+
+    def flush(self):
+        """
+        Send the held writes
+        """
+        view = self._view
+        o = 0
+        end = self._queued
+        self._queued = 0
+        while o < end:
+            n = view[o + 1] << 8 | view[o + 2]
+            self._run(_WRITE, view[o], view[o + 3:o + 3 + n], True)
+            o += 3 + n
+
+    def _run(self, op, addr, arg, extra, addrsize=8):
+        wait = self.backoff_us
+        tries = 0
+        while True:
+            try:
+                return self._transfer(op, addr, arg, extra, addrsize)
+            except OSError as e:
+                error = e
+            if tries < self.retries and self._repeat.get(addr, True):
+                sleep_us(wait)
+                wait = min(2 * wait, BACKOFF_MAX_US)
+            elif tries > self.retries or self._recovering or not self.recover():
+                self.failures += 1
+                raise error
+            else:
+                tries = self.retries  # One last try after recovering
+            tries += 1
+            self.retried += 1
+
+    def _transfer(self, op, addr, arg, extra, addrsize):
+        i2c = self._i2c
+        if op == _WRITE:
+            return i2c.writeto(addr, arg, extra)
+        if op == _READ_INTO:
+            return i2c.readfrom_into(addr, arg, extra)
+        if op == _READ_MEM_INTO:
+            return i2c.readfrom_mem_into(addr, extra, arg, addrsize=addrsize)
+        if op == _WRITE_MEM:
+            return i2c.writeto_mem(addr, extra, arg, addrsize=addrsize)
+        if op == _READ_MEM:
+            return i2c.readfrom_mem(addr, extra, arg, addrsize=addrsize)
+        if op == _READ:
+            return i2c.readfrom(addr, arg, extra)
+        if op == _WRITEV:
+            return i2c.writevto(addr, arg, extra)
+        return i2c.scan()
+
+    def recover(self):
+        """
+        Free a stuck bus and set its devices up again. Returns True if they
+        all answered.
+        """
+        start = ticks_us()
+        self._recovering = True
+        try:
+            scl = Pin(self.scl, Pin.OPEN_DRAIN, value=1)
+            sda = Pin(self.sda, Pin.OPEN_DRAIN, value=1)
+            # Whatever holds SDA low is part way through a byte: clock until
+            # it lets go
+            for _ in range(RECOVERY_CLOCKS):
+                if sda.value():
+                    break
+                scl.value(0)
+                sleep_us(CLOCK_US)
+                scl.value(1)
+                sleep_us(CLOCK_US)
+            # Stop condition: SDA rises while SCL is high
+            scl.value(0)
+            sleep_us(CLOCK_US)
+            sda.value(0)
+            sleep_us(CLOCK_US)
+            scl.value(1)
+            sleep_us(CLOCK_US)
+            sda.value(1)
+            sleep_us(CLOCK_US)
+            self._i2c = I2C(self.bus_id, scl=Pin(self.scl), sda=Pin(self.sda), freq=self.freq)
+            for addr in self._devices:
+                tries = 0
+                while True:
+                    try:
+                        self._devices[addr]()
+                        break
+                    except OSError:
+                        if tries >= self.retries:
+                            raise
+                        tries += 1
+                        self.retried += 1
+            recovered = True
+        except OSError:
+            recovered = False
+        self._recovering = False
+        elapsed = ticks_diff(ticks_us(), start)
+        self.recoveries += 1
+        self.recovery_us = elapsed
+        self.recovery_total_us += elapsed
+        if elapsed > self.recovery_max_us:
+            self.recovery_max_us = elapsed
+        if not recovered:
+            self.recovery_failures += 1
+        return recovered
+
+    # Transfers
+    def scan(self):
+        if self._queued:
+            self.flush()
+        return self._run(_SCAN, 0, None, 0)
+
+    def writeto(self, addr, buf, stop=True):
+        if not self._held or self._recovering or not stop:
+            if self._queued:
+                self.flush()
+            return self._run(_WRITE, addr, buf, stop)
+        n = len(buf)
+        if self._queued + 3 + n > len(self._queue):
+            self.flush()
+            if 3 + n > len(self._queue):
+                return self._run(_WRITE, addr, buf, stop)
+        o = self._queued
+        queue = self._queue
+        queue[o] = addr
+        queue[o + 1] = n >> 8
+        queue[o + 2] = n & 0xff
+        queue[o + 3:o + 3 + n] = buf
+        self._queued = o + 3 + n
+        self.held_writes += 1
+        return n
+
+    def writevto(self, addr, vector, stop=True):
+        if self._queued:
+            self.flush()
+        return self._run(_WRITEV, addr, vector, stop)
+
+    def readfrom(self, addr, nbytes, stop=True):
+        if self._queued:
+            self.flush()
+        return self._run(_READ, addr, nbytes, stop)
+
+    def readfrom_into(self, addr, buf, stop=True):
+        if self._queued:
+            self.flush()
+        self._run(_READ_INTO, addr, buf, stop)
+
+    def writeto_mem(self, addr, memaddr, buf, addrsize=8):
+        if self._queued:
+            self.flush()
+        self._run(_WRITE_MEM, addr, buf, memaddr, addrsize)
+
+    def readfrom_mem(self, addr, memaddr, nbytes, addrsize=8):
+        if self._queued:
+            self.flush()
+        return self._run(_READ_MEM, addr, nbytes, memaddr, addrsize)
+
+    def readfrom_mem_into(self, addr, memaddr, buf, addrsize=8):
+        if self._queued:
+            self.flush()
+        self._run(_READ_MEM_INTO, addr, buf, memaddr, addrsize)
+
+    def report(self):
+        print("%s: %d retries, %d recoveries, %d failures, %d writes held" % (
+            self.name, self.retried, self.recoveries, self.failures, self.held_writes))
+        if self.recoveries:
+            print("recovery last %d us, worst %d us, average %d us, %d failed" % (
+                self.recovery_us, self.recovery_max_us, self.recovery_total_us // self.recoveries,
+                self.recovery_failures))
@@ -2,6 +2,7 @@
 
 import utime
 import gc
+from array import array
 
 from lcd_api import LcdApi
 from machine import I2C
@@ -14,15 +15,79 @@ MASK_E  = 0x04       # P2
 SHIFT_BACKLIGHT = 3  # P3
 SHIFT_DATA      = 4  # P4-P7
 
+NO_CURSOR = 0xFFFF   # Marks an empty frame slot
+BUSY_TIMEOUT_US = 5000  # Worst case for clear and home, if the busy flag can't be read
+DDRAM_COLUMNS = 40   # Display memory per line, of which num_columns show
+
 class I2cLcd(LcdApi):
 
     #Implements a HD44780 character LCD connected via PCF8574 on I2C
+    #
+    # show() puts up a whole screen of text in one I2C write, from frames
+    # encoded ahead of time into the PCF8574 port bytes: the display address
+    # of each line, every character of it padded with spaces, and the
+    # address the cursor ends up at. Text given to pin() stays encoded;
+    # anything else is kept in frame_slots slots, the least recently shown
+    # reused first. The frames include the backlight bit, so they are
+    # encoded again when the backlight changes.
+    #
+    # marquee() writes text too long for the screen into the whole 40
+    # characters of display memory of the first line, and each scroll()
+    # then moves the view one character along with a single display shift
+    # command. Any other write first returns the view home. Only for
+    # displays of one or two lines, where each line has its own 40
+    # characters.
+    #
+    # Clear and home take up to 1.52 ms. With busy_poll the driver reads
+    # the controller's busy flag back through the PCF8574 until they are
+    # done, rather than sleeping for a fixed 5 ms.
 
-    def __init__(self, i2c, i2c_addr, num_lines, num_columns):
+    def __init__(self, i2c, i2c_addr, num_lines, num_columns, powerup_ms=20, frame_slots=4,
+                 busy_poll=True):
         self.i2c = i2c
         self.i2c_addr = i2c_addr
-        self.i2c.writeto(self.i2c_addr, bytes([0]))
-        utime.sleep_ms(20)   # Allow LCD time to powerup
+        self.busy_poll = busy_poll
+        self.busy_polls = 0  # Status reads, for profiling
+        # Preallocated transfer buffers: one port write, or the four writes
+        # that clock a whole byte through as two nibbles
+        self.buf1 = bytearray(1)
+        self.buf4 = bytearray(4)
+        # A CGRAM upload: its address, eight rows and the cursor address
+        self._glyph_buf = bytearray(4 * 10)
+        self._cgram = bytearray(64)  # What custom_char() uploaded, for reinit()
+        self._cgram_set = 0          # A bit per location uploaded
+        self._status = bytearray(1)
+        self._pinned = {}    # text: (frame, cursor)
+        self._marquees = {}  # text: frame
+        self.shifted = 0     # Display shift commands since the view was home
+        self.marquee_left = 0
+        self._slot_cursor = array("H")
+        self._line_bufs = ()
+        self._last_frame = None  # What show() or marquee() last sent
+        self._last_cursor = 0
+        self.i2c.writeto(self.i2c_addr, self.buf1)
+        if powerup_ms > 0:
+            utime.sleep_ms(powerup_ms)  # Allow LCD time to powerup
+        self._reset()
+        LcdApi.__init__(self, num_lines, num_columns)
+        self.hal_write_command(self._function())
+        self.frame_size = 4 * (self.num_lines * (self.num_columns + 1) + 1)
+        self._screen = bytearray(self.num_lines * self.num_columns)
+        self._slot_screens = [bytearray(len(self._screen)) for _ in range(frame_slots)]
+        self._slot_frames = [bytearray(self.frame_size) for _ in range(frame_slots)]
+        self._slot_cursor = array("H", [NO_CURSOR] * frame_slots)
+        self._slot_used = array("L", [0] * frame_slots)
+        self.marquee_size = 4 * (DDRAM_COLUMNS + 1 + (self.num_lines - 1) * (self.num_columns + 1) + 1)
+        self._marquee_frame = bytearray(self.marquee_size)
+        # One line per row: its address, the padded text and the cursor address
+        self._line_bufs = [bytearray(4 * (self.num_columns + 2)) for _ in range(self.num_lines)]
+        self._lines_shown = 0  # A bit per row show_line() wrote since the last frame
+        self._uses = 0
+        self.frame_hits = 0
+        self.frame_misses = 0
+        gc.collect()
+
+    def _reset(self):
         # Send reset 3 times
         self.hal_write_init_nibble(self.LCD_FUNCTION_RESET)
         utime.sleep_ms(5)    # Need to delay at least 4.1 msec
@@ -33,56 +98,310 @@ class I2cLcd(LcdApi):
         # Put LCD into 4-bit mode
         self.hal_write_init_nibble(self.LCD_FUNCTION)
         utime.sleep_ms(1)
-        LcdApi.__init__(self, num_lines, num_columns)
+
+    def _function(self):
         cmd = self.LCD_FUNCTION
-        if num_lines > 1:
+        if self.num_lines > 1:
             cmd |= self.LCD_FUNCTION_2LINES
-        self.hal_write_command(cmd)
-        gc.collect()
+        return cmd
+
+    def reinit(self):
+        # Set the controller up again after its I2C bus was recovered: a
+        # transfer cut short can leave it half way through a byte. The reset
+        # sequence gets it back in step whatever state it is in. Then the
+        # user defined characters are uploaded again, in case one was cut
+        # short, and the screen is put back: the last frame shown and any
+        # lines written over it since.
+        cursor_x = self.cursor_x
+        cursor_y = self.cursor_y
+        self._reset()
+        self.hal_write_command(self._function())
+        self.display_off()
+        self.clear()
+        self.hal_write_command(self.LCD_ENTRY_MODE | self.LCD_ENTRY_INC)
+        self.display_on()
+        for location in range(8):
+            if self._cgram_set >> location & 1:
+                self.custom_char(location, self._cgram[8 * location:8 * location + 8])
+        if self._last_frame:
+            lines = self._lines_shown
+            self._send(self._last_frame, self._last_cursor)
+            if lines:
+                # The cursor's row last, as its line leaves the cursor there
+                for row in range(self.num_lines):
+                    if lines >> row & 1 and row != cursor_y:
+                        self.i2c.writeto(self.i2c_addr, self._line_bufs[row])
+                if lines >> cursor_y & 1:
+                    self.i2c.writeto(self.i2c_addr, self._line_bufs[cursor_y])
+                self._lines_shown = lines
+                self.cursor_x = cursor_x
+                self.cursor_y = cursor_y
 
     def hal_write_init_nibble(self, nibble):
         # Writes an initialization nibble to the LCD.
         # This particular function is only used during initialization.
         byte = ((nibble >> 4) & 0x0f) << SHIFT_DATA
-        self.i2c.writeto(self.i2c_addr, bytes([byte | MASK_E]))
-        self.i2c.writeto(self.i2c_addr, bytes([byte]))
-        gc.collect()
+        buf = self.buf4
+        buf[0] = byte | MASK_E
+        buf[1] = byte
+        self.i2c.writeto(self.i2c_addr, memoryview(buf)[:2])
 
     def hal_backlight_on(self):
         # Allows the hal layer to turn the backlight on
-        self.i2c.writeto(self.i2c_addr, bytes([1 << SHIFT_BACKLIGHT]))
-        gc.collect()
+        self.buf1[0] = 1 << SHIFT_BACKLIGHT
+        self.i2c.writeto(self.i2c_addr, self.buf1)
+        self._encode_frames()
 
     def hal_backlight_off(self):
         #Allows the hal layer to turn the backlight off
-        self.i2c.writeto(self.i2c_addr, bytes([0]))
-        gc.collect()
+        self.buf1[0] = 0
+        self.i2c.writeto(self.i2c_addr, self.buf1)
+        self._encode_frames()
+
+    def _put_byte(self, buf, offset, rs, value):
+        # The four port writes that clock a byte out as two nibbles. The
+        # PCF8574 updates its port after every byte, so each nibble still sees
+        # E rise and fall. Data is latched on the falling edge of E.
+        high = (rs | (self.backlight << SHIFT_BACKLIGHT) |
+                (((value >> 4) & 0x0f) << SHIFT_DATA))
+        low = (rs | (self.backlight << SHIFT_BACKLIGHT) |
+               ((value & 0x0f) << SHIFT_DATA))
+        buf[offset] = high | MASK_E
+        buf[offset + 1] = high
+        buf[offset + 2] = low | MASK_E
+        buf[offset + 3] = low
+        return offset + 4
+
+    def _write_byte(self, rs, value):
+        # Clock a byte out in a single I2C transaction
+        self._put_byte(self.buf4, 0, rs, value)
+        self.i2c.writeto(self.i2c_addr, self.buf4)
 
     def hal_write_command(self, cmd):
-        # Write a command to the LCD. Data is latched on the falling edge of E.
-        byte = ((self.backlight << SHIFT_BACKLIGHT) |
-                (((cmd >> 4) & 0x0f) << SHIFT_DATA))
-        self.i2c.writeto(self.i2c_addr, bytes([byte | MASK_E]))
-        self.i2c.writeto(self.i2c_addr, bytes([byte]))
-        byte = ((self.backlight << SHIFT_BACKLIGHT) |
-                ((cmd & 0x0f) << SHIFT_DATA))
-        self.i2c.writeto(self.i2c_addr, bytes([byte | MASK_E]))
-        self.i2c.writeto(self.i2c_addr, bytes([byte]))
+        # Write a command to the LCD.
+        self._write_byte(0, cmd)
         if cmd <= 3:
             # The home and clear commands require a worst case delay of 4.1 msec
-            utime.sleep_ms(5)
-        gc.collect()
+            if self.busy_poll:
+                self._wait_ready()
+            else:
+                utime.sleep_ms(5)
+
+    def _wait_ready(self):
+        # Read the busy flag until it clears. With R/W high and the data
+        # lines released (written high), each E pulse reads a nibble: the
+        # busy flag is the top bit of the first. Both nibbles are clocked,
+        # so each read starts on a first one, and finishing one read and
+        # starting the next share a write.
+        read = (self.backlight << SHIFT_BACKLIGHT) | MASK_RW | 0xF0
+        buf = self.buf4
+        buf[0] = read
+        buf[1] = read | MASK_E
+        buf[2] = read
+        buf[3] = read | MASK_E
+        self.i2c.writeto(self.i2c_addr, memoryview(buf)[3:])
+        start = utime.ticks_us()
+        while True:
+            self.i2c.readfrom_into(self.i2c_addr, self._status)
+            self.busy_polls += 1
+            if (not self._status[0] & 0x80 or
+                    utime.ticks_diff(utime.ticks_us(), start) > BUSY_TIMEOUT_US):
+                self.i2c.writeto(self.i2c_addr, memoryview(buf)[:3])
+                return
+            self.i2c.writeto(self.i2c_addr, buf)
 
     def hal_write_data(self, data):
-        # Write data to the LCD. Data is latched on the falling edge of E.
-        byte = (MASK_RS |
-                (self.backlight << SHIFT_BACKLIGHT) |
-                (((data >> 4) & 0x0f) << SHIFT_DATA))
-        self.i2c.writeto(self.i2c_addr, bytes([byte | MASK_E]))
-        self.i2c.writeto(self.i2c_addr, bytes([byte]))
-        byte = (MASK_RS |
-                (self.backlight << SHIFT_BACKLIGHT) |
-                ((data & 0x0f) << SHIFT_DATA))
-        self.i2c.writeto(self.i2c_addr, bytes([byte | MASK_E]))
-        self.i2c.writeto(self.i2c_addr, bytes([byte]))
-        gc.collect()
+        # Write data to the LCD.
+        self._write_byte(MASK_RS, data)
+
+    def custom_char(self, location, charmap):
+        # Upload a glyph in one I2C write, leaving the cursor where it was
+        location &= 0x7
+        buf = self._glyph_buf
+        o = self._put_byte(buf, 0, 0, self.LCD_CGRAM | (location << 3))
+        for i in range(8):
+            o = self._put_byte(buf, o, MASK_RS, charmap[i])
+        self._put_byte(buf, o, 0, self.LCD_DDRAM | self.ddram_address(self.cursor_x, self.cursor_y))
+        self.i2c.writeto(self.i2c_addr, buf)
+        self._cgram[8 * location:8 * location + 8] = charmap
+        self._cgram_set |= 1 << location
+
+    def clear(self):
+        # Clearing also returns the view home
+        LcdApi.clear(self)
+        self.shifted = 0
+        self.marquee_left = 0
+
+    def move_to(self, cursor_x, cursor_y):
+        self.stop_marquee()
+        LcdApi.move_to(self, cursor_x, cursor_y)
+
+    def pin(self, text, marquee=False):
+        # Encode text (bytes) for show(), or for marquee(), once and keep it
+        if marquee:
+            frame = bytearray(self.marquee_size)
+            self._encode_marquee(text, len(text), frame)
+            self._marquees[text] = frame
+            return
+        frame = bytearray(self.frame_size)
+        cursor = self._layout(text, len(text), self._screen)
+        self._encode(self._screen, cursor, frame)
+        self._pinned[text] = (frame, cursor)
+
+    def show(self, text, length=-1):
+        # Show the first length bytes of text (all of it by default) on an
+        # otherwise blank screen, laid out as clear() and putbytes() would,
+        # in one I2C write
+        self.stop_marquee()
+        if length < 0:
+            length = len(text)
+            entry = self._pinned.get(text) if type(text) is bytes else None
+            if entry:
+                self.frame_hits += 1
+                self._send(entry[0], entry[1])
+                return
+        screen = self._screen
+        cursor = self._layout(text, length, screen)
+        self._uses += 1
+        oldest = 0
+        for i in range(len(self._slot_cursor)):
+            if self._slot_cursor[i] == cursor and self._slot_screens[i] == screen:
+                self.frame_hits += 1
+                self._slot_used[i] = self._uses
+                self._send(self._slot_frames[i], cursor)
+                return
+            if self._slot_used[i] < self._slot_used[oldest]:
+                oldest = i
+        self.frame_misses += 1
+        self._slot_screens[oldest][:] = screen
+        self._slot_cursor[oldest] = cursor
+        self._slot_used[oldest] = self._uses
+        self._encode(screen, cursor, self._slot_frames[oldest])
+        self._send(self._slot_frames[oldest], cursor)
+
+    def show_line(self, row, text):
+        # Replace one line with text padded with spaces, in one I2C write,
+        # leaving the cursor after the text
+        self.stop_marquee()
+        buf = self._line_bufs[row]
+        o = self._put_byte(buf, 0, 0, self.LCD_DDRAM | self.ddram_address(0, row))
+        for i in range(self.num_columns):
+            o = self._put_byte(buf, o, MASK_RS, text[i] if i < len(text) else 0x20)
+        x = min(len(text), self.num_columns - 1)
+        self._put_byte(buf, o, 0, self.LCD_DDRAM | self.ddram_address(x, row))
+        self.i2c.writeto(self.i2c_addr, buf)
+        self.cursor_x = x
+        self.cursor_y = row
+        self._lines_shown |= 1 << row
+
+    def marquee(self, text, length=-1):
+        # Show the first length bytes of text (all of it by default, up to
+        # 40) on the first line of an otherwise blank screen, in one I2C
+        # write, ready to scroll. Returns how many scroll() steps bring its
+        # end into view.
+        self.stop_marquee()
+        if length < 0:
+            length = len(text)
+            frame = self._marquees.get(text) if type(text) is bytes else None
+            if frame:
+                self.frame_hits += 1
+            else:
+                frame = self._marquee_frame
+                self._encode_marquee(text, length, frame)
+        else:
+            frame = self._marquee_frame
+            self._encode_marquee(text, length, frame)
+        self._send(frame, 0)
+        self.marquee_left = max(0, min(length, DDRAM_COLUMNS) - self.num_columns)
+        return self.marquee_left
+
+    def scroll(self):
+        # Move the marquee one character left. Returns how many steps are
+        # left, 0 once its end is in view or after any other write.
+        if not self.marquee_left:
+            return 0
+        self.hal_write_command(self.LCD_MOVE | self.LCD_MOVE_DISP)
+        self.shifted += 1
+        self.marquee_left -= 1
+        return self.marquee_left
+
+    def stop_marquee(self):
+        # Return the view home, if it was scrolled, before writing elsewhere
+        self.marquee_left = 0
+        if self.shifted:
+            self.shifted = 0
+            self.hal_write_command(self.LCD_HOME)
+
+    def _send(self, frame, cursor):
+        self.i2c.writeto(self.i2c_addr, frame)
+        self._last_frame = frame
+        self._last_cursor = cursor
+        self._lines_shown = 0
+        self.cursor_x = cursor & 0x3f
+        self.cursor_y = (cursor >> 6) & 0x3
+        self.implied_newline = bool(cursor & 0x100)
+
+    def _layout(self, text, length, screen):
+        # Place text on a blank screen the way putcode() moves the cursor.
+        # Returns the final cursor: x, y << 6 and implied_newline << 8.
+        for i in range(len(screen)):
+            screen[i] = 0x20
+        x = y = 0
+        implied = False
+        for i in range(length):
+            code = text[i]
+            if code == 0x0a:
+                if implied:
+                    implied = False
+                else:
+                    x = self.num_columns
+            else:
+                screen[y * self.num_columns + x] = code
+                x += 1
+            if x >= self.num_columns:
+                x = 0
+                y += 1
+                implied = code != 0x0a
+            if y >= self.num_lines:
+                y = 0
+        return x | y << 6 | implied << 8
+
+    def _encode(self, screen, cursor, frame):
+        o = 0
+        for y in range(self.num_lines):
+            o = self._put_byte(frame, o, 0, self.LCD_DDRAM | self.ddram_address(0, y))
+            for x in range(y * self.num_columns, (y + 1) * self.num_columns):
+                o = self._put_byte(frame, o, MASK_RS, screen[x])
+        self._put_byte(frame, o, 0, self.LCD_DDRAM |
+                       self.ddram_address(cursor & 0x3f, (cursor >> 6) & 0x3))
+
+    def _encode_marquee(self, text, length, frame):
+        o = self._put_byte(frame, 0, 0, self.LCD_DDRAM)
+        for i in range(DDRAM_COLUMNS):
+            o = self._put_byte(frame, o, MASK_RS, text[i] if i < length else 0x20)
+        for y in range(1, self.num_lines):
+            o = self._put_byte(frame, o, 0, self.LCD_DDRAM | self.ddram_address(0, y))
+            for x in range(self.num_columns):
+                o = self._put_byte(frame, o, MASK_RS, 0x20)
+        self._put_byte(frame, o, 0, self.LCD_DDRAM)
+
+    def _encode_frames(self):
+        # The backlight bit has changed: encode the pinned frames again and
+        # forget the rest. What reinit() would send again, the last frame
+        # and lines, may be neither, so their bit is set in place.
+        for text in self._pinned:
+            frame, cursor = self._pinned[text]
+            self._encode(self._screen, self._layout(text, len(text), self._screen), frame)
+        for text in self._marquees:
+            self._encode_marquee(text, len(text), self._marquees[text])
+        for i in range(len(self._slot_cursor)):
+            self._slot_cursor[i] = NO_CURSOR
+        if self._last_frame:
+            self._set_backlight_bit(self._last_frame)
+        for buf in self._line_bufs:
+            self._set_backlight_bit(buf)
+
+    def _set_backlight_bit(self, buf):
+        bit = self.backlight << SHIFT_BACKLIGHT
+        for i in range(len(buf)):
+            buf[i] = buf[i] & ~(1 << SHIFT_BACKLIGHT) | bit
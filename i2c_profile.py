@@ -0,0 +1,126 @@
+# i2c_profile.py Instrumented I2C proxy
+#
+# ProfiledI2C stands in for a machine.I2C and counts transactions, bytes and
+# time per device address and per calling operation. Drivers need no
+# changes: the operation comes from tag_methods(), which wraps methods on a
+# driver instance, and otherwise falls back to the register being accessed.
+
+from utime import ticks_us, ticks_diff
+
+# Indices into a stats entry
+COUNT = 0
+BYTES = 1
+TIME_US = 2
+
+
+class ProfiledI2C(object):
+    """
+    Drop-in wrapper for an I2C bus. Anything not profiled is passed through.
+    """
+
+    def __init__(self, i2c, name):
+        self._i2c = i2c
+        self.name = name
+        self.op = None   # Set by tagged methods while they run
+        self.stats = {}  # (addr, op) -> [count, bytes, time_us]
+
+    def __getattr__(self, name):
+        return getattr(self._i2c, name)
+
+    def _record(self, addr, op, nbytes, start):
+        elapsed = ticks_diff(ticks_us(), start)
+        key = (addr, self.op or op)
+        entry = self.stats.get(key)
+        if entry is None:
+            entry = self.stats[key] = [0, 0, 0]
+        entry[COUNT] += 1
+        entry[BYTES] += nbytes
+        entry[TIME_US] += elapsed
+
+    def reset(self):
+        self.stats = {}
+
+    # Profiled transactions
+    def scan(self):
+        start = ticks_us()
+        devices = self._i2c.scan()
+        self._record(-1, "scan", 0, start)
+        return devices
+
+    def writeto(self, addr, buf, stop=True):
+        start = ticks_us()
+        result = self._i2c.writeto(addr, buf, stop)
+        self._record(addr, "write", len(buf), start)
+        return result
+
+    def writevto(self, addr, vector, stop=True):
+        start = ticks_us()
+        result = self._i2c.writevto(addr, vector, stop)
+        self._record(addr, "write", sum(len(buf) for buf in vector), start)
+        return result
+
+    def readfrom(self, addr, nbytes, stop=True):
+        start = ticks_us()
+        result = self._i2c.readfrom(addr, nbytes, stop)
+        self._record(addr, "read", nbytes, start)
+        return result
+
+    def readfrom_into(self, addr, buf, stop=True):
+        start = ticks_us()
+        self._i2c.readfrom_into(addr, buf, stop)
+        self._record(addr, "read", len(buf), start)
+
+    def writeto_mem(self, addr, memaddr, buf, addrsize=8):
+        start = ticks_us()
+        self._i2c.writeto_mem(addr, memaddr, buf, addrsize=addrsize)
+        self._record(addr, "write 0x%02x" % memaddr, 1 + len(buf), start)
+
+    def readfrom_mem(self, addr, memaddr, nbytes, addrsize=8):
+        start = ticks_us()
+        result = self._i2c.readfrom_mem(addr, memaddr, nbytes, addrsize=addrsize)
+        self._record(addr, "read 0x%02x" % memaddr, 1 + nbytes, start)
+        return result
+
+    def readfrom_mem_into(self, addr, memaddr, buf, addrsize=8):
+        start = ticks_us()
+        self._i2c.readfrom_mem_into(addr, memaddr, buf, addrsize=addrsize)
+        self._record(addr, "read 0x%02x" % memaddr, 1 + len(buf), start)
+
+    def report(self):
+        """
+        Print the counters, busiest first
+        """
+        rows = sorted(self.stats.items(), key=lambda item: -item[1][TIME_US])
+        total = [0, 0, 0]
+        print("I2C profile for %s" % self.name)
+        print("%-6s %-16s %8s %8s %10s %8s" % ("addr", "operation", "count", "bytes", "total us", "avg us"))
+        for (addr, op), entry in rows:
+            for i in range(3):
+                total[i] += entry[i]
+            print("%-6s %-16s %8d %8d %10d %8d" % (
+                "scan" if addr < 0 else "0x%02x" % addr, op, entry[COUNT], entry[BYTES],
+                entry[TIME_US], entry[TIME_US] // entry[COUNT]))
+        print("%-6s %-16s %8d %8d %10d" % ("", "total", total[COUNT], total[BYTES], total[TIME_US]))
+
+
+def tag_methods(bus, obj, names, prefix=""):
+    """
+    Wrap obj's methods so transactions they make on bus are attributed to
+    prefix + name. The outermost tagged call wins, so putstr is not split into
+    the putchar and move_to calls it makes.
+    """
+    for name in names:
+        method = getattr(obj, name)
+        setattr(obj, name, _tagged(bus, method, prefix + name))
+
+
+def _tagged(bus, method, op):
+    def wrapper(*args, **kwargs):
+        if bus.op is not None:
+            return method(*args, **kwargs)
+        bus.op = op
+        try:
+            return method(*args, **kwargs)
+        finally:
+            bus.op = None
+    return wrapper
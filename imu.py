@@ -71,7 +71,7 @@ class MPU6050(object):
     _mpu_addr = (104, 105)  # addresses of MPU9150/MPU6050. There can be two devices
     _chip_id = 104
 
-    def __init__(self, side_str, device_addr=None, transposition=(0, 1, 2), scaling=(1, 1, 1)):
+    def __init__(self, side_str, device_addr=None, transposition=(0, 1, 2), scaling=(1, 1, 1), settle_ms=200):
 
         self._accel = Vector3d(transposition, scaling, self._accel_callback)
         self._gyro = Vector3d(transposition, scaling, self._gyro_callback)
@@ -80,7 +80,8 @@ class MPU6050(object):
         self.buf3 = bytearray(3)
         self.buf6 = bytearray(6)
 
-        sleep_ms(200)  # Ensure PSU and device have settled
+        if settle_ms > 0:
+            sleep_ms(settle_ms)  # Ensure PSU and device have settled
         if isinstance(side_str, str):  # Non-pyb targets may use other than X or Y
             self._mpu_i2c = I2C(side_str)
         elif hasattr(side_str, "readfrom"):  # Soft or hard I2C instance. See issue #3097
@@ -299,6 +300,7 @@ class MPU6050(object):
                 self._write(ar_bytes[accel_range], 0x1C, self.mpu_addr)
             except OSError:
                 raise MPUException(self._I2Cerror)
+            self._accel_range = accel_range  # Saves three register reads per update
         else:
             raise ValueError("accel_range can only be 0, 1, 2 or 3")
 
@@ -333,9 +335,46 @@ class MPU6050(object):
                 )  # Sets fchoice = b11 which enables filter
             except OSError:
                 raise MPUException(self._I2Cerror)
+            self._gyro_range = gyro_range
         else:
             raise ValueError("gyro_range can only be 0, 1, 2 or 3")
 
+    # FIFO. Samples are taken at the sample_rate and queued on the chip, so
+    # a slow main loop can still see every sample by draining it in bursts.
+    @property
+    def fifo_count(self):
+        """
+        Number of bytes waiting in the FIFO. 1024 means it overflowed.
+        """
+        try:
+            self._read(self.buf2, 0x72, self.mpu_addr)
+        except OSError:
+            raise MPUException(self._I2Cerror)
+        return self.buf2[0] << 8 | self.buf2[1]
+
+    def fifo_start(self):
+        """
+        Empty the FIFO and stream accel and gyro samples into it. Each sample
+        is 12 bytes, big endian: accel x, y, z then gyro x, y, z.
+        """
+        try:
+            self._write(0x00, 0x23, self.mpu_addr)  # Stop filling
+            self._write(0x04, 0x6A, self.mpu_addr)  # FIFO_RESET
+            self._write(0x40, 0x6A, self.mpu_addr)  # FIFO_EN
+            self._write(0x78, 0x23, self.mpu_addr)  # Gyro x, y, z and accel
+        except OSError:
+            raise MPUException(self._I2Cerror)
+
+    def read_fifo_into(self, buf):
+        """
+        Read len(buf) bytes from the FIFO. Read whole samples only, or the
+        stream loses its alignment.
+        """
+        try:
+            self._read(buf, 0x74, self.mpu_addr)
+        except OSError:
+            raise MPUException(self._I2Cerror)
+
     # Accelerometer
     @property
     def accel(self):
@@ -355,10 +394,10 @@ class MPU6050(object):
         self._accel._ivector[0] = bytes_toint(self.buf6[0], self.buf6[1])
         self._accel._ivector[1] = bytes_toint(self.buf6[2], self.buf6[3])
         self._accel._ivector[2] = bytes_toint(self.buf6[4], self.buf6[5])
-        scale = (16384, 8192, 4096, 2048)
-        self._accel._vector[0] = self._accel._ivector[0] / scale[self.accel_range]
-        self._accel._vector[1] = self._accel._ivector[1] / scale[self.accel_range]
-        self._accel._vector[2] = self._accel._ivector[2] / scale[self.accel_range]
+        scale = (16384, 8192, 4096, 2048)[self._accel_range]
+        self._accel._vector[0] = self._accel._ivector[0] / scale
+        self._accel._vector[1] = self._accel._ivector[1] / scale
+        self._accel._vector[2] = self._accel._ivector[2] / scale
 
     def get_accel_irq(self):
         """
@@ -389,10 +428,10 @@ class MPU6050(object):
         self._gyro._ivector[0] = bytes_toint(self.buf6[0], self.buf6[1])
         self._gyro._ivector[1] = bytes_toint(self.buf6[2], self.buf6[3])
         self._gyro._ivector[2] = bytes_toint(self.buf6[4], self.buf6[5])
-        scale = (131, 65.5, 32.8, 16.4)
-        self._gyro._vector[0] = self._gyro._ivector[0] / scale[self.gyro_range]
-        self._gyro._vector[1] = self._gyro._ivector[1] / scale[self.gyro_range]
-        self._gyro._vector[2] = self._gyro._ivector[2] / scale[self.gyro_range]
+        scale = (131, 65.5, 32.8, 16.4)[self._gyro_range]
+        self._gyro._vector[0] = self._gyro._ivector[0] / scale
+        self._gyro._vector[1] = self._gyro._ivector[1] / scale
+        self._gyro._vector[2] = self._gyro._ivector[2] / scale
 
     def get_gyro_irq(self):
         """
@@ -127,12 +127,16 @@ class LcdApi:
         """
         self.cursor_x = cursor_x
         self.cursor_y = cursor_y
+        self.hal_write_command(self.LCD_DDRAM | self.ddram_address(cursor_x, cursor_y))
+
+    def ddram_address(self, cursor_x, cursor_y):
+        """Display memory address of the indicated cursor position."""
         addr = cursor_x & 0x3f
         if cursor_y & 1:
             addr += 0x40    # Lines 1 & 3 add 0x40
         if cursor_y & 2:    # Lines 2 & 3 add number of columns
             addr += self.num_columns
-        self.hal_write_command(self.LCD_DDRAM | addr)
+        return addr
 
     def putchar(self, char):
         """Writes the indicated character to the LCD at the current cursor
@@ -163,6 +167,34 @@ class LcdApi:
         for char in string:
             self.putchar(char)
 
+    def putbytes(self, buf, length=-1):
+        """Write the first length bytes of buf (all of it by default) like
+        putstr. Works from a preformatted bytes or bytearray, so nothing is
+        allocated per character.
+        """
+        if length < 0:
+            length = len(buf)
+        for i in range(length):
+            self.putcode(buf[i])
+
+    def putcode(self, code):
+        """Like putchar, but takes a character code instead of a string."""
+        if code == 0x0a:
+            if self.implied_newline:
+                self.implied_newline = False
+            else:
+                self.cursor_x = self.num_columns
+        else:
+            self.hal_write_data(code)
+            self.cursor_x += 1
+        if self.cursor_x >= self.num_columns:
+            self.cursor_x = 0
+            self.cursor_y += 1
+            self.implied_newline = (code != 0x0a)
+        if self.cursor_y >= self.num_lines:
+            self.cursor_y = 0
+        self.move_to(self.cursor_x, self.cursor_y)
+
     def custom_char(self, location, charmap):
         """Write a character to one of the 8 CGRAM locations, available
         as chr(0) through chr(7).
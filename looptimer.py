@@ -0,0 +1,78 @@
+# looptimer.py Per phase timing of the main loop
+#
+# Each lap() charges the time since the previous mark to one phase and
+# counts it into a fixed bucket histogram. Everything lives in arrays sized
+# up front, so timing a frame costs a few ticks_us calls and no allocation.
+
+from array import array
+from utime import ticks_us, ticks_diff
+
+# Bucket upper bounds in microseconds; the last bucket takes everything else
+BUCKETS_US = (50, 100, 200, 500, 1000, 2000, 5000, 10000, 20000, 50000,
+              100000, 200000, 500000, 1000000)
+N_BUCKETS = len(BUCKETS_US) + 1
+
+
+class LoopTimer(object):
+    """
+    Histograms of how long each named phase of the loop takes
+    """
+
+    def __init__(self, phases):
+        self.phases = phases
+        self.counts = array("L", [0] * (len(phases) * N_BUCKETS))
+        self.maxima = array("L", [0] * len(phases))
+        self._mark = ticks_us()
+
+    def start(self):
+        self._mark = ticks_us()
+
+    def lap(self, phase):
+        """
+        Charge the time since the last start() or lap() to phase
+        """
+        now = ticks_us()
+        elapsed = ticks_diff(now, self._mark)
+        self._mark = now
+        bucket = 0
+        for bound in BUCKETS_US:
+            if elapsed <= bound:
+                break
+            bucket += 1
+        self.counts[phase * N_BUCKETS + bucket] += 1
+        if elapsed > self.maxima[phase]:
+            self.maxima[phase] = elapsed
+
+    def reset(self):
+        for i in range(len(self.counts)):
+            self.counts[i] = 0
+        for i in range(len(self.maxima)):
+            self.maxima[i] = 0
+
+    def percentile(self, phase, fraction):
+        """
+        Upper bound of the bucket holding the given fraction of laps
+        """
+        base = phase * N_BUCKETS
+        total = 0
+        for i in range(N_BUCKETS):
+            total += self.counts[base + i]
+        if not total:
+            return 0
+        target = total * fraction
+        seen = 0
+        for i in range(N_BUCKETS):
+            seen += self.counts[base + i]
+            if seen >= target:
+                return BUCKETS_US[i] if i < len(BUCKETS_US) else self.maxima[phase]
+        return self.maxima[phase]
+
+    def report(self):
+        print("%-10s %8s %10s %10s %10s" % ("phase", "laps", "p50 us", "p95 us", "max us"))
+        for phase, name in enumerate(self.phases):
+            laps = 0
+            for i in range(N_BUCKETS):
+                laps += self.counts[phase * N_BUCKETS + i]
+            print("%-10s %8d %10s %10s %10d" % (
+                name, laps, "<=%d" % self.percentile(phase, 0.5),
+                "<=%d" % self.percentile(phase, 0.95), self.maxima[phase]))
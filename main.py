@@ -1,8 +1,24 @@
-from machine import I2C, Pin, ADC, PWM
+from machine import Pin, ADC, PWM, lightsleep
+from micropython import const
 from i2c_lcd import I2cLcd
 import time
+from array import array
 from imu import MPU6050
-import math
+from detectors import JoystickDetector, SliderDetector
+import gestures
+from orientation import Orientation
+from console import SerialConsole
+from i2c_profile import ProfiledI2C, tag_methods
+from i2c_arbiter import I2CArbiter
+from looptimer import LoopTimer
+from heapcheck import HeapCheck
+from eventlog import EventLog, LEVEL_DEBUG, LEVEL_INFO, LEVEL_WARN
+import recorder as rec
+from replay import Replay, ReplayPin, ReplayADC, ReplayMPU
+from telemetry import Telemetry
+from timerwheel import TimerWheel
+import stats as st
+from glyphs import GlyphManager, BIG_GLYPHS, ICONS, blank, put_text, put_big_number, put_icon
 import random
 import sounds
 
@@ -22,169 +38,749 @@ LCD_I2C_ADDR = 0x27
 LCD_I2C_NUM_ROWS = 2
 LCD_I2C_NUM_COLS = 16
 
-# Debounce settings (in seconds)
-DEBOUNCE_TIME = 0.5
-SHAKE_DEBOUNCE = 0.8  # Longer debounce for shake to ensure complete movement
-SLIDER_DEBOUNCE = 0.3
-JOYSTICK_DEBOUNCE = 0.4
+# Boot. FAST_BOOT skips the I2C scans and the one second pause, uses the
+# known device addresses and overlaps the LCD and IMU power-up waits. Turn
+# it off for the diagnostic boot, which reports every device it finds.
+FAST_BOOT = True
+IMU_DEVICE = 0         # MPU6050 with AD0 low, at 0x68 (1 for 0x69)
+LCD_POWERUP_MS = 20    # HD44780 needs 15 ms after power up
+IMU_SETTLE_MS = 200    # Supply and MPU6050 settling time
 
-# Debug mode
-DEBUG = False
+# Debounce settings (in milliseconds)
+DEBOUNCE_MS = 500
+SHAKE_DEBOUNCE_MS = 800  # Longer debounce for shake to ensure complete movement
+JOYSTICK_DEBOUNCE_MS = 150  # Baseline tracking rejects drift, so this can be short
+
+# Debug mode. Game events and sensor readings go to a ring buffer that is
+# printed while the loop sleeps, or by typing "log" on the serial console
+# ("log debug" adds per frame sensor readings). A const, so when it is off
+# every "if DEBUG:" block is left out of the bytecode.
+DEBUG = const(False)
+LOG_SIZE = 64          # Events held before the oldest are overwritten
+LOG_FLUSH_MS = 20      # Most of each loop sleep spent printing events
+
+# Count I2C traffic per device and operation; type "i2c" on the serial
+# console for a report
+PROFILE_I2C = False
+
+# A failed I2C transfer is tried again I2C_RETRIES times, waiting
+# I2C_BACKOFF_US and doubling each time. If it still fails the bus is cleared
+# by clocking SCL by hand and its device set up again, without a reboot. The
+# display's bus is held while the sensors are read, so their readings come
+# first. Type "bus" on the serial console for retries and recovery times.
+I2C_FREQ = 400000
+I2C_RETRIES = 3
+I2C_BACKOFF_US = 100
+
+# Measure heap allocation per loop; type "heap" on the serial console for a
+# report. Idle frames should allocate nothing, and with ALLOC_STRICT the
+# first one that does raises AssertionError.
+ALLOC_CHECK = False
+ALLOC_STRICT = False
+
+# Record every sensor reading, prompt and outcome to session000.bin,
+# session001.bin, ... on flash, for tuning and replaying offline. Type "rec"
+# on the serial console for the record count. Each IMU sample takes a 16
+# byte record, 3.2 KB/s at 200 Hz before the joystick, slider and frame
+# records, so 512 KB holds about 2.5 minutes of play.
+RECORD_SESSION = False
+RECORD_MAX_BYTES = 512 * 1024
+
+# Play a recorded session file back instead of reading the sensors, and
+# check the game makes the same prompts and outcomes. Type "replay" on the
+# serial console for the comparison so far.
+REPLAY_PATH = None
+
+# Stream raw IMU samples and timer sampled joystick, slider and touch
+# readings as binary frames over the USB serial port instead of text. Decode
+# on a computer with tools/decode_telemetry.py.
+TELEMETRY = False
+TELEMETRY_RATE = 200     # Hz, for the joystick, slider and touch sampling
+TELEMETRY_SLICE_MS = 50  # Longest sleep between sends while streaming
+
+# Between games the IMU sleeps and the Pico waits in machine.lightsleep
+# until the touch sensor's interrupt wakes it, instead of polling once a
+# second. Not while replaying or streaming telemetry, which need the loop
+# (and the USB port) running.
+IDLE_LIGHTSLEEP = True
+IDLE_WAKE_MS = 5000         # Longest lightsleep, so the console and log still get serviced
+IDLE_BACKLIGHT_OFF = False  # Also turn the LCD backlight off between games
+
+# Speed mode. Every correct answer cuts the time to answer to
+# SPEED_KEEP_PERCENT of what it was, and the time between unanswered prompts
+# with it, down to SPEED_MIN_MS. The game times each answer from when the input could
+# first have been read to when its feedback was on the display, and never
+# shortens a window below the worst of the last LATENCY_ROUNDS of those plus
+# LATENCY_MARGIN_MS. Type "speed" on the serial console for the numbers.
+SPEED_MODE = False
+ACTION_TIMEOUT_MS = 3000   # To complete the action, and the starting window in speed mode
+PROMPT_INTERVAL_MS = 5000  # From one unanswered prompt to the next
+SPEED_KEEP_PERCENT = 92    # Of the last window, so each is 8% shorter
+SPEED_MIN_MS = 600
+LATENCY_ROUNDS = 8
+LATENCY_MARGIN_MS = 100
+
+# Show the score in big digits and an icon beside each prompt, drawn with
+# the display's user defined characters
+BIG_FONT = True
+
+# Messages longer than a line are written once and scrolled along it with
+# the display's shift command, and show long enough to be read to the end
+MARQUEE = True
+MARQUEE_PAUSE_MS = 300  # Before the first step and after the last
+MARQUEE_STEP_MS = 80
+
+# Keep the high score, games played, answer counts and a reaction time
+# histogram per action in stats0.bin and stats1.bin on flash. Saved after
+# each game, and during a long one at most every STATS_SAVE_MINUTES. Type
+# "stats" on the serial console for them ("stats reset" zeroes them). Not
+# while replaying.
+STATS = True
+STATS_SAVE_MINUTES = 5
+STATS_BINS = 16
+STATS_BIN_MS = 200
 
 # Prototype mode (when shake doesn't really work, don't prompt for it)
 PROTOTYPE_MODE = False
 
+# IMU settings
+IMU_FILTER_RANGE = 3   # 41 Hz low pass, 1 kHz internal sample rate
+IMU_RATE_DIVIDER = 4   # 1 kHz / (1 + 4) = 200 Hz into the FIFO
+IMU_FIFO_SIZE = 1024   # A full FIFO has overflowed and lost samples
+
+# Orientation settings (degrees, degrees per second)
+TWIST_RATE_ON = 180    # Yaw rate that counts as a twist
+TWIST_RATE_OFF = 60    # Yaw rate below which the twist has ended
+TILT_ANGLE_ON = 45     # Pitch or roll that counts as a tilt
+TILT_ANGLE_OFF = 25    # Pitch and roll below which the box is level again
+
+# Main loop phases, timed by loop_timer; type "timings" on the serial console
+# for p50/p95/max per phase
+PHASE_CONSOLE = 0
+PHASE_TIMERS = 1
+PHASE_IMU = 2
+PHASE_SHAKE = 3
+PHASE_TWIST = 4
+PHASE_TILT = 5
+PHASE_TOUCH = 6
+PHASE_JOYSTICK = 7
+PHASE_SLIDER = 8
+PHASE_HANDLERS = 9
+PHASE_DISPLAY = 10  # Held display writes, answer feedback and stats saves
+PHASE_SLEEP = 11
+PHASE_NAMES = ("console", "timers", "imu", "shake", "twist", "tilt", "touch",
+               "joystick", "slider", "handlers", "display", "sleep")
+
+# Event log codes, see define_events()
+EV_START = const(0)
+EV_PROMPT = const(1)
+EV_DETECTED = const(2)
+EV_TOO_SLOW = const(3)
+EV_CORRECT = const(4)
+EV_WRONG = const(5)
+EV_GAME_OVER = const(6)
+EV_IMU_OVERFLOW = const(7)
+EV_IMU_WINDOW = const(8)
+EV_YAW = const(9)
+EV_ANGLES = const(10)
+EV_JOYSTICK = const(11)
+EV_SLIDER = const(12)
+EV_STATE = const(13)
+EV_LATENCY = const(14)
+EV_SPEED_LIMIT = const(15)
+EV_HIGH_SCORE = const(16)
+
+# Inputs, which are also the actions the game prompts for, numbered as the
+# rows of ACTIONS. The numbers are what the event log, session recordings
+# and statistics store.
+INPUT_TOUCH = const(0)
+INPUT_FLICK = const(1)
+INPUT_SHAKE = const(2)
+INPUT_SLIDE = const(3)
+INPUT_TWIST = const(4)
+INPUT_TILT = const(5)
+
+# One row per action: its name, prompt, the song that announces it, the
+# InputManager check that detects it and the loop phase the check is timed
+# as. The checks run in this order every frame. A new action needs a row
+# here, an INPUT_ constant, an icon in glyphs.ICONS and its check.
+ACTIONS = (
+    ("touch", b"BEEP IT!", sounds.INSTRUCTION_TONES["BEEP IT!"], "is_touched", PHASE_TOUCH),
+    ("flick", b"FLICK IT!", sounds.INSTRUCTION_TONES["FLICK IT!"], "is_joystick_moved", PHASE_JOYSTICK),
+    ("shake", b"SHAKE IT!", sounds.INSTRUCTION_TONES["SHAKE IT!"], "is_shaking", PHASE_SHAKE),
+    ("slide", b"SLIDE IT!", sounds.INSTRUCTION_TONES["SLIDE IT!"], "is_slider_moved", PHASE_SLIDER),
+    ("twist", b"TWIST IT!", sounds.INSTRUCTION_TONES["TWIST IT!"], "is_twisted", PHASE_TWIST),
+    ("tilt", b"TILT IT!", sounds.INSTRUCTION_TONES["TILT IT!"], "is_tilted", PHASE_TILT),
+)
+# The columns, for lookups by action
+INPUT_NAMES = tuple(row[0] for row in ACTIONS)
+ACTION_TEXT = tuple(row[1] for row in ACTIONS)
+ACTION_SONGS = tuple(row[2] for row in ACTIONS)
+ACTION_PHASES = tuple(row[4] for row in ACTIONS)
+# What can be prompted for (when shake doesn't really work, not that)
+ENABLED_ACTIONS = tuple(action for action in range(len(ACTIONS))
+                        if not (PROTOTYPE_MODE and action == INPUT_SHAKE))
+
+# Game states
+ST_IDLE = const(0)       # Waiting for a touch to start a game
+ST_PROMPTING = const(1)  # Announcing the next action
+ST_AWAITING = const(2)   # Waiting for the player to do it
+ST_FEEDBACK = const(3)   # Showing how the answer went
+ST_GAME_OVER = const(4)  # Showing the final score
+STATE_NAMES = ("idle", "prompting", "awaiting", "feedback", "game over")
+
+# Every deadline is one of these timers in the timers wheel
+TIMER_ACTION = const(0)    # Time left to answer the prompt
+TIMER_PROMPT = const(1)    # An unanswered prompt is replaced
+TIMER_FEEDBACK = const(2)  # How long a result or the final score shows
+TIMER_TOUCH = const(3)     # Debounce windows
+TIMER_SHAKE = const(4)
+TIMER_JOYSTICK = const(5)
+TIMER_MARQUEE = const(6)   # Next step of a scrolling message
+TIMER_COUNT = const(7)
+
+START_MS = 1000      # After the 1.2 s start song, before the first prompt
+FEEDBACK_MS = 500    # Result of an answer
+GAME_OVER_MS = 1000  # Final score before a touch can start another game
+MAX_MISTAKES = 3
+FRAME_MS = 100       # Longest sleep between passes of the game loop
+
 # Slider settings
 SLIDER_THRESHOLD = 1000  # Minimum change to detect movement
 
-class GameAction:
-    TOUCH = "BEEP IT!"
-    FLICK = "FLICK IT!"
-    SHAKE = "SHAKE IT!"
-    SLIDE = "SLIDE IT!"
+class NumberMessage(object):
+    """
+    Fixed text followed by a number, formatted in place in a preallocated
+    buffer so showing it allocates nothing. Show buf[:length] with
+    show().
+    """
+
+    def __init__(self, text, digits=5):
+        self.buf = bytearray(text.encode() + bytes(digits))
+        self.start = len(text)
+        self.length = self.start
+
+    def set(self, value):
+        digits = 1
+        rest = value
+        while rest >= 10 and self.start + digits < len(self.buf):
+            rest //= 10
+            digits += 1
+        i = self.length = self.start + digits
+        while i > self.start:
+            i -= 1
+            self.buf[i] = 0x30 + value % 10
+            value //= 10
+        return self
+
+
+# Everything the LCD shows during a game, encoded once at import
+WRONG_TEXT = tuple(("Wrong action: %s! Try again!" % name).encode() for name in INPUT_NAMES)
+TOO_SLOW_TEXT = b"Too slow!"
+STARTING_TEXT = b"STARTING GAME"
+START_TEXT = b"BEEP TO START"
+RESTART_TEXT = b"Beep to start"
+CORRECT_TEXT = b"Correct!"
+SCORE_TEXT = b"Score"
+SCREEN = bytearray(LCD_I2C_NUM_ROWS * LCD_I2C_NUM_COLS)  # Screens drawn with glyphs
+
 
-    @classmethod
-    def get_random_action(cls):
-        actions = [cls.TOUCH, cls.FLICK, cls.SHAKE, cls.SLIDE]
-        if PROTOTYPE_MODE:
-            actions.remove(cls.SHAKE)
-        return random.choice(actions)
+def _action_screen(text):
+    screen = bytearray(len(SCREEN))
+    blank(screen)
+    put_text(screen, LCD_I2C_NUM_COLS, 0, text)
+    return screen
+
+
+# Each prompt's screen without its icon, whose glyph code is only known once
+# it is loaded
+ACTION_SCREENS = tuple(_action_screen(text) for text in ACTION_TEXT)
+# Kept encoded by the display driver, so they go out in one I2C write
+PINNED_TEXT = ACTION_TEXT + WRONG_TEXT + (TOO_SLOW_TEXT, STARTING_TEXT, START_TEXT)
+CORRECT_MESSAGE = NumberMessage("Correct! Score: ")
+FINAL_MESSAGE = NumberMessage("Final score: ")
 
 class GameState:
+    """The game as a state machine. Every deadline is a timer in the timers
+    wheel: tick() acts on the ones that have expired, so a prompt times out
+    on time whether or not anything is pressed, and on_input() acts on the
+    inputs the InputManager detects. What each timer and input does in each
+    state is looked up in a table."""
+
     def __init__(self):
+        self.state = ST_IDLE
         self.is_game_on = False
         self.score = 0
         self.mistakes = 0
-        self.last_action_time = 0
-        self.current_action = None
-        self.action_timeout = 3.0  # seconds to complete the action
-        self.last_prompt_time = 0
-        self.prompt_interval = 5.0  # seconds between prompts
+        self.current_action = -1  # One of the INPUT_ constants once prompted
+        self.action_timeout_ms = ACTION_TIMEOUT_MS
+        self.prompt_interval_ms = PROMPT_INTERVAL_MS
+        # Input to feedback latency of the last LATENCY_ROUNDS answers
+        self.latencies = array("H", [0] * LATENCY_ROUNDS)
+        self.latency_index = 0
+        self.latency_ms = 0
+        self.speed_limits = 0  # Windows held up by the latency floor
+        self.speed_limited = False  # Held up by the floor this game
+        now = time.ticks_ms()
+        self._frame = now    # When this frame started reading inputs
+        self._sampled = now  # When the frame before it did
+        self._opened = now   # When the current prompt's window opened
+        self._answered = False  # Feedback not yet timed by feedback_shown()
+        self._answer_correct = False
+        self.after_feedback = ST_PROMPTING  # Where FEEDBACK goes when TIMER_FEEDBACK expires
         self.input_manager = None  # Will be set when game starts
+        n = None
+        # Indexed by state * TIMER_COUNT + timer. The debounce timers only
+        # gate the InputManager's checks, so none of them do anything here.
+        # Messages only scroll while they are feedback.
+        self._on_timer = (
+            # ACTION         PROMPT        FEEDBACK              TOUCH SHAKE JOYSTICK MARQUEE
+            n,               n,            n,                    n,    n,    n,       n,  # IDLE
+            n,               n,            n,                    n,    n,    n,       n,  # PROMPTING
+            self._too_slow,  self._prompt, n,                    n,    n,    n,       n,  # AWAITING
+            n,               self._prompt, self._feedback_done,  n,    n,    n,       self._scroll,  # FEEDBACK
+            n,               n,            self._game_over_done, n,    n,    n,       n,  # GAME_OVER
+        )
+        # Indexed by state. Inputs while feedback shows are ignored.
+        self._on_input = (self._start, n, self._answer, n, n)
+
+    def _enter(self, state):
+        self.state = state
+        if DEBUG:
+            events.log(EV_STATE, state)
+
+    def tick(self):
+        """Act on every timer that has expired. Returns True if any did.
+        Called at the start of every frame."""
+        self._sampled = self._frame
+        self._frame = time.ticks_ms()
+        if not timers.advance():
+            return False
+        while True:
+            timer = timers.expired()
+            if timer < 0:
+                return True
+            handler = self._on_timer[self.state * TIMER_COUNT + timer]
+            if handler:
+                handler()
+
+    def on_input(self, action):
+        """action is one of the INPUT_ constants"""
+        handler = self._on_input[self.state]
+        if handler:
+            handler(action)
+
+    def _start(self, action):
+        if action != INPUT_TOUCH:
+            return
+        if self.input_manager:
+            self.input_manager.lcd_display.show(STARTING_TEXT)
+            sounds.playsong(self.input_manager.buzzer, "GAME_START")
+        self.start_game()
 
     def start_game(self):
         self.is_game_on = True
         self.score = 0
         self.mistakes = 0
-        self.last_action_time = time.time()
-        self.current_action = None
-        print("\nWelcome to Beep It!")
-        print("Follow the prompts!")
-        self.generate_new_action()
+        self.current_action = -1
+        self.action_timeout_ms = ACTION_TIMEOUT_MS
+        self.prompt_interval_ms = PROMPT_INTERVAL_MS
+        self.speed_limited = False
+        if DEBUG:
+            events.log(EV_START)
+        self._outcome(rec.OUTCOME_START)
+        self._show_feedback(START_MS, ST_PROMPTING)
+
+    def _outcome(self, outcome, action=0):
+        """Pass an outcome to the session recorder and the replay check"""
+        if recorder:
+            recorder.outcome(outcome, action, self.score, self.mistakes)
+        if replay:
+            replay.check_outcome(outcome, action, self.score, self.mistakes)
 
     def stop_game(self):
         self.is_game_on = False
+        timers.cancel(TIMER_ACTION)
+        timers.cancel(TIMER_PROMPT)
+        self._enter(ST_GAME_OVER)
         if self.input_manager:
-          self.input_manager.lcd_display.clear()
-          self.input_manager.lcd_display.putstr(f"Final score: {self.score}")
-          self.input_manager.lcd_display.move_to(0, 1)
-          self.input_manager.lcd_display.putstr("Beep to start")
-        print(f"\nGame ended! Final score: {self.score}")
+            message = FINAL_MESSAGE.set(self.score)
+            self.input_manager.lcd_display.show(message.buf, message.length)
+        if DEBUG:
+            events.log(EV_GAME_OVER, self.score)
+        self._outcome(rec.OUTCOME_GAME_OVER)
+        # A new high score is kept for the stats command, not printed here
+        # in the middle of a frame
+        if stats and stats.game_over(self.score) and DEBUG:
+            events.log(EV_HIGH_SCORE, self.score)
+        if recorder:
+            recorder.flush()
+        timers.start(TIMER_FEEDBACK, GAME_OVER_MS)
+
+    def _game_over_done(self):
+        # Only now invite the next game, so a touch still going from the
+        # last one can't start it by accident
+        if self.input_manager:
+            self.input_manager.lcd_display.show_line(1, RESTART_TEXT)
+        self._enter(ST_IDLE)
+
+    def _prompt(self):
+        self.generate_new_action()
 
     def generate_new_action(self):
-        self.current_action = GameAction.get_random_action()
-        self.last_action_time = time.time()
-        print(f"\n{self.current_action}")
-        self.last_prompt_time = time.time()
-        # Reset debounce timers when generating a new action
+        self._enter(ST_PROMPTING)
+        action = self.current_action = random.choice(ENABLED_ACTIONS)
+        if DEBUG:
+            events.log(EV_PROMPT, action)
+        if recorder:
+            recorder.prompt(action, self.score)
+        if replay:
+            replay.check_prompt(action)
         if self.input_manager:
-            sounds.playsong(self.input_manager.buzzer, self.current_action)
-            self.input_manager.lcd_display.clear()
-            self.input_manager.lcd_display.putstr(self.current_action)
+            sounds.play(self.input_manager.buzzer, ACTION_SONGS[action])
+            self._display_prompt()
+            # Reset debounce timers when generating a new action
             self.input_manager.reset_debounce_timers()
+        self._await()
 
+    def _display_prompt(self):
+        self.input_manager.lcd_display.show(self.input_manager.prompts[self.current_action])
 
-    def check_action(self, action_type):
-        if not self.current_action:
-            return False
+    def _display_long(self, text, length=-1):
+        """Show a message, scrolling it if it is longer than a line.
+        Returns how long it needs to be shown for."""
+        lcd = self.input_manager.lcd_display
+        if not MARQUEE or (len(text) if length < 0 else length) <= LCD_I2C_NUM_COLS:
+            lcd.show(text, length)
+            return FEEDBACK_MS
+        steps = lcd.marquee(text, length)
+        timers.start(TIMER_MARQUEE, MARQUEE_PAUSE_MS)
+        return max(FEEDBACK_MS, 2 * MARQUEE_PAUSE_MS + steps * MARQUEE_STEP_MS)
+
+    def _scroll(self):
+        if self.input_manager.lcd_display.scroll():
+            timers.start(TIMER_MARQUEE, MARQUEE_STEP_MS)
 
-        current_time = time.time()
-        if current_time - self.last_action_time > self.action_timeout:
-            print("Too slow! Try again!")
+    def _display_score(self):
+        """Returns how long the score needs to be shown for"""
+        lcd = self.input_manager.lcd_display
+        if BIG_FONT:
+            glyphs = self.input_manager.glyphs
+            glyphs.begin()
+            blank(SCREEN)
+            put_text(SCREEN, LCD_I2C_NUM_COLS, 0, CORRECT_TEXT)
+            put_text(SCREEN, LCD_I2C_NUM_COLS, 1, SCORE_TEXT)
+            # Scores too long to fit beside the text fall back to the plain
+            # message
+            if put_big_number(glyphs, SCREEN, LCD_I2C_NUM_COLS, self.score,
+                              len(CORRECT_TEXT) + 1, LCD_I2C_NUM_COLS):
+                lcd.show(SCREEN)
+                return FEEDBACK_MS
+        message = CORRECT_MESSAGE.set(self.score)
+        return self._display_long(message.buf, message.length)
+
+    def _await(self):
+        """Start the clock on the current prompt, once it has been announced"""
+        timers.start(TIMER_ACTION, self.action_timeout_ms)
+        timers.start(TIMER_PROMPT, self.prompt_interval_ms)
+        self._opened = time.ticks_ms()
+        self._enter(ST_AWAITING)
+
+    def _show_feedback(self, ms, after):
+        timers.cancel(TIMER_ACTION)
+        timers.cancel(TIMER_PROMPT)
+        timers.start(TIMER_FEEDBACK, ms)
+        self.after_feedback = after
+        self._enter(ST_FEEDBACK)
+
+    def _feedback_done(self):
+        if self.after_feedback == ST_PROMPTING:
             self.generate_new_action()
-            return False
+        elif self.mistakes >= MAX_MISTAKES:
+            self.stop_game()
+        else:
+            # Back to the same prompt, with a fresh time limit
+            if self.input_manager:
+                self._display_prompt()
+                sounds.playsong(self.input_manager.buzzer, "FAILURE")
+                self.input_manager.reset_debounce_timers()
+            self._await()
 
-        return action_type == self.current_action
+    def _too_slow(self):
+        # TIMER_PROMPT is still running and brings the next prompt
+        if DEBUG:
+            events.log(EV_TOO_SLOW)
+        self._outcome(rec.OUTCOME_TOO_SLOW, self.current_action)
+        if stats:
+            stats.count(st.STAT_TOO_SLOW)
+        timers.cancel(TIMER_ACTION)
+        if self.input_manager:
+            self.input_manager.lcd_display.show(TOO_SLOW_TEXT)
+        self._enter(ST_FEEDBACK)
+
+    def _answer(self, action):
+        correct = action == self.current_action
+        if correct:
+            self.handle_correct_action()
+        else:
+            self.handle_wrong_action(action)
+        # The feedback is held until the frame has read the sensors
+        self._answered = True
+        self._answer_correct = correct
+
+    def feedback_shown(self):
+        """Called once the frame's display writes have been sent: time the
+        answer's feedback and, in speed mode, shorten the window"""
+        if not self._answered:
+            return
+        self._answered = False
+        self._measure_latency()
+        if SPEED_MODE and self._answer_correct:
+            self._speed_up()
+
+    def _measure_latency(self):
+        """Time from the earliest the answer could have happened unseen, just
+        after the previous frame read the inputs or when the window opened,
+        to its feedback being on the display"""
+        since = self._sampled
+        if time.ticks_diff(self._opened, since) > 0:
+            since = self._opened
+        latency = min(time.ticks_diff(time.ticks_ms(), since), 0xFFFF)
+        self.latency_ms = latency
+        self.latencies[self.latency_index] = latency
+        self.latency_index = (self.latency_index + 1) % LATENCY_ROUNDS
+        if DEBUG:
+            events.log(EV_LATENCY, latency)
+
+    def latency_floor(self):
+        """The shortest window the pipeline can reliably answer within"""
+        return max(self.latencies) + LATENCY_MARGIN_MS
+
+    def _speed_up(self):
+        window = self.action_timeout_ms * SPEED_KEEP_PERCENT // 100
+        if window < SPEED_MIN_MS:
+            window = SPEED_MIN_MS
+        floor = self.latency_floor()
+        if window < floor:
+            # Also lengthens the window again if the latency has grown
+            window = floor
+            self.speed_limits += 1
+            # Only counted here, this runs in the middle of a frame: printing
+            # is left to report_speed()
+            if not self.speed_limited:
+                self.speed_limited = True
+                if DEBUG:
+                    events.log(EV_SPEED_LIMIT, floor, floor - LATENCY_MARGIN_MS)
+        self.action_timeout_ms = window
+        self.prompt_interval_ms = window * PROMPT_INTERVAL_MS // ACTION_TIMEOUT_MS
+
+    def report_speed(self):
+        print("window %d ms, prompts every %d ms" % (self.action_timeout_ms, self.prompt_interval_ms))
+        print("latency last %d ms, worst of last %d %d ms, floor %d ms" % (
+            self.latency_ms, LATENCY_ROUNDS, max(self.latencies), self.latency_floor()))
+        print("windows held up by the floor: %d%s" % (self.speed_limits,
+                                                      ", this game too" if self.speed_limited else ""))
 
     def handle_correct_action(self):
         self.score += 1
-        print(f"Correct! Score: {self.score}")
+        if DEBUG:
+            events.log(EV_CORRECT, self.score)
+        self._outcome(rec.OUTCOME_CORRECT, self.current_action)
+        if stats:
+            # From the prompt's window opening to the frame that saw the answer
+            stats.correct(self.current_action, time.ticks_diff(self._frame, self._opened))
+        feedback_ms = FEEDBACK_MS
         if self.input_manager:
-            self.input_manager.lcd_display.clear()
-            self.input_manager.lcd_display.putstr(f"Correct! Score: {self.score}")
-            time.sleep(0.5)
-
-        self.generate_new_action()
+            feedback_ms = self._display_score()
+        self._show_feedback(feedback_ms, ST_PROMPTING)
 
     def handle_wrong_action(self, action):
         self.mistakes += 1
-        print(f"Wrong action: {action}! Try again!")
+        if DEBUG:
+            events.log(EV_WRONG, action, self.mistakes)
+        self._outcome(rec.OUTCOME_WRONG, action)
+        if stats:
+            stats.count(st.STAT_WRONG)
+        feedback_ms = FEEDBACK_MS
         if self.input_manager:
-            self.input_manager.lcd_display.clear()
-            self.input_manager.lcd_display.putstr(f"Wrong action: {action}! Try again!")
-            time.sleep(0.5)
-            self.input_manager.lcd_display.clear()
-            self.input_manager.lcd_display.putstr(self.current_action)
-            sounds.playsong(self.input_manager.buzzer, "FAILURE")
+            feedback_ms = self._display_long(WRONG_TEXT[action])
+        self._show_feedback(feedback_ms, ST_AWAITING)
+
 class InputManager:
-    def __init__(self):
+    def __init__(self, started):
+        """started is the ticks_ms() boot began at, which the power-up
+        waits are counted from"""
         # Touch Sensor Setup
-        self.touch_sensor = Pin(TOUCH_PIN, Pin.IN)
-        self.last_touch_time = 0
+        self.touch_sensor = ReplayPin(replay) if replay else Pin(TOUCH_PIN, Pin.IN)
+        self.touch_pin = None if replay else self.touch_sensor  # For the wake interrupt
+        # Bound once: each self._touch_irq would allocate, in idle frames
+        self._touch_handler = self._touch_irq
+        if recorder:
+            self.touch_sensor = rec.RecordedPin(self.touch_sensor, recorder)
         self.last_touch_state = False
+        self.low_power = False
+        self.touch_woke = False
+
+        # Serial console commands
+        self.console = SerialConsole()
+
+        # LCD Setup. First, so its power-up wait and initialisation count
+        # towards the IMU's settling time.
+        self.display_bus = I2CArbiter(0, LCD_SCL_PIN, LCD_SDA_PIN, I2C_FREQ, "I2C0", I2C_RETRIES, I2C_BACKOFF_US)
+        self.i2c0_sensor = self.display_bus
+        if PROFILE_I2C:
+            self.i2c0_sensor = ProfiledI2C(self.i2c0_sensor, "I2C0")
+        if FAST_BOOT:
+            self.lcd_display = I2cLcd(self.i2c0_sensor, LCD_I2C_ADDR, LCD_I2C_NUM_ROWS, LCD_I2C_NUM_COLS,
+                                      powerup_ms=LCD_POWERUP_MS - time.ticks_diff(time.ticks_ms(), started))
+        else:
+            self.lcd_display = I2cLcd(self.i2c0_sensor, LCD_I2C_ADDR, LCD_I2C_NUM_ROWS, LCD_I2C_NUM_COLS)
+        for text in PINNED_TEXT:
+            self.lcd_display.pin(text, MARQUEE and len(text) > LCD_I2C_NUM_COLS)
+        self.glyphs = GlyphManager(self.lcd_display)
+        if BIG_FONT:
+            # The digit and icon glyphs fit in CGRAM together, so load them
+            # all for good now. With the icons' codes fixed, each prompt's
+            # whole screen can be encoded once too.
+            self.glyphs.begin()
+            for glyph in BIG_GLYPHS:
+                self.glyphs.load(glyph, True)
+            prompts = []
+            for action in range(len(ACTIONS)):
+                screen = bytearray(ACTION_SCREENS[action])
+                put_icon(self.glyphs, screen, LCD_I2C_NUM_COLS, ICONS[action], LCD_I2C_NUM_COLS - 1)
+                prompts.append(bytes(screen))
+                self.lcd_display.pin(prompts[action])
+            self.prompts = tuple(prompts)
+        else:
+            self.prompts = ACTION_TEXT
+        self.display_bus.add_device(LCD_I2C_ADDR, self.lcd_display.reinit)
 
         # IMU Setup
-        self.i2c1_sensor = I2C(1, sda=Pin(MPU_SDA_PIN), scl=Pin(MPU_SCL_PIN), freq=400000)
-        self.mpu_sensor = MPU6050(self.i2c1_sensor)
-        self.last_shake_time = 0
+        self.imu_bus = I2CArbiter(1, MPU_SCL_PIN, MPU_SDA_PIN, I2C_FREQ, "I2C1", I2C_RETRIES, I2C_BACKOFF_US)
+        self.i2c1_sensor = self.imu_bus
+        if PROFILE_I2C:
+            self.i2c1_sensor = ProfiledI2C(self.i2c1_sensor, "I2C1")
+        if replay:
+            self.mpu_sensor = ReplayMPU(replay)
+        elif FAST_BOOT:
+            self.mpu_sensor = MPU6050(self.i2c1_sensor, device_addr=IMU_DEVICE,
+                                      settle_ms=IMU_SETTLE_MS - time.ticks_diff(time.ticks_ms(), started))
+        else:
+            # Scans the bus for the IMU
+            self.mpu_sensor = MPU6050(self.i2c1_sensor)
+        self.mpu_sensor.filter_range = IMU_FILTER_RANGE
+        self.mpu_sensor.sample_rate = IMU_RATE_DIVIDER
+        self.mpu_sensor.fifo_start()
+        self.imu_buffer = bytearray(gestures.SAMPLE_BYTES * 16)
+        # Views of the first n samples, so short reads don't allocate
+        self.imu_views = tuple(memoryview(self.imu_buffer)[:n * gestures.SAMPLE_BYTES] for n in range(17))
+        self.gestures = gestures.GestureClassifier()
+        self.imu_label = -1
+        self.orientation = Orientation()
         self.shake_detected = False
-
-        # LCD Setup
-        self.i2c0_sensor = I2C(0, sda=Pin(LCD_SDA_PIN), scl=Pin(LCD_SCL_PIN), freq=400000)
-        self.lcd_display = I2cLcd(self.i2c0_sensor, LCD_I2C_ADDR, LCD_I2C_NUM_ROWS, LCD_I2C_NUM_COLS)
+        self.twist_detected = False
+        self.tilt_detected = False
+        if not replay:
+            self.imu_bus.add_device(self.mpu_sensor.mpu_addr, self.reset_imu)
+        if PROFILE_I2C:
+            self.profile_i2c()
+        self.console.add("bus", self.report_buses)
 
         # Buzzer Setup
         self.buzzer = PWM(Pin(BUZZER_PIN))
 
         # Joystick Setup
-        self.vrx = ADC(Pin(JOYSTICK_X_PIN))
-        self.vry = ADC(Pin(JOYSTICK_Y_PIN))
+        if replay:
+            self.vrx = ReplayADC(replay, rec.ADC_JOYSTICK_X)
+            self.vry = ReplayADC(replay, rec.ADC_JOYSTICK_Y)
+        else:
+            self.vrx = ADC(Pin(JOYSTICK_X_PIN))
+            self.vry = ADC(Pin(JOYSTICK_Y_PIN))
+        joystick_adcs = (self.vrx, self.vry)
+        if recorder:
+            self.vrx = rec.RecordedADC(self.vrx, recorder, rec.ADC_JOYSTICK_X)
+            self.vry = rec.RecordedADC(self.vry, recorder, rec.ADC_JOYSTICK_Y)
         self.joystick_x_position = self.vrx.read_u16()
         self.joystick_y_position = self.vry.read_u16()
-        self.last_joystick_time = 0
-        self.joystick_detected = False
+        self.joystick_x_reading = self.joystick_x_position
+        self.joystick_y_reading = self.joystick_y_position
+        self.joystick = JoystickDetector(self.joystick_x_position, self.joystick_y_position)
 
         # Slider Setup
-        self.slider_sensor = ADC(Pin(SLIDING_POTENTIOMETER_PIN))
-        self.slider_value = self.slider_sensor.read_u16()
-        self.last_slider_time = 0
-        self.slider_detected = False
+        self.slider_sensor = ReplayADC(replay, rec.ADC_SLIDER) if replay else ADC(Pin(SLIDING_POTENTIOMETER_PIN))
+        # The sensors themselves, for telemetry's sampling timer. Reads
+        # through the recorder would land in the session between frames,
+        # and replay expects the same reads every frame. None when replaying.
+        self.raw_inputs = None if replay else joystick_adcs + (self.slider_sensor, self.touch_pin)
+        if recorder:
+            self.slider_sensor = rec.RecordedADC(self.slider_sensor, recorder, rec.ADC_SLIDER)
+        self.slider_value = self.slider_reading = self.slider_sensor.read_u16()
+        self.slider = SliderDetector(self.slider_value, time.ticks_ms(), SLIDER_THRESHOLD)
+
+        # Each action's check, bound once so calling them allocates nothing
+        self.checks = tuple(getattr(self, row[3]) for row in ACTIONS)
         if DEBUG:
             print(f"Initial slider value: {self.slider_value}")
 
+    def profile_i2c(self):
+        """Attribute I2C traffic to the driver calls that cause it and add the
+        "i2c" console command ("i2c reset" clears the counters)."""
+        if not replay:
+            tag_methods(self.i2c1_sensor, self.mpu_sensor, ("read_fifo_into", "fifo_start", "wake", "sleep"))
+            tag_methods(self.i2c1_sensor, self.mpu_sensor.accel, ("update",), "accel.")
+            tag_methods(self.i2c1_sensor, self.mpu_sensor.gyro, ("update",), "gyro.")
+        tag_methods(self.i2c0_sensor, self.lcd_display,
+                    ("putstr", "putchar", "clear", "move_to", "custom_char", "backlight_on", "backlight_off",
+                     "show", "show_line", "marquee", "scroll", "stop_marquee", "reinit"))
+
+        def report(args):
+            for bus in (self.i2c1_sensor, self.i2c0_sensor):
+                if args == "reset":
+                    bus.reset()
+                else:
+                    bus.report()
+
+        self.console.add("i2c", report)
+
+    def report_buses(self, args):
+        self.imu_bus.report()
+        self.display_bus.report()
+
+    def reset_imu(self):
+        """Set the IMU up again after its bus was recovered. A FIFO read cut
+        short leaves the samples out of step, so the FIFO starts empty."""
+        self.mpu_sensor.wake()
+        self.mpu_sensor.passthrough = True
+        self.mpu_sensor.accel_range = 0
+        self.mpu_sensor.gyro_range = 0
+        self.mpu_sensor.filter_range = IMU_FILTER_RANGE
+        self.mpu_sensor.sample_rate = IMU_RATE_DIVIDER
+        self.mpu_sensor.fifo_start()
+        if self.low_power:
+            self.mpu_sensor.sleep()
+        self.gestures.restart()
+        self.orientation.reset()
+
     def reset_debounce_timers(self):
-        """Reset all debounce timers to allow immediate input detection"""
-        current_time = time.time()
-        self.last_touch_time = current_time
-        self.last_shake_time = current_time
-        self.last_joystick_time = current_time
-        self.last_slider_time = current_time
+        """Restart all debounce windows, so input carried over from before a
+        prompt isn't taken as the answer"""
+        timers.start(TIMER_TOUCH, DEBOUNCE_MS)
+        timers.start(TIMER_SHAKE, SHAKE_DEBOUNCE_MS)
+        timers.start(TIMER_JOYSTICK, JOYSTICK_DEBOUNCE_MS)
         self.shake_detected = False
-        self.joystick_detected = False
-        self.slider_detected = False
-        # Update all sensor values to prevent false triggers
-        self.slider_value = self.slider_sensor.read_u16()
+        # Update all sensor values to prevent false triggers. The slider
+        # state machine keeps its own rest position, so it is left alone.
         self.joystick_x_position = self.vrx.read_u16()
         self.joystick_y_position = self.vry.read_u16()
         self.last_touch_state = False
 
     def is_touched(self):
-        current_time = time.time()
         current_state = self.touch_sensor.value()
 
         # Only trigger on rising edge (touch start) and after debounce
-        if current_state and not self.last_touch_state and (current_time - self.last_touch_time) > DEBOUNCE_TIME:
-            self.last_touch_time = current_time
+        if current_state and not self.last_touch_state and not timers.pending(TIMER_TOUCH):
+            timers.start(TIMER_TOUCH, DEBOUNCE_MS)
             self.last_touch_state = current_state
             return True
         elif not current_state:
@@ -192,155 +788,413 @@ class InputManager:
 
         return False
 
-    def is_shaking(self, threshold=2.0):
-        current_time = time.time()
-        if current_time - self.last_shake_time < SHAKE_DEBOUNCE:
-            return False
+    def enter_low_power(self):
+        """Put the IMU to sleep, and turn the backlight off if
+        IDLE_BACKLIGHT_OFF, while no game is running"""
+        if self.low_power:
+            return
+        self.low_power = True
+        self.mpu_sensor.sleep()
+        if IDLE_BACKLIGHT_OFF:
+            self.lcd_display.backlight_off()
+
+    def exit_low_power(self):
+        """Wake the IMU with an empty FIFO and restore the backlight"""
+        if not self.low_power:
+            return
+        self.low_power = False
+        self.mpu_sensor.wake()
+        self.mpu_sensor.fifo_start()
+        self.gestures.restart()
+        self.orientation.reset()
+        if not self.lcd_display.backlight:
+            self.lcd_display.backlight_on()
 
-        xAccel = self.mpu_sensor.accel.x
-        yAccel = self.mpu_sensor.accel.y
-        zAccel = self.mpu_sensor.accel.z
-        accel_magnitude = math.sqrt(xAccel**2 + yAccel**2 + zAccel**2)
+    def _touch_irq(self, pin):
+        self.touch_woke = True
+
+    def sleep_until_touch(self, ms):
+        """lightsleep for up to ms or until the touch sensor goes high.
+        Returns True if a touch woke it. A touch still held from before
+        can't start anything, so then it sleeps until the release."""
+        pin = self.touch_pin
+        held = pin.value()
+        self.touch_woke = False
+        pin.irq(handler=self._touch_handler, trigger=Pin.IRQ_FALLING if held else Pin.IRQ_RISING)
+        # Skip the sleep if the edge came before the interrupt was armed
+        if pin.value() == held:
+            lightsleep(ms)
+        pin.irq(handler=None)
+        return self.touch_woke and not held
+
+    def poll_imu(self):
+        """Drain the IMU FIFO into the gesture classifier and the orientation
+        filter. Call once per loop before the IMU based checks. Sets and
+        returns the label of the newest completed window, or -1 if none
+        completed."""
+        self.imu_label = -1
+        count = self.mpu_sensor.fifo_count
+        if count >= IMU_FIFO_SIZE:
+            # Overflowed while the loop was busy (e.g. playing a song)
+            if DEBUG:
+                events.log(EV_IMU_OVERFLOW, count)
+            if recorder:
+                recorder.imu_reset(count)
+            self.mpu_sensor.fifo_start()
+            self.gestures.restart()
+            self.orientation.reset()
+            return -1
+
+        label = -1
+        count -= count % gestures.SAMPLE_BYTES
+        self.orientation.new_burst()
+        recoveries = self.imu_bus.recoveries
+        retried = self.imu_bus.retried
+        while count:
+            chunk = min(count, len(self.imu_buffer))
+            self.mpu_sensor.read_fifo_into(self.imu_views[chunk // gestures.SAMPLE_BYTES])
+            if self.imu_bus.recoveries != recoveries or self.imu_bus.retried != retried:
+                # A read was cut short, so what came back may not start on
+                # a sample: drop it and start again from an empty FIFO
+                if recorder:
+                    recorder.imu_reset(count)
+                self.mpu_sensor.fifo_start()
+                self.gestures.restart()
+                self.orientation.reset()
+                return -1
+            if recorder:
+                recorder.imu(self.imu_buffer, chunk)
+            if telemetry:
+                telemetry.imu(self.imu_buffer, chunk)
+            result = self.gestures.feed_fifo(self.imu_buffer, chunk)
+            if result >= 0:
+                label = result
+            self.orientation.feed_fifo(self.imu_buffer, chunk)
+            count -= chunk
+        self.imu_label = label
+        return label
+
+    def is_shaking(self):
+        label = self.imu_label
+        if label < 0 or timers.pending(TIMER_SHAKE):
+            return False
 
         if DEBUG:
-            print(f"Accel magnitude: {accel_magnitude}, Threshold: {threshold}")
+            events.log(EV_IMU_WINDOW, label, self.gestures.last_us)
 
-        if accel_magnitude > threshold and not self.shake_detected:
-            self.last_shake_time = current_time
+        # Bumps from the other controls are labelled separately, so only a
+        # real shake counts.
+        if label == gestures.SHAKE and not self.shake_detected:
+            timers.start(TIMER_SHAKE, SHAKE_DEBOUNCE_MS)
             self.shake_detected = True
-            print("Shake detected in is_shaking method!")  # Debug print
             return True
-        elif accel_magnitude <= threshold:
+        elif label != gestures.SHAKE:
             self.shake_detected = False
 
         return False
 
+    def is_twisted(self):
+        # The fastest of the samples poll_imu() just read, not only the last
+        yaw_rate = self.orientation.yaw_peak
+        if DEBUG:
+            events.log(EV_YAW, yaw_rate)
+
+        # A shake spins the box about every axis, so it is not a twist
+        if yaw_rate > TWIST_RATE_ON and not self.twist_detected and self.gestures.label != gestures.SHAKE:
+            self.twist_detected = True
+            return True
+        elif yaw_rate < TWIST_RATE_OFF:
+            self.twist_detected = False
+
+        return False
+
+    def is_tilted(self):
+        tilt = max(abs(self.orientation.pitch), abs(self.orientation.roll))
+        if DEBUG:
+            events.log(EV_ANGLES, self.orientation.pitch, self.orientation.roll)
+
+        if tilt > TILT_ANGLE_ON and not self.tilt_detected and self.gestures.label != gestures.SHAKE:
+            self.tilt_detected = True
+            return True
+        elif tilt < TILT_ANGLE_OFF:
+            self.tilt_detected = False
+
+        return False
+
     def is_joystick_moved(self):
-        current_time = time.time()
-        if current_time - self.last_joystick_time < JOYSTICK_DEBOUNCE:
-            return False, self.joystick_x_position, self.joystick_y_position
+        """The latest readings are left in joystick_x_reading and
+        joystick_y_reading"""
+        if timers.pending(TIMER_JOYSTICK):
+            return False
+
+        x_axis = self.joystick_x_reading = self.vrx.read_u16()
+        y_axis = self.joystick_y_reading = self.vry.read_u16()
 
-        x_axis = self.vrx.read_u16()
-        y_axis = self.vry.read_u16()
+        # The joystick got messed up when attaching it to the game and now it
+        # doesn't always read a consistent value even when not activated. So
+        # each axis tracks its own drifting rest position, and a flick is a
+        # fast deviation from that.
+        flicked = self.joystick.update(x_axis, y_axis)
 
-        # This isn't necessarily the ideal implementation, but the
-        # joystick got messed up when attaching it to the game and now it
-        # doesn't always read a consistent value even when not activated. So,
-        # instead we want to detect if it's really been flicked.
-        x_moved = x_axis < 2000 or x_axis > 55000
-        y_moved = y_axis < 2000 or y_axis > 55000
+        if DEBUG:
+            events.log(EV_JOYSTICK, x_axis, y_axis)
 
-        if (x_moved or y_moved) and not self.joystick_detected:
+        if flicked:
             self.joystick_x_position = x_axis
             self.joystick_y_position = y_axis
-            self.last_joystick_time = current_time
-            self.joystick_detected = True
-            return True, x_axis, y_axis
-        elif not x_moved and not y_moved:
-            self.joystick_detected = False
-
-        return False, x_axis, y_axis
+            timers.start(TIMER_JOYSTICK, JOYSTICK_DEBOUNCE_MS)
+            return True
 
-    def is_slider_moved(self, threshold=SLIDER_THRESHOLD):
-        current_time = time.time()
-        if current_time - self.last_slider_time < SLIDER_DEBOUNCE:
-            return False, self.slider_value
+        return False
 
-        current_value = self.slider_sensor.read_u16()
-        diff = current_value - self.slider_value
+    def is_slider_moved(self):
+        """The latest reading is left in slider_reading"""
+        current_value = self.slider_reading = self.slider_sensor.read_u16()
+        slid = self.slider.update(current_value, time.ticks_ms())
 
-        # Only print debug info if we're expecting a slide action
         if DEBUG:
-            print(f"Slider current: {current_value}, last: {self.slider_value}, diff: {diff}")
+            events.log(EV_SLIDER, current_value, self.slider.velocity)
 
-        if abs(diff) > threshold and not self.slider_detected:
+        if slid:
             self.slider_value = current_value
-            self.last_slider_time = current_time
-            self.slider_detected = True
-            return True, current_value
+            return True
 
-        return False, current_value
+        return False
 
 
-def main():
+loop_timer = LoopTimer(PHASE_NAMES)
+timers = TimerWheel(TIMER_COUNT)
+heap_check = HeapCheck(ALLOC_STRICT) if ALLOC_CHECK else None
+events = EventLog(LOG_SIZE) if DEBUG else None
+recorder = None  # Set by setup() when RECORD_SESSION is on
+replay = None    # Set by setup() when REPLAY_PATH is set
+telemetry = None  # Set by setup() when TELEMETRY is on
+stats = None      # Set by setup() when STATS is on
+
+
+def define_events(log):
+    log.define(EV_START, LEVEL_INFO, "Welcome to Beep It! Follow the prompts!")
+    log.define(EV_PROMPT, LEVEL_INFO, "%s", INPUT_NAMES)
+    log.define(EV_DETECTED, LEVEL_INFO, "%s detected", INPUT_NAMES)
+    log.define(EV_TOO_SLOW, LEVEL_INFO, "Too slow! Try again!")
+    log.define(EV_CORRECT, LEVEL_INFO, "Correct! Score: %d")
+    log.define(EV_WRONG, LEVEL_INFO, "Wrong action: %s! Mistakes: %d", INPUT_NAMES)
+    log.define(EV_GAME_OVER, LEVEL_INFO, "Game ended! Final score: %d")
+    log.define(EV_IMU_OVERFLOW, LEVEL_WARN, "IMU FIFO overflowed at %d bytes, restarted")
+    log.define(EV_IMU_WINDOW, LEVEL_DEBUG, "IMU window: %s, %d us", gestures.LABELS)
+    log.define(EV_YAW, LEVEL_DEBUG, "Peak yaw rate: %d")
+    log.define(EV_ANGLES, LEVEL_DEBUG, "Pitch: %d, roll: %d")
+    log.define(EV_JOYSTICK, LEVEL_DEBUG, "Joystick x: %d, y: %d")
+    log.define(EV_SLIDER, LEVEL_DEBUG, "Slider: %d, velocity: %d")
+    log.define(EV_STATE, LEVEL_DEBUG, "State: %s", STATE_NAMES)
+    log.define(EV_LATENCY, LEVEL_DEBUG, "Input to feedback: %d ms")
+    log.define(EV_SPEED_LIMIT, LEVEL_WARN, "Speed limited to %d ms windows by %d ms latency")
+    log.define(EV_HIGH_SCORE, LEVEL_INFO, "New high score: %d")
+
+
+if DEBUG:
+    define_events(events)
+
+
+def idle_sleep(ms):
+    """Sleep for ms, spending the start of it on deferred work: writing
+    recorded blocks to flash, printing logged events and sending telemetry"""
+    started = time.ticks_ms()
+    if recorder:
+        recorder.service()
+    if DEBUG:
+        events.flush(min(ms, LOG_FLUSH_MS))
+    if telemetry:
+        # Keep the timer's samples moving through long sleeps
+        while True:
+            telemetry.collect()
+            telemetry.flush()
+            left = ms - time.ticks_diff(time.ticks_ms(), started)
+            if left <= 0:
+                return
+            time.sleep_ms(min(left, TELEMETRY_SLICE_MS))
+    ms -= time.ticks_diff(time.ticks_ms(), started)
+    if ms > 0:
+        time.sleep_ms(ms)
+
+
+def start_recording():
+    """Open the next session file and seed random from its header, so a
+    replay can draw the same prompts"""
+    seed = random.getrandbits(30)
+    random.seed(seed)
+    return rec.Recorder(rec.next_path(), seed, RECORD_MAX_BYTES)
+
+
+def setup():
+    """Bring up the hardware and show the start screen"""
+    global recorder, replay, telemetry, stats
+    if REPLAY_PATH:
+        replay = Replay(REPLAY_PATH)
+        random.seed(replay.seed)
+    elif RECORD_SESSION:
+        recorder = start_recording()
+    started = time.ticks_ms()
     game_state = GameState()
-    input_manager = InputManager()
+    input_manager = InputManager(started)
     game_state.input_manager = input_manager  # type: ignore
+    if STATS and not replay:
+        stats = st.StatsStore(len(INPUT_NAMES), STATS_BINS, STATS_BIN_MS, STATS_SAVE_MINUTES * 60000)
+        stats.load()
+    if TELEMETRY:
+        telemetry = Telemetry()
+        if input_manager.raw_inputs:
+            x, y, slider, touch = input_manager.raw_inputs
+            telemetry.start_sampling(x, y, slider, touch, TELEMETRY_RATE)
+        else:
+            print("Telemetry: no input sampling while replaying")
 
-    time.sleep(1)
+    if not FAST_BOOT:
+        time.sleep(1)
 
-    # Debug I2C devices
-    print("Scanning for I2C devices...")
-    devices = input_manager.i2c1_sensor.scan()
-    if devices:
-        print(f"Found I2C1 devices at: {[hex(device) for device in devices]}")
-    else:
-        print("No I2C1 devices found. Check wiring!")
+        # Debug I2C devices
+        print("Scanning for I2C devices...")
+        devices = input_manager.i2c1_sensor.scan()
+        if devices:
+            print(f"Found I2C1 devices at: {[hex(device) for device in devices]}")
+        else:
+            print("No I2C1 devices found. Check wiring!")
 
-    devices = input_manager.i2c0_sensor.scan()
-    if devices:
-        print(f"Found I2C0 devices at: {[hex(device) for device in devices]}")
-    else:
-        print("No I2C0 devices found")
+        devices = input_manager.i2c0_sensor.scan()
+        if devices:
+            print(f"Found I2C0 devices at: {[hex(device) for device in devices]}")
+        else:
+            print("No I2C0 devices found")
 
-    input_manager.lcd_display.backlight_on()
-    input_manager.lcd_display.putstr("BEEP TO START")
+    def timings(args):
+        if args == "reset":
+            loop_timer.reset()
+        else:
+            loop_timer.report()
 
-    while True:
-        # Simple state machine for game on/off
-        if not game_state.is_game_on:
-            # Check for game start condition (placeholder)
-            if input_manager.is_touched():
-                print("STARTING GAME")
-                input_manager.lcd_display.clear()
-                input_manager.lcd_display.putstr("STARTING GAME")
-                sounds.playsong(input_manager.buzzer, "GAME_START")
-                game_state.start_game()
-            time.sleep(1)
-            continue
-
-        # Game is running
-        current_time = time.time()
-
-        # Check for timeouts and generate new action if needed
-        if current_time - game_state.last_prompt_time > game_state.prompt_interval:
-            game_state.generate_new_action()
-
-        # Check inputs and validate against current action
-        if input_manager.is_shaking():
-            print("Shake detected!")
-            if game_state.check_action(GameAction.SHAKE):
-                game_state.handle_correct_action()
-            else:
-                game_state.handle_wrong_action("shake")
+    input_manager.console.add("timings", timings)
+    input_manager.console.add("speed", lambda args: game_state.report_speed())
+    input_manager.console.add("glyphs", lambda args: input_manager.glyphs.report())
+    input_manager.console.add("gestures", lambda args: input_manager.gestures.report())
+    if DEBUG:
+        input_manager.console.add("log", events.command)
+    if recorder:
+        def record(args):
+            recorder.flush()
+            recorder.report()
 
-        if input_manager.is_touched():
-            print("Touch detected!")
-            if game_state.check_action(GameAction.TOUCH):
-                game_state.handle_correct_action()
+        input_manager.console.add("rec", record)
+    if replay:
+        input_manager.console.add("replay", lambda args: replay.report())
+    if stats:
+        def show_stats(args):
+            if args == "reset":
+                stats.clear()
+                stats.save()
             else:
-                game_state.handle_wrong_action("touch")
+                stats.report(INPUT_NAMES)
 
-        joystick_moved, x_axis, y_axis = input_manager.is_joystick_moved()
-        if joystick_moved:
-            print("Joystick detected!")
-            if game_state.check_action(GameAction.FLICK):
-                game_state.handle_correct_action()
-            else:
-                game_state.handle_wrong_action("flick")
+        input_manager.console.add("stats", show_stats)
 
-        slider_moved, current_value = input_manager.is_slider_moved()
-        if slider_moved:
-            print("Slider detected!")
-            if game_state.check_action(GameAction.SLIDE):
-                game_state.handle_correct_action()
+    if heap_check:
+        def heap(args):
+            if args == "reset":
+                heap_check.reset()
             else:
-                game_state.handle_wrong_action("slide")
+                heap_check.report()
 
-        if game_state.mistakes >= 3:
-            game_state.stop_game()
+        input_manager.console.add("heap", heap)
+
+    input_manager.lcd_display.backlight_on()
+    input_manager.lcd_display.show(START_TEXT)
+    print("BEEP TO START after %d ms of setup (ticks_ms %d)" % (
+        time.ticks_diff(time.ticks_ms(), started), time.ticks_ms()))
 
-        time.sleep(0.1)
+    return game_state, input_manager
+
+
+def run_frame(game_state, input_manager):
+    """One pass of the main loop"""
+    if heap_check:
+        heap_check.start()
+    idle = _run_frame(game_state, input_manager)
+    if heap_check:
+        heap_check.end(idle)
+
+
+def _run_frame(game_state, input_manager):
+    """Returns True if nothing happened: no input, no prompt, no state change"""
+    loop_timer.start()
+    if recorder:
+        recorder.frame()
+    if replay:
+        replay.frame()
+    input_manager.console.poll()
+    loop_timer.lap(PHASE_CONSOLE)
+
+    idle = not game_state.tick()
+    loop_timer.lap(PHASE_TIMERS)
+
+    if game_state.state == ST_IDLE:
+        input_manager.enter_low_power()
+        touched = input_manager.is_touched()
+        if touched:
+            input_manager.exit_low_power()
+            game_state.on_input(INPUT_TOUCH)
+        elif IDLE_LIGHTSLEEP and input_manager.touch_pin and not telemetry:
+            # Deferred work first, then sleep until touched. The touch is
+            # picked up by is_touched() at the start of the next frame.
+            if recorder:
+                recorder.service()
+            if stats and stats.service():
+                idle = False  # Saving allocates
+            if DEBUG:
+                events.flush()
+            input_manager.sleep_until_touch(IDLE_WAKE_MS)
+        else:
+            if stats and stats.service():
+                idle = False
+            idle_sleep(1000)
+        return idle and not touched
+
+    # Check inputs and pass them to the game. They are read in every state
+    # so the detectors keep track, but only count while AWAITING. Anything
+    # an answer puts on the display waits until they have all been read.
+    input_manager.display_bus.hold()
+    input_manager.poll_imu()
+    loop_timer.lap(PHASE_IMU)
+
+    checks = input_manager.checks
+    for action in range(len(checks)):
+        found = checks[action]()
+        loop_timer.lap(ACTION_PHASES[action])
+        if found:
+            idle = False
+            detected(game_state, action)
+
+    input_manager.display_bus.release()
+    game_state.feedback_shown()
+    if stats and stats.service():
+        idle = False  # Saving allocates
+    loop_timer.lap(PHASE_DISPLAY)
+
+    # Sleep until the next deadline, if that comes before the next frame
+    idle_sleep(timers.ms_until_next(FRAME_MS))
+    loop_timer.lap(PHASE_SLEEP)
+    return idle
+
+
+def detected(game_state, action):
+    if DEBUG:
+        events.log(EV_DETECTED, action)
+    game_state.on_input(action)
+    loop_timer.lap(PHASE_HANDLERS)
+
+
+def main():
+    game_state, input_manager = setup()
+    while True:
+        run_frame(game_state, input_manager)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,145 @@
+# orientation.py Complementary filter orientation estimate from the MPU6050
+#
+# Integrates the gyro for fast response and pulls the result towards the
+# angle implied by gravity to cancel gyro drift. Samples arrive in bursts
+# from the IMU FIFO at a fixed rate, so the time step is a constant.
+#
+# All arithmetic is on small integers (angles in millidegrees): floats are
+# heap objects in MicroPython, and at 200 samples a second a float filter
+# is the biggest source of garbage in the game loop.
+
+from array import array
+
+SAMPLE_RATE = 200        # Hz, must match the IMU sample rate divider
+ACCEL_WEIGHT = 50        # Each sample moves 1/50th of the way to the accel angle (alpha 0.98)
+GYRO_SCALE = 131         # LSB per degree/s at gyro_range 0
+SAMPLE_BYTES = 12
+
+# Indices into Orientation.state
+PITCH = 0                # millidegrees, nose up is positive
+ROLL = 1                 # millidegrees, right side down is positive
+YAW_RATE = 2             # degrees/s around the vertical axis
+YAW_PEAK = 3             # Largest |YAW_RATE| of the samples since new_burst()
+
+
+def _atan_octant(small, big):
+    """
+    atan(small / big) in millidegrees for 0 <= small <= big, big > 0.
+    45r + 15.64r(1 - r) degrees with r in Q10, within about a quarter of a degree.
+    """
+    r = (small << 10) // big
+    t = (r * (1024 - r)) >> 4
+    return (45000 * r + ((15642 * t) >> 6)) >> 10
+
+
+def iatan2(y, x):
+    """
+    atan2(y, x) in millidegrees, -180000 to 180000
+    """
+    ax = x if x >= 0 else -x
+    ay = y if y >= 0 else -y
+    if not ax and not ay:
+        return 0
+    if ay <= ax:
+        angle = _atan_octant(ay, ax)
+    else:
+        angle = 90000 - _atan_octant(ax, ay)
+    if x < 0:
+        angle = 180000 - angle
+    return -angle if y < 0 else angle
+
+
+class Orientation(object):
+    """
+    Pitch, roll and yaw rate held in a preallocated integer array, updated
+    one raw accel + gyro sample at a time. The properties give whole
+    degrees. yaw_rate is the newest sample's; yaw_peak is the fastest since
+    new_burst(), so a twist that peaks between two reads isn't missed.
+    """
+
+    def __init__(self, rate=SAMPLE_RATE, accel_weight=ACCEL_WEIGHT, gyro_scale=GYRO_SCALE):
+        self.state = array("l", [0, 0, 0, 0])
+        self._burst = False  # The next sample starts a new yaw_peak
+        self._weight = accel_weight
+        self._per_sample = rate * gyro_scale  # raw gyro counts per degree per sample
+        self._gyro_scale = gyro_scale
+        self._seeded = False
+        self.samples = 0
+
+    @property
+    def pitch(self):
+        return self.state[PITCH] // 1000
+
+    @property
+    def roll(self):
+        return self.state[ROLL] // 1000
+
+    @property
+    def yaw_rate(self):
+        return self.state[YAW_RATE]
+
+    @property
+    def yaw_peak(self):
+        return self.state[YAW_PEAK]
+
+    def new_burst(self):
+        """
+        Start yaw_peak again from the next sample. Until one arrives it
+        keeps the last burst's peak.
+        """
+        self._burst = True
+
+    def reset(self):
+        self._seeded = False
+
+    def update(self, ax, ay, az, gx, gy, gz):
+        """
+        Fold in one raw sample
+        """
+        state = self.state
+        # |(ay, az)| by alpha max plus beta min, good to a few percent
+        ayz = ay if ay >= 0 else -ay
+        azz = az if az >= 0 else -az
+        if ayz > azz:
+            ayz, azz = azz, ayz
+        accel_pitch = iatan2(-ax, azz + ((3 * ayz) >> 3))
+        accel_roll = iatan2(ay, az)
+        if self._seeded:
+            pitch = state[PITCH] + gy * 1000 // self._per_sample
+            roll = state[ROLL] + gx * 1000 // self._per_sample
+            state[PITCH] = pitch - (pitch - accel_pitch) // self._weight
+            state[ROLL] = roll - (roll - accel_roll) // self._weight
+        else:
+            state[PITCH] = accel_pitch
+            state[ROLL] = accel_roll
+            self._seeded = True
+        rate = gz // self._gyro_scale
+        state[YAW_RATE] = rate
+        if rate < 0:
+            rate = -rate
+        if self._burst:
+            self._burst = False
+            state[YAW_PEAK] = rate
+        elif rate > state[YAW_PEAK]:
+            state[YAW_PEAK] = rate
+        self.samples += 1
+
+    def feed_fifo(self, buf, nbytes):
+        """
+        Fold in nbytes of raw FIFO data (whole samples) from buf
+        """
+        for i in range(0, nbytes - nbytes % SAMPLE_BYTES, SAMPLE_BYTES):
+            ax = buf[i] << 8 | buf[i + 1]
+            ay = buf[i + 2] << 8 | buf[i + 3]
+            az = buf[i + 4] << 8 | buf[i + 5]
+            gx = buf[i + 6] << 8 | buf[i + 7]
+            gy = buf[i + 8] << 8 | buf[i + 9]
+            gz = buf[i + 10] << 8 | buf[i + 11]
+            self.update(
+                ax - 0x10000 if ax & 0x8000 else ax,
+                ay - 0x10000 if ay & 0x8000 else ay,
+                az - 0x10000 if az & 0x8000 else az,
+                gx - 0x10000 if gx & 0x8000 else gx,
+                gy - 0x10000 if gy & 0x8000 else gy,
+                gz - 0x10000 if gz & 0x8000 else gz,
+            )
@@ -0,0 +1,249 @@
+# recorder.py Binary session recorder
+#
+# Records everything the game sees to a file on flash: raw IMU FIFO
+# samples, ADC readings, touch edges, prompts and outcomes. Records are a
+# fixed 16 bytes, built in place in a preallocated 4 KB block. Full blocks
+# are swapped for an empty one and written out later, from service(), when
+# the loop has time to spare, so one flash write per 256 records and none
+# while handling input.
+#
+# File layout, little endian:
+#   header  "<4sHHII"  magic b"BEEP", version, record size, random seed, start ticks_ms
+#   records "<I12s"    type << 24 | ticks_ms & 0xFFFFFF, then a 12 byte payload
+# Payloads:
+#   REC_IMU      the 12 raw big endian FIFO bytes: accel x, y, z, gyro x, y, z
+#   REC_ADC      "<HH" channel, value
+#   REC_TOUCH    "<H" level
+#   REC_PROMPT   "<HH" action index, score
+#   REC_OUTCOME  "<HHHH" outcome, input index, score, mistakes
+#   REC_FRAME    none, marks the start of a pass of the main loop
+#   REC_IMU_RESET "<H" FIFO byte count when it overflowed and was restarted
+# Version 2 added REC_FRAME and REC_IMU_RESET, which replay.py needs.
+
+import os
+import struct
+try:
+    from utime import ticks_ms
+except ImportError:  # Host side, reading recordings
+    from time import perf_counter_ns
+
+    def ticks_ms():
+        return perf_counter_ns() // 1000000 & 0x3FFFFFFF
+
+
+MAGIC = b"BEEP"
+VERSION = 2
+HEADER = "<4sHHII"
+RECORD_SIZE = 16
+BLOCK_SIZE = 4096        # One flash erase block, 256 records
+TICKS_MASK = 0xFFFFFF    # 4.6 hours of milliseconds
+
+REC_IMU = 1
+REC_ADC = 2
+REC_TOUCH = 3
+REC_PROMPT = 4
+REC_OUTCOME = 5
+REC_FRAME = 6
+REC_IMU_RESET = 7
+REC_NAMES = {REC_IMU: "imu", REC_ADC: "adc", REC_TOUCH: "touch", REC_PROMPT: "prompt", REC_OUTCOME: "outcome",
+             REC_FRAME: "frame", REC_IMU_RESET: "imu_reset"}
+
+ADC_JOYSTICK_X = 0
+ADC_JOYSTICK_Y = 1
+ADC_SLIDER = 2
+
+OUTCOME_START = 0
+OUTCOME_CORRECT = 1
+OUTCOME_WRONG = 2
+OUTCOME_TOO_SLOW = 3
+OUTCOME_GAME_OVER = 4
+OUTCOME_NAMES = ("start", "correct", "wrong", "too_slow", "game_over")
+
+
+def next_path(prefix="session", suffix=".bin"):
+    """
+    First unused name of the form session000.bin
+    """
+    names = os.listdir()
+    n = 0
+    while "%s%03d%s" % (prefix, n, suffix) in names:
+        n += 1
+    return "%s%03d%s" % (prefix, n, suffix)
+
+
+class Recorder(object):
+    """
+    Appends records to path. Stops recording, and counts what it drops,
+    once the file would grow past max_bytes or when both blocks are full.
+    The IMU alone fills 3.2 KB a second, so the default is about 2.5
+    minutes.
+    """
+
+    def __init__(self, path, seed, max_bytes=512 * 1024):
+        self.path = path
+        self.seed = seed
+        self.max_bytes = max_bytes
+        self._file = open(path, "wb")
+        self._file.write(struct.pack(HEADER, MAGIC, VERSION, RECORD_SIZE, seed, ticks_ms()))
+        self.written = struct.calcsize(HEADER)
+        self._block = bytearray(BLOCK_SIZE)
+        self._spare = bytearray(BLOCK_SIZE)
+        self._offset = 0
+        self._full = False  # _spare holds a full block waiting for service()
+        self.records = 0
+        self.dropped = 0
+
+    def _next(self, kind):
+        """
+        Offset of a new record with its header written, or -1 if it must be
+        dropped
+        """
+        if self._offset == BLOCK_SIZE:
+            if self._full:
+                self.dropped += 1
+                return -1
+            self._block, self._spare = self._spare, self._block
+            self._offset = 0
+            self._full = True
+        pending = self._offset + RECORD_SIZE
+        if self._full:
+            pending += BLOCK_SIZE
+        if self.written + pending > self.max_bytes:
+            self.dropped += 1
+            return -1
+        offset = self._offset
+        struct.pack_into("<I", self._block, offset, kind << 24 | ticks_ms() & TICKS_MASK)
+        self._offset = offset + RECORD_SIZE
+        self.records += 1
+        return offset
+
+    def imu(self, buf, nbytes):
+        """
+        Record nbytes of raw FIFO data (whole 12 byte samples) from buf
+        """
+        for i in range(0, nbytes - nbytes % 12, 12):
+            offset = self._next(REC_IMU)
+            if offset < 0:
+                return
+            block = self._block
+            for j in range(12):
+                block[offset + 4 + j] = buf[i + j]
+
+    def imu_reset(self, count):
+        offset = self._next(REC_IMU_RESET)
+        if offset >= 0:
+            struct.pack_into("<H", self._block, offset + 4, count)
+
+    def adc(self, channel, value):
+        offset = self._next(REC_ADC)
+        if offset >= 0:
+            struct.pack_into("<HH", self._block, offset + 4, channel, value)
+
+    def touch(self, level):
+        offset = self._next(REC_TOUCH)
+        if offset >= 0:
+            struct.pack_into("<H", self._block, offset + 4, level)
+
+    def prompt(self, action, score):
+        offset = self._next(REC_PROMPT)
+        if offset >= 0:
+            struct.pack_into("<HH", self._block, offset + 4, action, score)
+
+    def outcome(self, outcome, action=0, score=0, mistakes=0):
+        offset = self._next(REC_OUTCOME)
+        if offset >= 0:
+            struct.pack_into("<HHHH", self._block, offset + 4, outcome, action, score, mistakes)
+
+    def frame(self):
+        self._next(REC_FRAME)
+
+    def service(self):
+        """
+        Write out a full block if there is one. Call when the loop is idle.
+        """
+        if self._full:
+            self._file.write(self._spare)
+            self.written += BLOCK_SIZE
+            self._full = False
+
+    def flush(self):
+        """
+        Write everything recorded so far, including a partly filled block
+        """
+        self.service()
+        if self._offset:
+            self._file.write(memoryview(self._block)[:self._offset])
+            self.written += self._offset
+            self._offset = 0
+        self._file.flush()
+
+    def close(self):
+        self.flush()
+        self._file.close()
+
+    def report(self):
+        print("%s: %d records, %d bytes written, %d dropped" % (self.path, self.records, self.written, self.dropped))
+
+
+class RecordedADC(object):
+    """
+    Stands in for a machine.ADC and records every reading
+    """
+
+    def __init__(self, adc, recorder, channel):
+        self._adc = adc
+        self._recorder = recorder
+        self._channel = channel
+
+    def read_u16(self):
+        value = self._adc.read_u16()
+        self._recorder.adc(self._channel, value)
+        return value
+
+
+class RecordedPin(object):
+    """
+    Stands in for an input machine.Pin and records changes of level seen
+    by value()
+    """
+
+    def __init__(self, pin, recorder):
+        self._pin = pin
+        self._recorder = recorder
+        self._level = -1
+
+    def __getattr__(self, name):
+        return getattr(self._pin, name)
+
+    def value(self):
+        level = self._pin.value()
+        if level != self._level:
+            self._level = level
+            self._recorder.touch(level)
+        return level
+
+
+def read_header(f):
+    """
+    (version, seed, start ticks_ms) from an open session file
+    """
+    header = f.read(struct.calcsize(HEADER))
+    magic, version, record_size, seed, start = struct.unpack(HEADER, header)
+    if magic != MAGIC or record_size != RECORD_SIZE:
+        raise ValueError("Not a session recording")
+    if version > VERSION:
+        raise ValueError("Session recording version %d is newer than this code" % version)
+    return version, seed, start
+
+
+def read_records(f):
+    """
+    Yield (type, ticks_ms, payload) for each record after the header. The
+    payload is a memoryview that is reused, so copy it to keep it.
+    """
+    buf = bytearray(RECORD_SIZE)
+    view = memoryview(buf)
+    payload = view[4:]
+    while f.readinto(buf) == RECORD_SIZE:
+        word = struct.unpack_from("<I", buf, 0)[0]
+        yield word >> 24, word & TICKS_MASK, payload
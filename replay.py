@@ -0,0 +1,229 @@
+# replay.py Play a recorded session back into the game
+#
+# Stand-ins for the touch Pin, the ADCs and the MPU6050 FIFO that return
+# what recorder.py captured instead of reading the hardware. The recording
+# marks the start of every pass of the main loop, and frame() releases one
+# recorded pass at a time, so each replayed frame sees exactly the readings
+# its recorded frame saw however fast it runs. The game's own clock paces
+# the replay: on the Pico that is the original timing, in the host
+# simulator the clock is virtual, so a session replays in a fraction of a
+# second.
+#
+# Prompts and outcomes the game produces are compared with the recorded
+# ones, so a detector or timing change that alters how a game plays out
+# shows up as a mismatch.
+
+from array import array
+from utime import sleep_us
+import recorder as rec
+
+FIFO_SIZE = 1024         # Bytes, as on the MPU6050
+BUS_FREQ = 400000        # The MPU6050's I2C bus, for the time a read would take
+READS_PER_FRAME = 4      # Readings of one ADC channel held per frame
+
+
+class Replay(object):
+    """
+    Reads records from path one frame at a time. seed is the random seed
+    the recording was made with.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        self.version, self.seed, self.start = rec.read_header(self._file)
+        if self.version < 2:
+            raise ValueError("Session recording version %d has no frame markers" % self.version)
+        self._records = rec.read_records(self._file)
+        self.frames = 0
+        self.finished = False  # Every record has been read
+        self.ended = False     # and the game has played past the last frame
+        # Each ADC read takes the next reading recorded for its channel in
+        # this frame, or repeats the last one
+        self.adc_queue = array("H", [0] * (3 * READS_PER_FRAME))
+        self.adc_count = bytearray(3)
+        self.adc_next = bytearray(3)
+        self.adc_last = array("H", [32768, 32768, 32768])
+        self.touch = 0
+        self.fifo = bytearray(FIFO_SIZE)
+        self.fifo_len = 0
+        self.fifo_overflow = False
+        self.expected_prompts = []
+        self.prompts = []
+        self.expected_outcomes = []
+        self.outcomes = []
+        self._load()
+        self._release()  # Readings taken during setup, before the first frame
+
+    def _load(self):
+        record = next(self._records, None)
+        if record is None:
+            self._kind = 0
+            self.finished = True
+            self._file.close()
+            return
+        self._kind, self._ticks, self._payload = record
+
+    def _release(self):
+        """
+        Apply records up to the next frame marker
+        """
+        while not self.finished and self._kind != rec.REC_FRAME:
+            self._apply(self._kind, self._payload)
+            self._load()
+
+    def frame(self):
+        """
+        Call at the start of each pass of the main loop
+        """
+        if self.finished:
+            self.ended = True
+        for channel in range(3):
+            self.adc_count[channel] = 0
+            self.adc_next[channel] = 0
+        if not self.finished:
+            self._load()  # The frame marker
+            self.frames += 1
+        self._release()
+
+    def _apply(self, kind, payload):
+        if kind == rec.REC_IMU:
+            if self.fifo_len + 12 <= FIFO_SIZE:
+                for j in range(12):
+                    self.fifo[self.fifo_len + j] = payload[j]
+                self.fifo_len += 12
+        elif kind == rec.REC_ADC:
+            channel = payload[0] | payload[1] << 8
+            value = payload[2] | payload[3] << 8
+            count = self.adc_count[channel]
+            if count < READS_PER_FRAME:
+                self.adc_queue[channel * READS_PER_FRAME + count] = value
+                self.adc_count[channel] = count + 1
+        elif kind == rec.REC_TOUCH:
+            self.touch = payload[0]
+        elif kind == rec.REC_IMU_RESET:
+            self.fifo_overflow = True
+        elif kind == rec.REC_PROMPT:
+            self.expected_prompts.append(payload[0] | payload[1] << 8)
+        elif kind == rec.REC_OUTCOME:
+            self.expected_outcomes.append(tuple(payload[i] | payload[i + 1] << 8 for i in range(0, 8, 2)))
+
+    def read_adc(self, channel):
+        n = self.adc_next[channel]
+        if n < self.adc_count[channel]:
+            self.adc_last[channel] = self.adc_queue[channel * READS_PER_FRAME + n]
+            self.adc_next[channel] = n + 1
+        return self.adc_last[channel]
+
+    # What the game did, for comparing with the recording. Once the
+    # recording has run out there is nothing to compare with.
+    def check_prompt(self, action):
+        if not self.ended:
+            self.prompts.append(action)
+
+    def check_outcome(self, outcome, action=0, score=0, mistakes=0):
+        if not self.ended:
+            self.outcomes.append((outcome, action, score, mistakes))
+
+    @staticmethod
+    def _compare(expected, actual):
+        """
+        (matching, compared, index of the first difference or -1)
+        """
+        compared = min(len(expected), len(actual))
+        first = -1
+        matching = 0
+        for i in range(compared):
+            if expected[i] == actual[i]:
+                matching += 1
+            elif first < 0:
+                first = i
+        return matching, compared, first
+
+    def matches(self):
+        """
+        True if every recorded prompt and outcome was reproduced, in order
+        """
+        for expected, actual in ((self.expected_prompts, self.prompts), (self.expected_outcomes, self.outcomes)):
+            if self._compare(expected, actual)[2] >= 0 or len(expected) != len(actual):
+                return False
+        return True
+
+    def report(self):
+        print("%s: %d frames, %s" % (self.path, self.frames, "finished" if self.finished else "playing"))
+        for name, expected, actual in (("prompts", self.expected_prompts, self.prompts),
+                                       ("outcomes", self.expected_outcomes, self.outcomes)):
+            matching, compared, first = self._compare(expected, actual)
+            print("  %-8s recorded %d, replayed %d, matching %d/%d%s" % (
+                name, len(expected), len(actual), matching, compared,
+                ", first difference at #%d" % first if first >= 0 else ""))
+
+
+class ReplayPin(object):
+    """
+    The touch sensor, as recorded
+    """
+
+    def __init__(self, replay):
+        self._replay = replay
+
+    def value(self):
+        return self._replay.touch
+
+
+class ReplayADC(object):
+    """
+    One ADC channel (recorder.ADC_JOYSTICK_X and so on), as recorded
+    """
+
+    def __init__(self, replay, channel):
+        self._replay = replay
+        self._channel = channel
+
+    def read_u16(self):
+        return self._replay.read_adc(self._channel)
+
+
+class ReplayMPU(object):
+    """
+    The parts of the MPU6050 driver the game uses, fed from the recorded
+    FIFO data. Reads take as long as they would on the bus, so the game's
+    clock keeps pace with the recording.
+    """
+
+    filter_range = 0
+    sample_rate = 0
+
+    def __init__(self, replay):
+        self._replay = replay
+
+    def _bus_time(self, nbytes):
+        # Address, register and data bytes at 9 clocks each
+        sleep_us(((2 + nbytes) * 9 + 2) * 1000000 // BUS_FREQ)
+
+    @property
+    def fifo_count(self):
+        self._bus_time(2)
+        return FIFO_SIZE if self._replay.fifo_overflow else self._replay.fifo_len
+
+    def fifo_start(self):
+        self._replay.fifo_len = 0
+        self._replay.fifo_overflow = False
+
+    def read_fifo_into(self, buf):
+        replay = self._replay
+        n = min(len(buf), replay.fifo_len)
+        self._bus_time(len(buf))
+        fifo = replay.fifo
+        for i in range(n):
+            buf[i] = fifo[i]
+        rest = replay.fifo_len - n
+        for i in range(rest):
+            fifo[i] = fifo[n + i]
+        replay.fifo_len = rest
+
+    def wake(self):
+        pass
+
+    def sleep(self):
+        pass
@@ -0,0 +1,129 @@
+# sim Host side simulator for Beep It
+#
+# Runs the unmodified game on a normal computer. machine, utime, gc and
+# micropython are replaced by stand-ins bound to a simulated board with a
+# register level MPU6050, a PCF8574 + HD44780 display and scripted inputs.
+# Time is virtual, so a game runs as fast as the host can execute it. The
+# files the game keeps on flash (statistics, session recordings) go in the
+# simulation's own directory, a fresh temporary one unless flash_dir is
+# given, so one run never sees what an earlier one saved.
+#
+#   from sim import Simulation
+#   from sim.stimuli import Player
+#   simulation = Simulation(seed=1)
+#   game = simulation.load_game()
+#   simulation.add_player(Player(simulation.script, simulation.lcd))
+#   simulation.run(game.main, seconds=60)
+#   print(simulation.lcd.render())
+
+import os
+import sys
+import tempfile
+
+from sim.clock import SimulationEnd, VirtualClock
+from sim.hal import Board, build_modules
+from sim.hd44780 import HD44780Model
+from sim.mpu6050 import MPU6050Model
+from sim.stimuli import Script
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Matches the pin definitions and addresses in main.py
+WIRING = {
+    "touch": 15,
+    "joystick_x": 27,
+    "joystick_y": 26,
+    "slider": 28,
+    "buzzer": 13,
+    "imu_bus": 1,
+    "imu_addr": 0x68,
+    "imu_scl": 3,
+    "imu_sda": 2,
+    "lcd_bus": 0,
+    "lcd_addr": 0x27,
+    "lcd_scl": 5,
+    "lcd_sda": 4,
+}
+
+FAKE_MODULES = ("machine", "utime", "time", "gc", "micropython")
+
+
+class Simulation(object):
+    """
+    One simulated Beep It box. install() swaps the fake modules into
+    sys.modules, load_game() imports a fresh copy of the game against them
+    and run() calls into it until the virtual time budget is spent.
+    """
+
+    def __init__(self, script=None, seed=0, wiring=WIRING, flash_dir=None):
+        self.clock = VirtualClock()
+        self.script = script if script is not None else Script(seed=seed)
+        self.board = Board(self.clock, self.script, wiring)
+        self.imu = MPU6050Model(self.clock, self.script.motion)
+        self.lcd = HD44780Model(self.clock)
+        self.board.attach(wiring["imu_bus"], wiring["imu_addr"], self.imu)
+        self.board.attach(wiring["lcd_bus"], wiring["lcd_addr"], self.lcd)
+        self.modules = build_modules(self.board)
+        self.seed = seed
+        if flash_dir is None:
+            self._flash = tempfile.TemporaryDirectory(prefix="beepit-flash-")
+            flash_dir = self._flash.name
+        self.flash_dir = flash_dir
+        self._saved = None
+        self._cwd = None
+
+    def install(self):
+        if self._saved is not None:
+            return
+        self._saved = {name: sys.modules.get(name) for name in FAKE_MODULES}
+        sys.modules.update(self.modules)
+        if REPO_ROOT not in sys.path:
+            sys.path.insert(0, REPO_ROOT)
+        # The game opens its files relative to the current directory, the
+        # root of the Pico's filesystem
+        self._cwd = os.getcwd()
+        os.chdir(self.flash_dir)
+
+    def uninstall(self):
+        if self._saved is None:
+            return
+        for name, module in self._saved.items():
+            if module is None:
+                sys.modules.pop(name, None)
+            else:
+                sys.modules[name] = module
+        self._saved = None
+        os.chdir(self._cwd)
+
+    def load_game(self, name="main"):
+        """
+        Import a fresh copy of the game and its modules, so module level
+        imports of utime and machine bind to this simulation.
+        """
+        self.install()
+        for module_name, module in list(sys.modules.items()):
+            path = getattr(module, "__file__", None) or ""
+            if os.path.dirname(os.path.abspath(path)) == REPO_ROOT:
+                del sys.modules[module_name]
+        import random
+        random.seed(self.seed)
+        return __import__(name)
+
+    def add_player(self, player):
+        self.clock.listeners.append(player)
+        return player
+
+    def run(self, entry, seconds):
+        """
+        Call entry() until seconds of virtual time have passed. Returns the
+        virtual time reached, in seconds.
+        """
+        self.install()
+        self.clock.deadline_us = self.clock.now_us + int(seconds * 1000000)
+        try:
+            entry()
+        except SimulationEnd:
+            pass
+        finally:
+            self.clock.deadline_us = None
+        return self.clock.now
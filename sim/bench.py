@@ -0,0 +1,213 @@
+# bench.py Per frame benchmarks of the game loop in the host simulator
+#
+#   python3 -m sim.bench --out bench_results.json
+#
+# Drives GameState and InputManager through scripted scenarios one
+# main.run_frame() call at a time and measures every frame: host wall time,
+# virtual time (which includes modelled I2C bus time and blocking sleeps), I2C
+# transactions and bytes, PWM writes and heap allocation. Frames that change
+# the game state are also summarised per transition. The JSON output is
+# stable, so two revisions can be diffed. Every scenario starts from an empty
+# flash directory of its own, so nothing saved by an earlier run (statistics
+# and when they were last saved) changes the numbers.
+
+import argparse
+import contextlib
+import io
+import json
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from sim import Simulation, REPO_ROOT
+from sim.clock import SimulationEnd
+from sim.stimuli import Player
+
+METRICS = ("wall_us", "virtual_us", "i2c_transactions", "i2c_bytes", "pwm_writes",
+           "alloc_net_bytes", "alloc_peak_bytes")
+
+
+class Scenario(object):
+    """
+    A named way of playing: whether the player starts games, answers prompts
+    and how quickly and accurately.
+    """
+
+    def __init__(self, name, description, answer=True, reaction_s=0.4, accuracy=1.0):
+        self.name = name
+        self.description = description
+        self.answer = answer
+        self.reaction_s = reaction_s
+        self.accuracy = accuracy
+
+    def player(self, simulation, seed):
+        player = Player(simulation.script, simulation.lcd, self.reaction_s, self.accuracy, seed=seed)
+        if not self.answer:
+            player.PROMPTS = {}
+        return player
+
+
+SCENARIOS = (
+    Scenario("idle_menu", "Game off, nobody touching it", answer=False),
+    Scenario("idle_game", "Game started, prompts never answered", answer=False),
+    Scenario("rapid_correct", "Every prompt answered correctly after 150 ms", reaction_s=0.15),
+    Scenario("wrong_storm", "Every prompt answered wrongly after 150 ms", reaction_s=0.15, accuracy=0.0),
+)
+
+
+def game_snapshot(game_state):
+    return (game_state.is_game_on, game_state.current_action, game_state.score, game_state.mistakes)
+
+
+def classify_transition(before, after):
+    """
+    Name the state change between two snapshots, or None
+    """
+    if before == after:
+        return None
+    if after[0] and not before[0]:
+        return "start"
+    if before[0] and not after[0]:
+        return "game_over"
+    if after[2] > before[2]:
+        return "correct"
+    if after[3] > before[3]:
+        return "wrong"
+    return "prompt"
+
+
+def summarise(frames):
+    summary = {"frames": len(frames)}
+    for metric in METRICS:
+        values = sorted(frame[metric] for frame in frames)
+        if not values:
+            continue
+        summary[metric] = {
+            "mean": round(sum(values) / len(values), 1),
+            "p50": values[len(values) // 2],
+            "p95": values[min(len(values) - 1, len(values) * 95 // 100)],
+            "max": values[-1],
+            "total": sum(values),
+        }
+    return summary
+
+
+def run_scenario(scenario, seconds, seed):
+    with tempfile.TemporaryDirectory(prefix="beepit-bench-") as flash_dir:
+        return _run_scenario(scenario, seconds, seed, flash_dir)
+
+
+def _run_scenario(scenario, seconds, seed, flash_dir):
+    simulation = Simulation(seed=seed, flash_dir=flash_dir)
+    game = simulation.load_game()
+    start_game = scenario.name != "idle_menu"
+    player = simulation.add_player(scenario.player(simulation, seed))
+    player.start = start_game
+
+    frames = []
+    transitions = {}
+    board = simulation.board
+    with contextlib.redirect_stdout(io.StringIO()):
+        simulation.install()
+        game_state, input_manager = game.setup()
+        simulation.clock.deadline_us = simulation.clock.now_us + int(seconds * 1000000)
+        tracemalloc.start()
+        try:
+            while True:
+                bus_before = board.total_bus_stats()
+                pwm_before = board.pwm_writes
+                state_before = game_snapshot(game_state)
+                virtual_before = simulation.clock.now_us
+                tracemalloc.reset_peak()
+                heap_before = tracemalloc.get_traced_memory()[0]
+                wall_before = time.perf_counter_ns()
+                try:
+                    game.run_frame(game_state, input_manager)
+                    finished = False
+                except SimulationEnd:
+                    finished = True
+                wall = (time.perf_counter_ns() - wall_before) // 1000
+                heap_after, heap_peak = tracemalloc.get_traced_memory()
+                bus_after = board.total_bus_stats()
+                frame = {
+                    "wall_us": wall,
+                    "virtual_us": simulation.clock.now_us - virtual_before,
+                    "i2c_transactions": bus_after.transactions - bus_before.transactions,
+                    "i2c_bytes": (bus_after.bytes_out + bus_after.bytes_in
+                                  - bus_before.bytes_out - bus_before.bytes_in),
+                    "pwm_writes": board.pwm_writes - pwm_before,
+                    "alloc_net_bytes": heap_after - heap_before,
+                    "alloc_peak_bytes": heap_peak - heap_before,
+                }
+                if finished:
+                    break
+                frames.append(frame)
+                kind = classify_transition(state_before, game_snapshot(game_state))
+                if kind:
+                    transitions.setdefault(kind, []).append(frame)
+        finally:
+            tracemalloc.stop()
+            simulation.clock.deadline_us = None
+            simulation.uninstall()
+
+    return {
+        "description": scenario.description,
+        "virtual_seconds": round(simulation.clock.now, 3),
+        "score": game_state.score,
+        "frames": summarise(frames),
+        "transitions": {kind: summarise(found) for kind, found in sorted(transitions.items())},
+    }
+
+
+def revision():
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], cwd=REPO_ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def print_table(results):
+    print(f"{'scenario':<15}{'frames':>8}{'wall p50':>10}{'wall p95':>10}{'i2c/frame':>11}"
+          f"{'bytes/frame':>13}{'pwm/frame':>11}{'alloc p95':>11}")
+    for name, result in results["scenarios"].items():
+        frames = result["frames"]
+        if not frames["frames"]:
+            continue
+        print(f"{name:<15}{frames['frames']:>8}{frames['wall_us']['p50']:>10}{frames['wall_us']['p95']:>10}"
+              f"{frames['i2c_transactions']['mean']:>11}{frames['i2c_bytes']['mean']:>13}"
+              f"{frames['pwm_writes']['mean']:>11}{frames['alloc_peak_bytes']['p95']:>11}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per frame benchmarks of the game loop")
+    parser.add_argument("--seconds", type=float, default=60, help="virtual time per scenario")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--scenario", action="append", choices=[s.name for s in SCENARIOS],
+                        help="run only these scenarios")
+    parser.add_argument("--out", default="bench_results.json", help="where to write the JSON results")
+    args = parser.parse_args()
+
+    results = {
+        "revision": revision(),
+        "python": sys.version.split()[0],
+        "seconds": args.seconds,
+        "seed": args.seed,
+        "scenarios": {},
+    }
+    for scenario in SCENARIOS:
+        if args.scenario and scenario.name not in args.scenario:
+            continue
+        results["scenarios"][scenario.name] = run_scenario(scenario, args.seconds, args.seed)
+
+    with open(args.out, "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+        f.write("\n")
+    print_table(results)
+    print(f"\nWrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+# clock.py Virtual time for the host simulator
+#
+# Nothing in the simulator waits for real time. Sleeps and modelled bus time
+# advance this clock instantly, which is what lets a game run faster than real
+# time on the host.
+
+import heapq
+
+
+class SimulationEnd(Exception):
+    """
+    Raised from inside the game when the simulated run time is used up
+    """
+
+    pass
+
+
+class VirtualClock(object):
+    """
+    Microsecond clock with scheduled callbacks. Listeners are called after
+    every advance so stimuli and scripted players can react to the passage of
+    time.
+    """
+
+    def __init__(self):
+        self.now_us = 0
+        self.deadline_us = None
+        self.listeners = []
+        self._queue = []
+        self._seq = 0
+
+    @property
+    def now(self):
+        """
+        Current time in seconds
+        """
+        return self.now_us / 1000000
+
+    def schedule(self, at_us, callback):
+        """
+        Call callback() once the clock reaches at_us
+        """
+        heapq.heappush(self._queue, (at_us, self._seq, callback))
+        self._seq += 1
+
+    def advance(self, us):
+        """
+        Move time forward by us microseconds, firing scheduled callbacks at
+        their own time on the way.
+        """
+        target = self.now_us + max(0, int(us))
+        while self._queue and self._queue[0][0] <= target:
+            at_us, _, callback = heapq.heappop(self._queue)
+            self.now_us = max(self.now_us, at_us)
+            callback()
+        self.now_us = target
+        for listener in self.listeners:
+            listener(self.now_us)
+        if self.deadline_us is not None and self.now_us >= self.deadline_us:
+            raise SimulationEnd(self.now_us)
@@ -0,0 +1,429 @@
+# hal.py Stand-ins for the MicroPython machine, utime, gc and micropython
+# modules, backed by a simulated board.
+#
+# build_modules() returns fresh module objects bound to one Board. The game
+# imports them by their usual names once Simulation.install() has put them in
+# sys.modules, so main.py, imu.py and i2c_lcd.py run without changes.
+
+import gc as _gc
+import math
+import sys
+import time as _time
+import tracemalloc
+import types
+
+HEAP_SIZE = 192 * 1024   # Roughly what MicroPython has free on a Pico
+I2C_EIO = 5              # errno MicroPython raises when a device doesn't ACK
+I2C_ETIMEDOUT = 110      # errno for a transfer that can't finish, such as on a stuck bus
+IRQ_FALLING = 4
+IRQ_RISING = 8
+LIGHTSLEEP_STEP_US = 5000  # How often a lightsleep looks for a pin interrupt
+
+
+class BusStats(object):
+    """
+    Transaction counts for one I2C address
+    """
+
+    def __init__(self):
+        self.transactions = 0
+        self.bytes_out = 0
+        self.bytes_in = 0
+        self.time_us = 0
+
+    def as_dict(self):
+        return {
+            "transactions": self.transactions,
+            "bytes_out": self.bytes_out,
+            "bytes_in": self.bytes_in,
+            "time_us": self.time_us,
+        }
+
+
+class Board(object):
+    """
+    The simulated Pico and everything wired to it. Inputs are sampled from a
+    Script at the current virtual time; outputs are recorded.
+    """
+
+    def __init__(self, clock, script, wiring):
+        self.clock = clock
+        self.script = script
+        self.wiring = wiring
+        self.buses = {0: {}, 1: {}}
+        self.bus_stats = {0: {}, 1: {}}
+        self.pin_levels = {}
+        self.pin_irqs = {}
+        self.pwm_writes = 0
+        self.pwm_freq = 0
+        self.pwm_duty = 0
+        self.tones = []
+        self.lightsleeps = 0
+        self.lightsleep_wakes = 0  # Ended early by a pin interrupt
+        # Injected I2C faults: transfers still to fail, and the SCL clocks a
+        # device holding SDA low needs before it lets go
+        self.glitches = {0: 0, 1: 0}
+        self.partials = {0: 0, 1: 0}
+        self.jams = {0: 0, 1: 0}
+        self.bus_pins = {}  # pin: (bus, is SCL)
+        for name, bus in (("imu", wiring["imu_bus"]), ("lcd", wiring["lcd_bus"])):
+            if name + "_scl" in wiring:
+                self.bus_pins[wiring[name + "_scl"]] = (bus, True)
+                self.bus_pins[wiring[name + "_sda"]] = (bus, False)
+
+    def attach(self, bus, addr, device):
+        self.buses[bus][addr] = device
+
+    def glitch(self, bus, count=1):
+        """
+        Fail the next count transfers on bus, as interference would
+        """
+        self.glitches[bus] += count
+
+    def partial(self, bus, count=1):
+        """
+        Fail the next count writes on bus after only half their bytes got
+        through, as interference part way through a transfer would
+        """
+        self.partials[bus] += count
+
+    def jam(self, bus, clocks=5):
+        """
+        Leave a device on bus holding SDA low, as one reset part way through
+        a byte does, until SCL is clocked clocks times by hand. Every
+        transfer fails until then.
+        """
+        self.jams[bus] = clocks
+
+    def stats(self, bus, addr):
+        stats = self.bus_stats[bus].get(addr)
+        if stats is None:
+            stats = self.bus_stats[bus][addr] = BusStats()
+        return stats
+
+    def total_bus_stats(self):
+        total = BusStats()
+        for per_bus in self.bus_stats.values():
+            for stats in per_bus.values():
+                total.transactions += stats.transactions
+                total.bytes_out += stats.bytes_out
+                total.bytes_in += stats.bytes_in
+                total.time_us += stats.time_us
+        return total
+
+    def read_pin(self, pin_id):
+        if pin_id == self.wiring["touch"]:
+            return self.script.touch_level(self.clock.now)
+        bus_pin = self.bus_pins.get(pin_id)
+        if bus_pin is not None:
+            # Pulled up, unless driven low or a jammed device holds SDA
+            if not bus_pin[1] and self.jams[bus_pin[0]]:
+                return 0
+            return self.pin_levels.get(pin_id, 1)
+        return self.pin_levels.get(pin_id, 0)
+
+    def write_pin(self, pin_id, level):
+        bus_pin = self.bus_pins.get(pin_id)
+        if bus_pin is not None and bus_pin[1] and self.jams[bus_pin[0]]:
+            if level and not self.pin_levels.get(pin_id, 1):
+                self.jams[bus_pin[0]] -= 1  # A clock pulse
+        self.pin_levels[pin_id] = level
+
+    def next_irq(self, after, until):
+        """
+        (time, handler, pin) of the first enabled pin interrupt in the
+        interval (after, until] of seconds, or None. Only the touch sensor
+        changes on its own.
+        """
+        irq = self.pin_irqs.get(self.wiring["touch"])
+        if irq is None:
+            return None
+        handler, trigger, pin = irq
+        at = self.script.next_touch_edge(after, until, trigger & IRQ_RISING, trigger & IRQ_FALLING)
+        if at is None:
+            return None
+        return at, handler, pin
+
+    def read_adc(self, pin_id):
+        t = self.clock.now
+        if pin_id == self.wiring["joystick_x"]:
+            return self.script.joystick_value(0, t)
+        if pin_id == self.wiring["joystick_y"]:
+            return self.script.joystick_value(1, t)
+        if pin_id == self.wiring["slider"]:
+            return self.script.slider_value(t)
+        return 0
+
+
+def build_modules(board):
+    """
+    Return {name: module} for machine, utime, time, gc and micropython
+    """
+    clock = board.clock
+
+    # utime / time
+    utime = types.ModuleType("utime")
+
+    def sleep(seconds):
+        clock.advance(seconds * 1000000)
+
+    def sleep_ms(ms):
+        clock.advance(ms * 1000)
+
+    def sleep_us(us):
+        clock.advance(us)
+
+    def ticks_diff(new, old):
+        # Same wrap around behaviour as MicroPython's 30 bit ticks
+        return ((new - old + 0x20000000) & 0x3FFFFFFF) - 0x20000000
+
+    utime.sleep = sleep
+    utime.sleep_ms = sleep_ms
+    utime.sleep_us = sleep_us
+    utime.time = lambda: clock.now
+    utime.time_ns = lambda: clock.now_us * 1000
+    utime.ticks_ms = lambda: (clock.now_us // 1000) & 0x3FFFFFFF
+    utime.ticks_us = lambda: clock.now_us & 0x3FFFFFFF
+    utime.ticks_cpu = utime.ticks_us
+    utime.ticks_diff = ticks_diff
+    utime.ticks_add = lambda ticks, delta: (ticks + delta) & 0x3FFFFFFF
+    utime.__getattr__ = lambda name: getattr(_time, name)
+
+    # gc: collections are free in virtual time and heap use comes from
+    # tracemalloc when it is tracing.
+    gc = types.ModuleType("gc")
+    gc.collections = 0
+
+    def collect():
+        gc.collections += 1
+
+    def mem_alloc():
+        if tracemalloc.is_tracing():
+            return tracemalloc.get_traced_memory()[0]
+        return 0
+
+    gc.collect = collect
+    gc.mem_alloc = mem_alloc
+    gc.mem_free = lambda: HEAP_SIZE - mem_alloc()
+    gc.threshold = lambda *args: -1
+    gc.enable = lambda: None
+    gc.disable = lambda: None
+    gc.isenabled = lambda: True
+    gc.__getattr__ = lambda name: getattr(_gc, name)
+
+    # micropython
+    micropython = types.ModuleType("micropython")
+    micropython.const = lambda value: value
+    micropython.native = lambda f: f
+    micropython.viper = lambda f: f
+    micropython.schedule = lambda callback, arg: callback(arg)
+    micropython.alloc_emergency_exception_buf = lambda size: None
+    micropython.mem_info = lambda *args: print("mem: alloc=%d free=%d" % (mem_alloc(), gc.mem_free()))
+
+    # machine
+    machine = types.ModuleType("machine")
+
+    class Pin(object):
+        IN = 0
+        OUT = 1
+        OPEN_DRAIN = 2
+        PULL_UP = 1
+        PULL_DOWN = 2
+        IRQ_FALLING = IRQ_FALLING
+        IRQ_RISING = IRQ_RISING
+
+        def __init__(self, pin_id, mode=-1, pull=-1, value=None):
+            self.id = pin_id
+            self.mode = mode
+            if value is not None:
+                self.value(value)
+
+        def init(self, mode=-1, pull=-1, value=None):
+            self.mode = mode
+            if value is not None:
+                self.value(value)
+
+        def value(self, level=None):
+            if level is None:
+                return board.read_pin(self.id)
+            board.write_pin(self.id, 1 if level else 0)
+
+        def on(self):
+            self.value(1)
+
+        def off(self):
+            self.value(0)
+
+        def irq(self, handler=None, trigger=IRQ_FALLING | IRQ_RISING, hard=False):
+            if handler is None:
+                board.pin_irqs.pop(self.id, None)
+            else:
+                board.pin_irqs[self.id] = (handler, trigger, self)
+
+        def __call__(self, level=None):
+            return self.value(level)
+
+    class ADC(object):
+        def __init__(self, pin):
+            self.id = pin.id if isinstance(pin, Pin) else pin
+
+        def read_u16(self):
+            return board.read_adc(self.id)
+
+    class PWM(object):
+        def __init__(self, pin, freq=0, duty_u16=0):
+            self.pin = pin
+
+        def freq(self, value=None):
+            if value is None:
+                return board.pwm_freq
+            board.pwm_writes += 1
+            board.pwm_freq = value
+
+        def duty_u16(self, value=None):
+            if value is None:
+                return board.pwm_duty
+            board.pwm_writes += 1
+            if value and not board.pwm_duty:
+                board.tones.append((clock.now, board.pwm_freq))
+            board.pwm_duty = value
+
+        def deinit(self):
+            board.pwm_duty = 0
+
+    class I2C(object):
+        def __init__(self, bus_id, scl=None, sda=None, freq=400000, timeout=50000):
+            self.id = bus_id
+            self.freq = freq
+            self.devices = board.buses[bus_id]
+
+        def _device(self, addr, nbytes_out, nbytes_in):
+            # Start, address byte, payload, stop: 9 clocks per byte
+            us = ((1 + nbytes_out + nbytes_in) * 9 + 2) * 1000000 // self.freq
+            stats = board.stats(self.id, addr)
+            stats.transactions += 1
+            stats.bytes_out += nbytes_out
+            stats.bytes_in += nbytes_in
+            stats.time_us += us
+            clock.advance(us)
+            if board.jams[self.id]:
+                raise OSError(I2C_ETIMEDOUT)
+            if board.glitches[self.id]:
+                board.glitches[self.id] -= 1
+                raise OSError(I2C_EIO)
+            device = self.devices.get(addr)
+            if device is None:
+                raise OSError(I2C_EIO)
+            return device
+
+        def scan(self):
+            # Probes every address from 0x08 to 0x77 with an empty write
+            clock.advance(0x70 * 11 * 1000000 // self.freq)
+            return sorted(self.devices)
+
+        def writeto(self, addr, buf, stop=True):
+            device = self._device(addr, len(buf), 0)
+            if board.partials[self.id] and len(buf) > 1:
+                board.partials[self.id] -= 1
+                device.i2c_write(bytes(buf[:len(buf) // 2]))
+                raise OSError(I2C_EIO)
+            if getattr(device, "byte_timed", False):
+                device.i2c_write(bytes(buf), 9 * 1000000 / self.freq)
+            else:
+                device.i2c_write(bytes(buf))
+            return len(buf)
+
+        def writevto(self, addr, vector, stop=True):
+            data = b"".join(bytes(buf) for buf in vector)
+            self._device(addr, len(data), 0).i2c_write(data)
+
+        def readfrom(self, addr, nbytes, stop=True):
+            return self._device(addr, 0, nbytes).i2c_read(nbytes)
+
+        def readfrom_into(self, addr, buf, stop=True):
+            buf[:] = self._device(addr, 0, len(buf)).i2c_read(len(buf))
+
+        def writeto_mem(self, addr, memaddr, buf, addrsize=8):
+            self._device(addr, 1 + len(buf), 0).i2c_write(bytes([memaddr]) + bytes(buf))
+
+        def readfrom_mem(self, addr, memaddr, nbytes, addrsize=8):
+            device = self._device(addr, 1, nbytes)
+            device.i2c_write(bytes([memaddr]))
+            return device.i2c_read(nbytes)
+
+        def readfrom_mem_into(self, addr, memaddr, buf, addrsize=8):
+            device = self._device(addr, 1, len(buf))
+            device.i2c_write(bytes([memaddr]))
+            buf[:] = device.i2c_read(len(buf))
+
+    class Timer(object):
+        ONE_SHOT = 0
+        PERIODIC = 1
+
+        def __init__(self, timer_id=-1, **kwargs):
+            self._active = False
+            if kwargs:
+                self.init(**kwargs)
+
+        def init(self, mode=PERIODIC, freq=None, period=None, callback=None):
+            self.mode = mode
+            self.period_us = int(1000000 / freq) if freq else int(period * 1000)
+            self.callback = callback
+            self._active = True
+            self._generation = getattr(self, "_generation", 0) + 1
+            self._arm(self._generation)
+
+        def _arm(self, generation):
+            def fire():
+                if not self._active or generation != self._generation:
+                    return
+                if self.mode == Timer.PERIODIC:
+                    self._arm(generation)
+                else:
+                    self._active = False
+                self.callback(self)
+
+            clock.schedule(clock.now_us + self.period_us, fire)
+
+        def deinit(self):
+            self._active = False
+
+    def lightsleep(ms=None):
+        # Pin interrupts are only modelled here, as the way out of a sleep.
+        # Without ms it sleeps until one fires or the run ends.
+        board.lightsleeps += 1
+        end_us = clock.now_us + ms * 1000 if ms is not None else None
+        while end_us is None or clock.now_us < end_us:
+            start_us = clock.now_us
+            step_us = LIGHTSLEEP_STEP_US if end_us is None else min(LIGHTSLEEP_STEP_US, end_us - start_us)
+            irq = board.next_irq(start_us / 1000000, (start_us + step_us) / 1000000)
+            if irq is not None:
+                at, handler, pin = irq
+                # To the first whole microsecond past the edge, so the pin
+                # reads its new level and the next sleep can't find it again
+                clock.advance(max(1, math.ceil(at * 1000000) - start_us))
+                board.lightsleep_wakes += 1
+                handler(pin)
+                return
+            clock.advance(step_us)
+
+    machine.Pin = Pin
+    machine.ADC = ADC
+    machine.PWM = PWM
+    machine.I2C = I2C
+    machine.SoftI2C = I2C
+    machine.Timer = Timer
+    machine.lightsleep = lightsleep
+    machine.deepsleep = lightsleep
+    machine.idle = lambda: clock.advance(1)
+    machine.freq = lambda *args: 125000000
+    machine.reset = lambda: sys.exit("machine.reset()")
+    machine.unique_id = lambda: b"\xbe\xe9\x17\x00\x00\x00\x00\x01"
+
+    return {
+        "machine": machine,
+        "utime": utime,
+        "time": utime,
+        "gc": gc,
+        "micropython": micropython,
+    }
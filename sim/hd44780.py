@@ -0,0 +1,197 @@
+# hd44780.py PCF8574 I2C backpack driving an HD44780 LCD, for the simulator
+#
+# The backpack is modelled as an 8 bit port wired like i2c_lcd.py expects:
+# P0 RS, P1 RW, P2 E, P3 backlight, P4-P7 D4-D7. The controller latches a
+# nibble on each falling edge of E and decodes the command set, so the screen
+# contents come from the same bytes the real display would see.
+
+MASK_RS = 0x01
+MASK_RW = 0x02
+MASK_E = 0x04
+MASK_BACKLIGHT = 0x08
+
+DDRAM_LINE = 40          # Characters per line in display memory
+LINE_ADDRESS = (0x00, 0x40)
+EXEC_US = 37             # Most instructions and data writes
+CLEAR_HOME_US = 1520     # Clear display and return home
+ROM_A00 = {0x5C: "\u00a5", 0x7E: "\u2192", 0x7F: "\u2190"}  # Where ROM A00 isn't ASCII
+
+
+class HD44780Model(object):
+    """
+    An I2C device: i2c_write(data) drives the PCF8574 port once per byte and
+    i2c_read(n) samples it. Busy time is modelled, and anything written while
+    the controller is still busy is counted in busy_violations. Each byte of
+    a long write reaches the port byte_us after the one before, ending now.
+    """
+
+    byte_timed = True
+
+    def __init__(self, clock, num_lines=2, num_columns=16):
+        self.clock = clock
+        self.num_lines = num_lines
+        self.num_columns = num_columns
+        self.port = 0xFF
+        self.ddram = [bytearray(b" " * DDRAM_LINE) for _ in range(2)]
+        self.cgram = bytearray(64)
+        self.eight_bit = True
+        self.two_lines = False
+        self.display_on = False
+        self.increment = True
+        self.shift_on_write = False
+        self.shift = 0
+        self.address = 0
+        self.cgram_mode = False
+        self.busy_until_us = 0
+        self.busy_violations = 0
+        self.commands = 0
+        self.data_writes = 0
+        self.version = 0          # Bumped whenever the visible screen may change
+        self._pending = None
+        self._read_nibble = 0
+        self._now_us = None       # When the byte being decoded reached the port
+
+    @property
+    def backlight(self):
+        return bool(self.port & MASK_BACKLIGHT)
+
+    @property
+    def busy(self):
+        return self.clock.now_us < self.busy_until_us
+
+    # Bus side
+    def i2c_write(self, data, byte_us=0):
+        end = self.clock.now_us
+        for i, byte in enumerate(data):
+            self._now_us = end - (len(data) - 1 - i) * byte_us
+            self._set_port(byte)
+        self._now_us = None
+
+    def i2c_read(self, n):
+        value = self.port
+        if self.port & MASK_RW and self.port & MASK_E:
+            value = (value & 0x0F) | (self._status_nibble() << 4)
+        return bytes([value]) * n
+
+    def _set_port(self, byte):
+        previous = self.port
+        self.port = byte
+        if previous & MASK_E and not byte & MASK_E:
+            if previous & MASK_RW:
+                self._read_nibble ^= 1
+            else:
+                self._nibble(previous & MASK_RS, (previous >> 4) & 0x0F)
+
+    def _status_nibble(self):
+        status = (0x80 if self.busy else 0) | (self.address & 0x7F)
+        return (status >> 4) if self._read_nibble == 0 else (status & 0x0F)
+
+    def _nibble(self, rs, nibble):
+        self._read_nibble = 0
+        if self.eight_bit:
+            # Only D4-D7 are wired, so in 8 bit mode D0-D3 read as zero
+            self._byte(rs, nibble << 4)
+        elif self._pending is None:
+            self._pending = nibble
+        else:
+            self._byte(rs, self._pending << 4 | nibble)
+            self._pending = None
+
+    # Controller side
+    def _byte(self, rs, value):
+        now = self.clock.now_us if self._now_us is None else self._now_us
+        if now < self.busy_until_us:
+            self.busy_violations += 1
+        duration = EXEC_US
+        if rs:
+            self._write_data(value)
+        else:
+            duration = self._command(value)
+        self.busy_until_us = now + duration
+
+    def _command(self, cmd):
+        self.commands += 1
+        self.version += 1
+        if cmd & 0x80:
+            self.cgram_mode = False
+            self.address = cmd & 0x7F
+        elif cmd & 0x40:
+            self.cgram_mode = True
+            self.address = cmd & 0x3F
+        elif cmd & 0x20:
+            self.eight_bit = bool(cmd & 0x10)
+            self.two_lines = bool(cmd & 0x08)
+            self._pending = None
+        elif cmd & 0x10:
+            if cmd & 0x08:  # Shift the display rather than move the cursor
+                self.shift += -1 if cmd & 0x04 else 1
+                self.shift %= DDRAM_LINE
+            else:
+                self._step_address(bool(cmd & 0x04))
+        elif cmd & 0x08:
+            self.display_on = bool(cmd & 0x04)
+        elif cmd & 0x04:
+            self.increment = bool(cmd & 0x02)
+            self.shift_on_write = bool(cmd & 0x01)
+        elif cmd & 0x02:
+            self.address = 0
+            self.shift = 0
+            self.cgram_mode = False
+            return CLEAR_HOME_US
+        elif cmd & 0x01:
+            for line in self.ddram:
+                line[:] = b" " * DDRAM_LINE
+            self.address = 0
+            self.shift = 0
+            self.increment = True
+            self.cgram_mode = False
+            return CLEAR_HOME_US
+        return EXEC_US
+
+    def _step_address(self, forward):
+        if self.cgram_mode:
+            self.address = (self.address + (1 if forward else -1)) & 0x3F
+            return
+        line = 1 if self.address >= 0x40 else 0
+        column = (self.address - LINE_ADDRESS[line] + (1 if forward else -1)) % DDRAM_LINE
+        self.address = LINE_ADDRESS[line] + column
+
+    def _write_data(self, value):
+        self.data_writes += 1
+        self.version += 1
+        if self.cgram_mode:
+            self.cgram[self.address] = value
+        else:
+            line = 1 if self.address >= 0x40 else 0
+            column = (self.address - LINE_ADDRESS[line]) % DDRAM_LINE
+            self.ddram[line][column] = value
+            if self.shift_on_write:
+                self.shift = (self.shift + (1 if self.increment else -1)) % DDRAM_LINE
+        self._step_address(self.increment)
+
+    # Rendering
+    def lines(self):
+        """
+        The visible text, one string per line. CGRAM glyphs (codes 0-7)
+        render as '#', ROM A00's yen sign and arrows as themselves.
+        """
+        if not self.display_on:
+            return [" " * self.num_columns for _ in range(self.num_lines)]
+        out = []
+        for line in range(min(self.num_lines, 2 if self.two_lines else 1)):
+            chars = []
+            for column in range(self.num_columns):
+                code = self.ddram[line][(column + self.shift) % DDRAM_LINE]
+                chars.append("#" if code < 8 else ROM_A00.get(code) or chr(code))
+            out.append("".join(chars))
+        while len(out) < self.num_lines:
+            out.append(" " * self.num_columns)
+        return out
+
+    def render(self):
+        """
+        The screen as a framed block of text
+        """
+        border = "+" + "-" * self.num_columns + "+"
+        body = ["|" + line + "|" for line in self.lines()]
+        return "\n".join([border] + body + [border])
@@ -0,0 +1,137 @@
+# mpu6050.py Register level model of the MPU6050 for the host simulator
+#
+# Implements the registers imu.py touches: identity, power management,
+# sample rate and filter configuration, the live data registers and the FIFO.
+# Motion comes from a callable returning raw (ax, ay, az, gx, gy, gz) at a
+# time in seconds, normally Script.motion.
+
+WHO_AM_I = 0x75
+PWR_MGMT_1 = 0x6B
+SMPLRT_DIV = 0x19
+CONFIG = 0x1A
+FIFO_EN = 0x23
+INT_STATUS = 0x3A
+ACCEL_XOUT_H = 0x3B
+TEMP_OUT_H = 0x41
+GYRO_XOUT_H = 0x43
+USER_CTRL = 0x6A
+FIFO_COUNT_H = 0x72
+FIFO_COUNT_L = 0x73
+FIFO_R_W = 0x74
+
+FIFO_SIZE = 1024
+SAMPLE_BYTES = 12
+
+
+def _rest(t):
+    return (0, 0, 16384, 0, 0, 0)
+
+
+class MPU6050Model(object):
+    """
+    An I2C device: i2c_write(data) sets the register pointer from the first
+    byte and writes the rest, i2c_read(n) reads from the pointer with auto
+    increment (except for the FIFO data register, which pops).
+    """
+
+    def __init__(self, clock, motion=_rest, temperature=25.0):
+        self.clock = clock
+        self.motion = motion
+        self.regs = bytearray(128)
+        self.regs[WHO_AM_I] = 0x68
+        self.regs[PWR_MGMT_1] = 0x40  # Powers up asleep
+        self._temp_raw = int((temperature - 36.53) * 340) & 0xFFFF
+        self.pointer = 0
+        self.fifo = bytearray()
+        self.overflows = 0
+        self._fifo_sample = None
+
+    @property
+    def asleep(self):
+        return bool(self.regs[PWR_MGMT_1] & 0x40)
+
+    @property
+    def sample_rate(self):
+        base = 1000 if 0 < self.regs[CONFIG] & 7 < 7 else 8000
+        return base / (1 + self.regs[SMPLRT_DIV])
+
+    def _fifo_enabled(self):
+        return (self.regs[USER_CTRL] & 0x40 and self.regs[FIFO_EN] & 0x78
+                and not self.asleep)
+
+    def _sample_bytes(self, t):
+        out = bytearray(SAMPLE_BYTES)
+        for i, v in enumerate(self.motion(t)):
+            v = max(-32768, min(32767, int(v))) & 0xFFFF
+            out[2 * i] = v >> 8
+            out[2 * i + 1] = v & 0xFF
+        return out
+
+    def _fill_fifo(self):
+        """
+        Queue every sample due since the last fill
+        """
+        if not self._fifo_enabled():
+            self._fifo_sample = None
+            return
+        rate = self.sample_rate
+        now = int(self.clock.now * rate)
+        if self._fifo_sample is None:
+            self._fifo_sample = now
+            return
+        first = self._fifo_sample + 1
+        # Only the newest FIFO_SIZE bytes can survive, skip the rest
+        first = max(first, now - FIFO_SIZE // SAMPLE_BYTES - 1)
+        for n in range(first, now + 1):
+            self.fifo += self._sample_bytes(n / rate)
+        self._fifo_sample = now
+        if len(self.fifo) > FIFO_SIZE:
+            del self.fifo[:len(self.fifo) - FIFO_SIZE]
+            self.overflows += 1
+            self.regs[INT_STATUS] |= 0x10
+
+    def _write_reg(self, reg, value):
+        if reg == USER_CTRL and value & 0x04:
+            self.fifo = bytearray()
+            self._fifo_sample = None
+            value &= ~0x04
+        self._fill_fifo()
+        self.regs[reg] = value
+
+    def _read_reg(self, reg):
+        if reg in (FIFO_COUNT_H, FIFO_COUNT_L):
+            count = len(self.fifo)
+            return count >> 8 if reg == FIFO_COUNT_H else count & 0xFF
+        return self.regs[reg]
+
+    def _latch_data(self):
+        """
+        Update the live data registers with the current motion
+        """
+        sample = self._sample_bytes(self.clock.now)
+        self.regs[ACCEL_XOUT_H:ACCEL_XOUT_H + 6] = sample[:6]
+        self.regs[TEMP_OUT_H] = self._temp_raw >> 8
+        self.regs[TEMP_OUT_H + 1] = self._temp_raw & 0xFF
+        self.regs[GYRO_XOUT_H:GYRO_XOUT_H + 6] = sample[6:]
+
+    def i2c_write(self, data):
+        if not data:
+            return
+        self.pointer = data[0] & 0x7F
+        for value in data[1:]:
+            self._write_reg(self.pointer, value)
+            self.pointer = (self.pointer + 1) & 0x7F
+
+    def i2c_read(self, n):
+        self._fill_fifo()
+        if not self.asleep:
+            self._latch_data()
+        if self.pointer == FIFO_R_W:
+            out = bytes(self.fifo[:n]).ljust(n, b"\0")
+            del self.fifo[:n]
+            return out
+        out = bytearray(n)
+        for i in range(n):
+            out[i] = self._read_reg(self.pointer)
+            self.pointer = (self.pointer + 1) & 0x7F
+        return bytes(out)
@@ -0,0 +1,88 @@
+# replay.py Replay recorded sessions through the game in the host simulator
+#
+#   python3 -m sim.replay session000.bin session001.bin ...
+#
+# Each session is played back into an unmodified copy of the game (see
+# replay.py at the top of the repo) on virtual time, so a long game takes a
+# fraction of a second. Prints how many prompts and outcomes matched the
+# recording and exits non-zero if any session diverged.
+
+import argparse
+import contextlib
+import io
+import os
+import struct
+import sys
+import time
+
+from sim import Simulation
+from sim.clock import SimulationEnd
+import recorder
+
+
+def session_seconds(path):
+    """
+    Recorded length of a session file, from its header and last record
+    """
+    header_size = struct.calcsize(recorder.HEADER)
+    with open(path, "rb") as f:
+        version, seed, start = recorder.read_header(f)
+        size = os.path.getsize(path)
+        if size < header_size + recorder.RECORD_SIZE:
+            return 0.0
+        f.seek(header_size + (size - header_size) // recorder.RECORD_SIZE * recorder.RECORD_SIZE - recorder.RECORD_SIZE)
+        word = struct.unpack("<I", f.read(4))[0]
+    return ((word - start) & recorder.TICKS_MASK) / 1000
+
+
+def replay_session(path, slack=2.0, verbose=False):
+    """
+    Play one session back, until slack seconds after the recording runs
+    out. Returns the game's Replay object.
+    """
+    path = os.path.abspath(path)  # The simulation runs in its own directory
+    simulation = Simulation()
+    game = simulation.load_game()
+    game.REPLAY_PATH = path
+    ended = []
+
+    def stop_after_end(now_us):
+        # Replayed frames can take longer than recorded ones, for example
+        # polling where the recording slept until touched, so the run is
+        # ended by the recording rather than by its length
+        replay = game.replay
+        if replay is not None and replay.ended:
+            if not ended:
+                ended.append(now_us)
+            elif now_us - ended[0] >= slack * 1000000:
+                raise SimulationEnd(now_us)
+
+    simulation.clock.listeners.append(stop_after_end)
+    output = io.StringIO()
+    with contextlib.nullcontext() if verbose else contextlib.redirect_stdout(output):
+        simulation.run(game.main, 4 * session_seconds(path) + slack)
+    simulation.uninstall()
+    return game.replay
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded sessions in the host simulator")
+    parser.add_argument("paths", nargs="+")
+    parser.add_argument("--slack", type=float, default=2.0, help="seconds to run past the end of each recording")
+    parser.add_argument("--verbose", action="store_true", help="show the game's own output")
+    args = parser.parse_args()
+
+    diverged = 0
+    start = time.perf_counter()
+    for path in args.paths:
+        replay = replay_session(path, args.slack, args.verbose)
+        replay.report()
+        if not replay.matches():
+            diverged += 1
+    wall = time.perf_counter() - start
+    print(f"\n{len(args.paths)} sessions replayed in {wall:.2f} s, {diverged} diverged")
+    sys.exit(1 if diverged else 0)
+
+
+if __name__ == "__main__":
+    main()
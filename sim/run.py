@@ -0,0 +1,88 @@
+# run.py Play the game in the host simulator
+#
+#   python3 -m sim.run --seconds 120 --player --show-lcd
+#   python3 -m sim.run --player --i2c-fault jam:1:20 --i2c-fault glitch:0:30:2
+#   python3 -m sim.run --player --i2c-fault partial:0:25
+#
+# Runs main.main() against simulated hardware and reports how far it got and
+# how much faster than real time it ran.
+
+import argparse
+import contextlib
+import io
+import time
+
+from sim import Simulation
+from sim.stimuli import Player
+
+
+def fault_injector(board, spec):
+    """
+    A clock listener that injects the fault spec describes once its time
+    comes
+    """
+    fields = spec.split(":")
+    kind, bus, at = fields[0], int(fields[1]), float(fields[2])
+    if kind not in ("glitch", "partial", "jam"):
+        raise SystemExit("unknown I2C fault %r" % kind)
+    count = int(fields[3]) if len(fields) > 3 else (5 if kind == "jam" else 1)
+    pending = [True]
+
+    def inject(now_us):
+        if pending[0] and now_us >= at * 1000000:
+            pending[0] = False
+            getattr(board, kind)(bus, count)
+
+    return inject
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run Beep It in the host simulator")
+    parser.add_argument("--seconds", type=float, default=60, help="virtual time to run for")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--player", action="store_true", help="add a player that answers prompts")
+    parser.add_argument("--reaction", type=float, default=0.4, help="player reaction time in seconds")
+    parser.add_argument("--accuracy", type=float, default=1.0, help="fraction of correct answers")
+    parser.add_argument("--show-lcd", action="store_true", help="print the screen whenever it settles")
+    parser.add_argument("--quiet", action="store_true", help="hide the game's own output")
+    parser.add_argument("--i2c-fault", action="append", default=[], metavar="KIND:BUS:SECONDS[:N]",
+                        help="at SECONDS, fail the next N transfers on BUS (glitch, default 1), fail the "
+                             "next N writes after half their bytes (partial, default 1) or leave it stuck "
+                             "until SCL is clocked N times (jam, default 5)")
+    args = parser.parse_args()
+
+    simulation = Simulation(seed=args.seed)
+    game = simulation.load_game()
+    if args.player:
+        simulation.add_player(Player(simulation.script, simulation.lcd, args.reaction,
+                                     args.accuracy, seed=args.seed))
+    for fault in args.i2c_fault:
+        simulation.clock.listeners.append(fault_injector(simulation.board, fault))
+    if args.show_lcd:
+        shown = [None]
+
+        def show(now_us):
+            screen = simulation.lcd.render()
+            if screen != shown[0] and not simulation.lcd.busy:
+                shown[0] = screen
+                print(f"[{now_us / 1000000:9.3f}s]\n{screen}")
+
+        simulation.clock.listeners.append(show)
+
+    output = io.StringIO()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(output) if args.quiet else contextlib.nullcontext():
+        reached = simulation.run(game.main, args.seconds)
+    wall = time.perf_counter() - start
+    simulation.uninstall()
+
+    bus = simulation.board.total_bus_stats()
+    print(f"\nSimulated {reached:.1f} s in {wall:.2f} s ({reached / max(wall, 1e-9):.0f}x real time)")
+    print(f"I2C: {bus.transactions} transactions, {bus.bytes_out + bus.bytes_in} bytes, "
+          f"{bus.time_us / 1000:.1f} ms of bus time")
+    print(f"PWM writes: {simulation.board.pwm_writes}, LCD busy violations: {simulation.lcd.busy_violations}")
+    print(simulation.lcd.render())
+
+
+if __name__ == "__main__":
+    main()
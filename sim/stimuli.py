@@ -0,0 +1,189 @@
+# stimuli.py Scriptable inputs for the host simulator
+#
+# A Script is a timeline of gestures. The simulated hardware asks it for the
+# touch level, ADC readings and IMU motion at the current virtual time, so a
+# gesture looks to the game exactly like the sensor readings it would cause.
+# A Player watches the simulated LCD and answers prompts by adding gestures.
+
+import math
+import random
+
+G = 16384                # Raw accel counts per g at the +/-2 g range
+DPS = 131                # Raw gyro counts per degree/s at the +/-250 range
+ADC_CENTRE = 32768
+ADC_MAX = 65535
+
+TOUCH = "touch"
+FLICK = "flick"
+SHAKE = "shake"
+SLIDE = "slide"
+TWIST = "twist"
+TILT = "tilt"
+GESTURES = (TOUCH, FLICK, SHAKE, SLIDE, TWIST, TILT)
+
+
+class Script(object):
+    """
+    Timeline of gestures, all times in seconds of virtual time. The joystick
+    rests slightly off centre with some noise and drift, like the damaged
+    one in the real box.
+    """
+
+    def __init__(self, seed=0, joystick_noise=600, slider_start=20000):
+        self.rng = random.Random(seed)
+        self.joystick_noise = joystick_noise
+        self.joystick_rest = (ADC_CENTRE - 1500, ADC_CENTRE + 900)
+        self.slider_start = slider_start
+        self.touches = []
+        self.flicks = []
+        self.slides = []
+        self.motions = []
+        self.log = []
+
+    # Building the timeline
+    def touch(self, at, duration=0.15):
+        self.touches.append((at, at + duration))
+        self.log.append((at, TOUCH))
+
+    def flick(self, at, axis=0, direction=1, duration=0.2):
+        self.flicks.append((at, at + duration, axis, direction))
+        self.log.append((at, FLICK))
+
+    def slide(self, at, to=None, duration=0.3):
+        start = self.slider_value(at)
+        if to is None:
+            to = ADC_MAX - 5000 if start < ADC_CENTRE else 5000
+        self.slides.append((at, at + duration, start, to))
+        self.slides.sort()
+        self.log.append((at, SLIDE))
+
+    def shake(self, at, duration=0.8, hz=5.0, g=2.0):
+        self.motions.append((at, at + duration, SHAKE, hz, g))
+        self.log.append((at, SHAKE))
+
+    def twist(self, at, duration=0.4, dps=360):
+        self.motions.append((at, at + duration, TWIST, dps, 0))
+        self.log.append((at, TWIST))
+
+    def tilt(self, at, duration=1.0, degrees=60):
+        self.motions.append((at, at + duration, TILT, degrees, 0))
+        self.log.append((at, TILT))
+
+    def gesture(self, name, at):
+        getattr(self, name)(at)
+
+    # Sampling, called by the simulated hardware
+    def touch_level(self, t):
+        for start, end in self.touches:
+            if start <= t < end:
+                return 1
+        return 0
+
+    def next_touch_edge(self, after, until, rising=True, falling=False):
+        """
+        Time of the first touch edge in (after, until], or None
+        """
+        first = None
+        for start, end in self.touches:
+            for at, wanted in ((start, rising), (end, falling)):
+                if wanted and after < at <= until and (first is None or at < first):
+                    first = at
+        return first
+
+    def joystick_value(self, axis, t):
+        # Slow drift plus noise around a rest point that isn't the centre
+        value = self.joystick_rest[axis] + int(800 * math.sin(t / 7.0 + axis))
+        value += self.rng.randint(-self.joystick_noise, self.joystick_noise)
+        for start, end, flick_axis, direction in self.flicks:
+            if flick_axis == axis and start <= t < end:
+                value = ADC_MAX - 200 if direction > 0 else 200
+        return max(0, min(ADC_MAX, value))
+
+    def slider_value(self, t):
+        value = self.slider_start
+        for start, end, begin, to in self.slides:
+            if t >= end:
+                value = to
+            elif t >= start:
+                value = begin + int((to - begin) * (t - start) / (end - start))
+        return max(0, min(ADC_MAX, value + self.rng.randint(-150, 150)))
+
+    def motion(self, t):
+        """
+        Raw (ax, ay, az, gx, gy, gz) at time t
+        """
+        roll = 0.0
+        ax = ay = gx = gy = gz = 0.0
+        for start, end, kind, a, b in self.motions:
+            if not start <= t < end:
+                continue
+            phase = (t - start) / (end - start)
+            if kind == SHAKE:
+                ax += b * G * math.sin(2 * math.pi * a * (t - start))
+                gy += 200 * DPS * math.cos(2 * math.pi * a * (t - start))
+            elif kind == TWIST:
+                gz += a * DPS * math.sin(math.pi * phase)
+            elif kind == TILT:
+                # Ramp over, hold, ramp back
+                level = min(1.0, phase * 4, (1 - phase) * 4)
+                roll += math.radians(a) * level
+        noise = self.rng.randint
+        return (
+            ax + noise(-200, 200),
+            ay + G * math.sin(roll) + noise(-200, 200),
+            G * math.cos(roll) + noise(-200, 200),
+            gx + noise(-40, 40),
+            gy + noise(-40, 40),
+            gz + noise(-40, 40),
+        )
+
+
+class Player(object):
+    """
+    Reads the simulated LCD and answers each new prompt after reaction_s.
+    With accuracy below 1 some answers are deliberately wrong. Starts a game
+    by touching whenever the idle screen is showing, if start is set.
+    """
+
+    PROMPTS = {
+        "BEEP IT!": TOUCH,
+        "FLICK IT!": FLICK,
+        "SHAKE IT!": SHAKE,
+        "SLIDE IT!": SLIDE,
+        "TWIST IT!": TWIST,
+        "TILT IT!": TILT,
+    }
+
+    def __init__(self, script, lcd, reaction_s=0.4, accuracy=1.0, start=True, seed=0):
+        self.script = script
+        self.lcd = lcd
+        self.reaction_s = reaction_s
+        self.accuracy = accuracy
+        self.start = start
+        self.rng = random.Random(seed)
+        self.answers = 0
+        self.wrong_answers = 0
+        self._last_text = None
+        self._busy_until = 0.0
+
+    def __call__(self, now_us):
+        t = now_us / 1000000
+        lines = self.lcd.lines()
+        screen = "\n".join(lines)
+        if screen == self._last_text or t < self._busy_until:
+            return
+        self._last_text = screen
+        text = lines[0].rstrip("#\u2192 ").strip()  # Without the prompt's icon
+        if self.start and "beep to start" in screen.lower():
+            # Held until noticed, the idle screen only polls once a second
+            self.script.touch(t + self.reaction_s, duration=1.2)
+            self._busy_until = t + self.reaction_s + 1.5
+            return
+        gesture = self.PROMPTS.get(text)
+        if gesture is None:
+            return
+        if self.rng.random() >= self.accuracy:
+            gesture = self.rng.choice([g for g in GESTURES if g != gesture])
+            self.wrong_answers += 1
+        self.answers += 1
+        self.script.gesture(gesture, t + self.reaction_s)
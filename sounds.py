@@ -1,133 +1,151 @@
+# sounds.py Buzzer tones and the game's songs
+#
+# Frequencies are in Hz and durations in ms: playtone(buzzer, 440, 200).
+# Before precompiled builds, notes were looked up by name in a TONES dict
+# and durations were in seconds, as in playtone(buzzer, TONES["A4"], 0.2)
+# or playsweep(buzzer, "A4", "E4", 0.3). That dict was built in RAM on every
+# import and is gone; the note constants below only exist inside this module,
+# so callers pass frequencies.
+
 import time
+from micropython import const
 
-TONES = {
-  "B0": 31,
-  "C1": 33,
-  "CS1": 35,
-  "D1": 37,
-  "DS1": 39,
-  "E1": 41,
-  "F1": 44,
-  "FS1": 46,
-  "G1": 49,
-  "GS1": 52,
-  "A1": 55,
-  "AS1": 58,
-  "B1": 62,
-  "C2": 65,
-  "CS2": 69,
-  "D2": 73,
-  "DS2": 78,
-  "E2": 82,
-  "F2": 87,
-  "FS2": 93,
-  "G2": 98,
-  "GS2": 104,
-  "A2": 110,
-  "AS2": 117,
-  "B2": 123,
-  "C3": 131,
-  "CS3": 139,
-  "D3": 147,
-  "DS3": 156,
-  "E3": 165,
-  "F3": 175,
-  "FS3": 185,
-  "G3": 196,
-  "GS3": 208,
-  "A3": 220,
-  "AS3": 233,
-  "B3": 247,
-  "C4": 262,
-  "CS4": 277,
-  "D4": 294,
-  "DS4": 311,
-  "E4": 330,
-  "F4": 349,
-  "FS4": 370,
-  "G4": 392,
-  "GS4": 415,
-  "A4": 440,
-  "AS4": 466,
-  "B4": 494,
-  "C5": 523,
-  "CS5": 554,
-  "D5": 587,
-  "DS5": 622,
-  "E5": 659,
-  "F5": 698,
-  "FS5": 740,
-  "G5": 784,
-  "GS5": 831,
-  "A5": 880,
-  "AS5": 932,
-  "B5": 988,
-  "C6": 1047,
-  "CS6": 1109,
-  "D6": 1175,
-  "DS6": 1245,
-  "E6": 1319,
-  "F6": 1397,
-  "FS6": 1480,
-  "G6": 1568,
-  "GS6": 1661,
-  "A6": 1760,
-  "AS6": 1865,
-  "B6": 1976,
-  "C7": 2093,
-  "CS7": 2217,
-  "D7": 2349,
-  "DS7": 2489,
-  "E7": 2637,
-  "F7": 2794,
-  "FS7": 2960,
-  "G7": 3136,
-  "GS7": 3322,
-  "A7": 3520,
-  "AS7": 3729,
-  "B7": 3951,
-  "C8": 4186,
-  "CS8": 4435,
-  "D8": 4699,
-  "DS8": 4978
-}
+# Note frequencies in Hz. Consts with a leading underscore are replaced by
+# their values when the module is compiled, so the songs below are tuples of
+# plain integers and nothing is built for the notes on import.
+_B0 = const(31)
+_C1 = const(33)
+_CS1 = const(35)
+_D1 = const(37)
+_DS1 = const(39)
+_E1 = const(41)
+_F1 = const(44)
+_FS1 = const(46)
+_G1 = const(49)
+_GS1 = const(52)
+_A1 = const(55)
+_AS1 = const(58)
+_B1 = const(62)
+_C2 = const(65)
+_CS2 = const(69)
+_D2 = const(73)
+_DS2 = const(78)
+_E2 = const(82)
+_F2 = const(87)
+_FS2 = const(93)
+_G2 = const(98)
+_GS2 = const(104)
+_A2 = const(110)
+_AS2 = const(117)
+_B2 = const(123)
+_C3 = const(131)
+_CS3 = const(139)
+_D3 = const(147)
+_DS3 = const(156)
+_E3 = const(165)
+_F3 = const(175)
+_FS3 = const(185)
+_G3 = const(196)
+_GS3 = const(208)
+_A3 = const(220)
+_AS3 = const(233)
+_B3 = const(247)
+_C4 = const(262)
+_CS4 = const(277)
+_D4 = const(294)
+_DS4 = const(311)
+_E4 = const(330)
+_F4 = const(349)
+_FS4 = const(370)
+_G4 = const(392)
+_GS4 = const(415)
+_A4 = const(440)
+_AS4 = const(466)
+_B4 = const(494)
+_C5 = const(523)
+_CS5 = const(554)
+_D5 = const(587)
+_DS5 = const(622)
+_E5 = const(659)
+_F5 = const(698)
+_FS5 = const(740)
+_G5 = const(784)
+_GS5 = const(831)
+_A5 = const(880)
+_AS5 = const(932)
+_B5 = const(988)
+_C6 = const(1047)
+_CS6 = const(1109)
+_D6 = const(1175)
+_DS6 = const(1245)
+_E6 = const(1319)
+_F6 = const(1397)
+_FS6 = const(1480)
+_G6 = const(1568)
+_GS6 = const(1661)
+_A6 = const(1760)
+_AS6 = const(1865)
+_B6 = const(1976)
+_C7 = const(2093)
+_CS7 = const(2217)
+_D7 = const(2349)
+_DS7 = const(2489)
+_E7 = const(2637)
+_F7 = const(2794)
+_FS7 = const(2960)
+_G7 = const(3136)
+_GS7 = const(3322)
+_A7 = const(3520)
+_AS7 = const(3729)
+_B7 = const(3951)
+_C8 = const(4186)
+_CS8 = const(4435)
+_D8 = const(4699)
+_DS8 = const(4978)
 
+NOTE_MS = 200   # Length of a single note
+DUTY = 16384    # 25% duty cycle
+
+# Each song is a tuple of notes: a frequency, or a (start, end, ms) sweep
 INSTRUCTION_TONES = {
-  "BEEP IT!": ["G6", "C4"],
-  "FLICK IT!": [("G4", "D5", 0.2)],
-  "SHAKE IT!": ["E5", "C5", "G4"],
-  "SLIDE IT!": [("D4", "A4", 0.3)],
-  "GAME_START": ["C5", "G4", "E4", "A4", "B4", "G4"],
-  "SUCCESS": [("DS5", "D6", 0.3)],
-  "FAILURE": [("D6", 'DS3', 0.3)]
+  "BEEP IT!": (_G6, _C4),
+  "FLICK IT!": ((_G4, _D5, 200),),
+  "SHAKE IT!": (_E5, _C5, _G4),
+  "SLIDE IT!": ((_D4, _A4, 300),),
+  "TWIST IT!": ((_C5, _G5, 150), (_G5, _C5, 150)),
+  "TILT IT!": (_A4, (_A4, _E4, 300)),
+  "GAME_START": (_C5, _G4, _E4, _A4, _B4, _G4),
+  "SUCCESS": ((_DS5, _D6, 300),),
+  "FAILURE": ((_D6, _DS3, 300),)
 }
 
-def playtone(buzzer, frequency, duration=0.2):
+def _play(buzzer, frequency, duration_us):
     if frequency > 0:
         buzzer.freq(frequency)
-        buzzer.duty_u16(16384)  # 25% duty cycle
-        time.sleep(duration)
+        buzzer.duty_u16(DUTY)
+        time.sleep_us(duration_us)
     bequiet(buzzer)
 
-def playsweep(buzzer, start_tone, end_tone, duration=0.3, steps=20):
-    """Sweeps the buzzer from start_tone to end_tone smoothly."""
-    start_freq = TONES.get(start_tone, 0)
-    end_freq = TONES.get(end_tone, 0)
-    step_delay = duration / steps
-    freq_step = (end_freq - start_freq) / steps
+def playtone(buzzer, frequency, duration_ms=NOTE_MS):
+    """Plays frequency Hz for duration_ms milliseconds."""
+    _play(buzzer, frequency, duration_ms * 1000)
 
+def playsweep(buzzer, start_freq, end_freq, duration_ms=300, steps=20):
+    """Sweeps the buzzer from start_freq to end_freq smoothly."""
+    step_us = duration_ms * 1000 // steps
     for i in range(steps):
-        freq = int(start_freq + (i * freq_step))
-        playtone(buzzer, freq, step_delay)
+        _play(buzzer, start_freq + (end_freq - start_freq) * i // steps, step_us)
 
 def bequiet(buzzer):
     buzzer.duty_u16(0)
 
 def playsong(buzzer, song_name):
-    song = INSTRUCTION_TONES[song_name]
+    play(buzzer, INSTRUCTION_TONES[song_name])
+
+def play(buzzer, song):
+    """Plays a song tuple, such as a value of INSTRUCTION_TONES."""
     for note in song:
         if isinstance(note, tuple):
             playsweep(buzzer, *note)
         else:
-            frequency = TONES.get(note, 0)
-            playtone(buzzer, frequency)
+            playtone(buzzer, note)
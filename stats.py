@@ -0,0 +1,218 @@
+# stats.py Game statistics kept on flash
+#
+# High score, games played, answer counts and a reaction time histogram per
+# action, in two fixed size arrays that updates change in place. They are
+# saved whole, header first, to one of two files in turn: each save goes to
+# the file holding the older copy, so a reset part way through a write can
+# only lose the newest changes, never everything. The header has a sequence
+# number and a checksum of the data, and loading takes the newest file whose
+# checksum matches. Saves are batched: service() writes only once one has
+# been asked for, as at game over, or interval_ms after the last one.
+#
+# File layout, little endian:
+#   header   "<4sHHII" magic b"BSTS", version, data bytes, sequence, checksum
+#   counters COUNTERS "I" words, indexed by the STAT_ constants
+#   reaction actions * bins "H" counts, action by action, bins of bin_ms
+#            (the last counts everything slower)
+
+import struct
+from array import array
+from utime import ticks_ms, ticks_diff
+
+MAGIC = b"BSTS"
+VERSION = 1
+HEADER = "<4sHHII"
+HEADER_SIZE = 16
+
+STAT_GAMES = 0
+STAT_HIGH_SCORE = 1
+STAT_CORRECT = 2
+STAT_WRONG = 3
+STAT_TOO_SLOW = 4
+COUNTERS = 5
+
+
+def _checksum(sequence, counters, reaction):
+    # Adler-32 over the values rather than the bytes, starting from the
+    # sequence number so a header from one save and data from another
+    # don't match
+    a = 1 + sequence % 65521
+    b = 0
+    for value in counters:
+        a = (a + value) % 65521
+        b = (b + a) % 65521
+    for value in reaction:
+        a = (a + value) % 65521
+        b = (b + a) % 65521
+    return b << 16 | a
+
+
+class StatsStore(object):
+    """
+    Statistics for actions numbered 0 to actions - 1, saved as prefix0.bin
+    and prefix1.bin
+    """
+
+    def __init__(self, actions, bins=16, bin_ms=200, interval_ms=300000, prefix="stats"):
+        self.actions = actions
+        self.bins = bins
+        self.bin_ms = bin_ms
+        self.interval_ms = interval_ms
+        self.paths = (prefix + "0.bin", prefix + "1.bin")
+        # "I" rather than "L", which is 8 bytes on 64 bit hosts
+        self.counters = array("I", [0] * COUNTERS)
+        self.reaction = array("H", [0] * (actions * bins))
+        self.size = 4 * COUNTERS + 2 * len(self.reaction)
+        self._header = bytearray(HEADER_SIZE)
+        self.sequence = 0     # Of the newest save
+        self.dirty = False    # Changed since the last save
+        self._due = False     # Save at the next service()
+        self._saved = ticks_ms()
+        self.saves = 0
+        self.new_high_score = False  # Set by the last game_over()
+
+    def _read_header(self, path):
+        """
+        (sequence, checksum) of path, or None if it isn't a stats file of
+        this layout
+        """
+        try:
+            with open(path, "rb") as f:
+                if f.readinto(self._header) != HEADER_SIZE:
+                    return None
+        except OSError:
+            return None
+        magic, version, size, sequence, checksum = struct.unpack(HEADER, self._header)
+        if magic != MAGIC or version != VERSION or size != self.size:
+            return None
+        return sequence, checksum
+
+    def _read_data(self, path, sequence, checksum):
+        try:
+            with open(path, "rb") as f:
+                f.seek(HEADER_SIZE)
+                if f.readinto(self.counters) + f.readinto(self.reaction) != self.size:
+                    return False
+        except OSError:
+            return False
+        return _checksum(sequence, self.counters, self.reaction) == checksum
+
+    def load(self):
+        """
+        Read the newest good copy. Returns False, and starts from zero, if
+        there is none.
+        """
+        headers = [self._read_header(path) for path in self.paths]
+        order = (1, 0) if headers[1] and (not headers[0] or headers[1][0] > headers[0][0]) else (0, 1)
+        for slot in order:
+            header = headers[slot]
+            if header and self._read_data(self.paths[slot], header[0], header[1]):
+                self.sequence = header[0]
+                return True
+        self.clear()
+        self.sequence = 0
+        self.dirty = False
+        return False
+
+    def clear(self):
+        for i in range(COUNTERS):
+            self.counters[i] = 0
+        for i in range(len(self.reaction)):
+            self.reaction[i] = 0
+        self.dirty = True
+
+    def count(self, stat):
+        self.counters[stat] += 1
+        self.dirty = True
+
+    def correct(self, action, reaction_ms):
+        """
+        A correct answer to action after reaction_ms
+        """
+        self.counters[STAT_CORRECT] += 1
+        step = reaction_ms // self.bin_ms
+        if step >= self.bins:
+            step = self.bins - 1
+        elif step < 0:
+            step = 0
+        i = action * self.bins + step
+        if self.reaction[i] < 0xFFFF:
+            self.reaction[i] += 1
+        self.dirty = True
+
+    def game_over(self, score):
+        """
+        Count a game and save at the next service(). Returns True for a new
+        high score.
+        """
+        self.counters[STAT_GAMES] += 1
+        best = score > self.counters[STAT_HIGH_SCORE]
+        if best:
+            self.counters[STAT_HIGH_SCORE] = score
+        self.new_high_score = best
+        self.dirty = True
+        self._due = True
+        return best
+
+    def service(self):
+        """
+        Save if a save is due. Call when the loop has time to spare.
+        Returns True if it saved.
+        """
+        if not self.dirty or not (self._due or ticks_diff(ticks_ms(), self._saved) >= self.interval_ms):
+            return False
+        self.save()
+        return True
+
+    def save(self):
+        sequence = self.sequence + 1
+        struct.pack_into(HEADER, self._header, 0, MAGIC, VERSION, self.size, sequence,
+                         _checksum(sequence, self.counters, self.reaction))
+        with open(self.paths[sequence & 1], "wb") as f:
+            f.write(self._header)
+            f.write(self.counters)
+            f.write(self.reaction)
+        self.sequence = sequence
+        self.dirty = False
+        self._due = False
+        self._saved = ticks_ms()
+        self.saves += 1
+
+    def percentile(self, action, percent):
+        """
+        Upper edge in ms of the bin holding the percent'th percentile of
+        action's reaction times, or -1 without any
+        """
+        start = action * self.bins
+        total = 0
+        for i in range(start, start + self.bins):
+            total += self.reaction[i]
+        if not total:
+            return -1
+        seen = 0
+        for i in range(self.bins):
+            seen += self.reaction[start + i]
+            if 100 * seen >= percent * total:
+                return (i + 1) * self.bin_ms
+        return self.bins * self.bin_ms
+
+    def report(self, names):
+        """
+        Print the counters and, for each action in names, its reaction time
+        median and 90th percentile
+        """
+        counters = self.counters
+        print("games %d, high score %d%s" % (counters[STAT_GAMES], counters[STAT_HIGH_SCORE],
+                                             " (set by the last game)" if self.new_high_score else ""))
+        print("answers %d correct, %d wrong, %d too slow" % (
+            counters[STAT_CORRECT], counters[STAT_WRONG], counters[STAT_TOO_SLOW]))
+        print("%-8s %6s %8s %8s" % ("reaction", "count", "median", "p90"))
+        for action in range(self.actions):
+            start = action * self.bins
+            total = 0
+            for i in range(start, start + self.bins):
+                total += self.reaction[i]
+            if total:
+                print("%-8s %6d %6d ms %6d ms" % (names[action], total, self.percentile(action, 50),
+                                                  self.percentile(action, 90)))
+        print("saved %d times, copy %d%s" % (self.saves, self.sequence, " (unsaved changes)" if self.dirty else ""))
@@ -0,0 +1,158 @@
+# telemetry.py Framed binary sensor stream over the USB serial port
+#
+# Streams raw samples with timestamps at full rate for plotting and offline
+# analysis on a computer (tools/decode_telemetry.py). Every IMU sample
+# drained from the FIFO is sent, and a timer samples the joystick, slider
+# and touch sensor at a fixed rate. Frames are built in a preallocated
+# buffer and written in large chunks when the loop is idle.
+#
+# Frame, 21 bytes, little endian:
+#   0xA5 0x5A  sync
+#   type       TM_IMU or TM_INPUTS
+#   seq        increments by one per frame, so the host can count drops
+#   ticks_us   "<I" time of the sample, wraps at 2**30
+#   payload    12 bytes
+#   checksum   sum of type, seq, ticks and payload bytes, modulo 256
+# Payloads:
+#   TM_IMU     the 12 raw big endian FIFO bytes: accel x, y, z, gyro x, y, z
+#   TM_INPUTS  "<HHHH" joystick x, joystick y, slider, touch level
+#
+# Text printed while streaming ends up between frames; the decoder skips
+# anything that isn't a frame with a good checksum.
+
+import sys
+from array import array
+from machine import Timer
+from utime import ticks_us
+
+SYNC0 = 0xA5
+SYNC1 = 0x5A
+FRAME_SIZE = 21
+PAYLOAD_SIZE = 12
+TM_IMU = 1
+TM_INPUTS = 2
+
+INPUT_RING = 128         # Timer samples held until the loop sends them
+
+
+class Telemetry(object):
+    """
+    Buffers frames and writes them to stream, the USB serial port by
+    default. samples_dropped counts timer samples lost because the loop
+    didn't collect them in time, for example while a song played.
+    """
+
+    def __init__(self, stream=None, buffer_size=1029):
+        if stream is None:
+            stream = getattr(sys.stdout, "buffer", sys.stdout)
+        self.stream = stream
+        self._buf = bytearray(buffer_size - buffer_size % FRAME_SIZE)
+        self._view = memoryview(self._buf)
+        self._offset = 0
+        self.seq = 0
+        self.frames = 0
+        self.samples_dropped = 0
+        # Filled by the sampling timer, emptied by collect()
+        self._ring_ticks = array("L", [0] * INPUT_RING)
+        self._ring = array("H", [0] * (4 * INPUT_RING))
+        self._head = 0
+        self._tail = 0
+        self._inputs = None
+        self._timer = None
+
+    def _begin(self, kind, ticks):
+        """
+        Offset of a new frame's payload, after writing its header
+        """
+        if self._offset + FRAME_SIZE > len(self._buf):
+            self.flush()
+        o = self._offset
+        buf = self._buf
+        buf[o] = SYNC0
+        buf[o + 1] = SYNC1
+        buf[o + 2] = kind
+        buf[o + 3] = self.seq
+        buf[o + 4] = ticks & 0xFF
+        buf[o + 5] = ticks >> 8 & 0xFF
+        buf[o + 6] = ticks >> 16 & 0xFF
+        buf[o + 7] = ticks >> 24 & 0xFF
+        self.seq = (self.seq + 1) & 0xFF
+        return o + 8
+
+    def _end(self, payload):
+        buf = self._buf
+        o = payload - 8
+        total = 0
+        for i in range(o + 2, payload + PAYLOAD_SIZE):
+            total += buf[i]
+        buf[payload + PAYLOAD_SIZE] = total & 0xFF
+        self._offset = o + FRAME_SIZE
+        self.frames += 1
+
+    def imu(self, buf, nbytes):
+        """
+        Send nbytes of raw FIFO data (whole 12 byte samples) from buf. The
+        samples were taken 1/rate apart ending about now, but they are all
+        stamped with the time they were read.
+        """
+        now = ticks_us()
+        for i in range(0, nbytes - nbytes % 12, 12):
+            p = self._begin(TM_IMU, now)
+            out = self._buf
+            for j in range(12):
+                out[p + j] = buf[i + j]
+            self._end(p)
+
+    def start_sampling(self, x, y, slider, touch, rate):
+        """
+        Sample the joystick and slider ADCs and the touch pin rate times a
+        second from a timer. The samples are sent by collect().
+        """
+        self._inputs = (x, y, slider, touch)
+        self._timer = Timer(-1, mode=Timer.PERIODIC, freq=rate, callback=self._sample)
+
+    def stop_sampling(self):
+        if self._timer is not None:
+            self._timer.deinit()
+            self._timer = None
+
+    def _sample(self, timer):
+        head = self._head
+        following = (head + 1) % INPUT_RING
+        if following == self._tail:
+            self.samples_dropped += 1
+            return
+        x, y, slider, touch = self._inputs
+        ring = self._ring
+        self._ring_ticks[head] = ticks_us()
+        ring[4 * head] = x.read_u16()
+        ring[4 * head + 1] = y.read_u16()
+        ring[4 * head + 2] = slider.read_u16()
+        ring[4 * head + 3] = touch.value()
+        self._head = following
+
+    def collect(self):
+        """
+        Turn the timer's samples into frames
+        """
+        ring = self._ring
+        while self._tail != self._head:
+            t = self._tail
+            p = self._begin(TM_INPUTS, self._ring_ticks[t])
+            out = self._buf
+            for i in range(4):
+                value = ring[4 * t + i]
+                out[p + 2 * i] = value & 0xFF
+                out[p + 2 * i + 1] = value >> 8
+            for i in range(p + 8, p + PAYLOAD_SIZE):
+                out[i] = 0
+            self._end(p)
+            self._tail = (t + 1) % INPUT_RING
+
+    def flush(self):
+        """
+        Write out everything buffered. Call when the loop is idle.
+        """
+        if self._offset:
+            self.stream.write(self._view[:self._offset])
+            self._offset = 0
@@ -0,0 +1,219 @@
+# timerwheel.py Deadlines for a fixed set of timers, checked in O(1) per tick
+#
+# A hashed timing wheel: time is cut into ticks of tick_ms and each timer
+# sits in the slot of the tick it expires on, with a count of the whole
+# turns of the wheel still to go. Advancing one tick only looks at the
+# timers in one slot, however many timers there are or however far away
+# their deadlines. Timers are numbered 0 to count - 1 and live in
+# preallocated arrays, so starting, cancelling and expiring them allocates
+# nothing. Time is kept in microseconds, so a deadline doesn't move by a
+# tick depending on where in a millisecond it was set.
+#
+#   timers.start(TIMER_ACTION, 3000)
+#   ...
+#   timers.advance()
+#   while True:
+#       timer = timers.expired()
+#       if timer < 0:
+#           break
+#       ...
+
+from array import array
+
+try:
+    from utime import ticks_us, ticks_add, ticks_diff
+except ImportError:
+    from time import monotonic_ns
+
+    def ticks_us():
+        return monotonic_ns() // 1000
+
+    def ticks_add(ticks, delta):
+        return ticks + delta
+
+    def ticks_diff(new, old):
+        return new - old
+
+IDLE = 0        # Not started, cancelled or handled
+RUNNING = 1     # Waiting in its slot
+EXPIRED = 2     # Queued for expired()
+
+
+class TimerWheel(object):
+    """
+    count timers on a wheel of slots ticks of tick_ms each. Deadlines are
+    rounded up to whole ticks, and further away than one turn of the wheel
+    (slots * tick_ms) costs one extra look per turn.
+    """
+
+    def __init__(self, count, tick_ms=10, slots=64):
+        if slots & (slots - 1):
+            raise ValueError("slots must be a power of two")
+        self.count = count
+        self.tick_ms = tick_ms
+        self._tick_us = tick_ms * 1000
+        self.slots = slots
+        self._mask = slots - 1
+        self._head = array("b", [-1] * slots)
+        self._next = array("b", [-1] * count)
+        self._prev = array("b", [-1] * count)
+        self._slot = array("H", [0] * count)
+        self._rounds = array("H", [0] * count)
+        self._state = bytearray(count)
+        # Expired timers in order. cancel() takes a timer out, so each is
+        # in it at most once
+        self._queue = bytearray(count)
+        self._queue_head = 0
+        self._queue_len = 0
+        self._running = 0
+        self._position = 0
+        self._last = ticks_us()   # Time of the tick at _position
+
+    def _link(self, timer, slot):
+        head = self._head[slot]
+        self._next[timer] = head
+        self._prev[timer] = -1
+        if head >= 0:
+            self._prev[head] = timer
+        self._head[slot] = timer
+        self._slot[timer] = slot
+
+    def _unlink(self, timer):
+        before = self._prev[timer]
+        after = self._next[timer]
+        if before >= 0:
+            self._next[before] = after
+        else:
+            self._head[self._slot[timer]] = after
+        if after >= 0:
+            self._prev[after] = before
+
+    def start(self, timer, ms):
+        """
+        Expire timer ms from now, replacing any deadline it already had
+        """
+        self.cancel(timer)
+        now = ticks_us()
+        if not self._running and not self._queue_len:
+            # Nothing to catch up on, so the ticks can start from now, and
+            # a deadline is counted from the event that set it rather than
+            # from wherever the ticks happened to fall
+            self._last = now
+        ticks = (ms * 1000 + ticks_diff(now, self._last) + self._tick_us - 1) // self._tick_us
+        if ticks < 1:
+            ticks = 1
+        self._link(timer, (self._position + ticks) & self._mask)
+        self._rounds[timer] = (ticks - 1) // self.slots
+        self._state[timer] = RUNNING
+        self._running += 1
+
+    def cancel(self, timer):
+        state = self._state[timer]
+        if state == RUNNING:
+            self._unlink(timer)
+            self._running -= 1
+        elif state == EXPIRED:
+            self._dequeue(timer)
+        self._state[timer] = IDLE
+
+    def _dequeue(self, timer):
+        # Close the gap timer leaves, keeping the others in order
+        queue = self._queue
+        size = len(queue)
+        head = self._queue_head
+        kept = 0
+        for i in range(self._queue_len):
+            entry = queue[(head + i) % size]
+            if entry != timer:
+                queue[(head + kept) % size] = entry
+                kept += 1
+        self._queue_len = kept
+
+    def pending(self, timer):
+        """
+        True while timer is running or has expired but not been handled
+        """
+        return self._state[timer] != IDLE
+
+    def advance(self):
+        """
+        Move the wheel up to now, queueing every timer that has expired.
+        Returns how many were queued.
+        """
+        return self._catch_up(ticks_us())
+
+    def _expire(self, timer):
+        self._unlink(timer)
+        self._running -= 1
+        self._state[timer] = EXPIRED
+        self._queue[(self._queue_head + self._queue_len) % len(self._queue)] = timer
+        self._queue_len += 1
+
+    def _catch_up(self, now):
+        ticks = ticks_diff(now, self._last) // self._tick_us
+        if ticks <= 0:
+            return 0
+        self._last = ticks_add(self._last, ticks * self._tick_us)
+        if not self._running:
+            self._position = (self._position + ticks) & self._mask
+            return 0
+        queued = 0
+        if ticks > self.slots:
+            # After a long stall, such as a blocking song, whole turns of
+            # the wheel are settled in one pass over the timers instead of
+            # slot by slot
+            turns = (ticks - 1) // self.slots
+            ticks -= turns * self.slots
+            for timer in range(self.count):
+                if self._state[timer] == RUNNING:
+                    rounds = self._rounds[timer]
+                    if rounds >= turns:
+                        self._rounds[timer] = rounds - turns
+                    else:
+                        self._expire(timer)
+                        queued += 1
+        for _ in range(ticks):
+            position = self._position = (self._position + 1) & self._mask
+            timer = self._head[position]
+            while timer >= 0:
+                following = self._next[timer]
+                if self._rounds[timer]:
+                    self._rounds[timer] -= 1
+                else:
+                    self._expire(timer)
+                    queued += 1
+                timer = following
+        return queued
+
+    def expired(self):
+        """
+        The next expired timer, oldest first, or -1 when there are none
+        """
+        if not self._queue_len:
+            return -1
+        timer = self._queue[self._queue_head]
+        self._queue_head = (self._queue_head + 1) % len(self._queue)
+        self._queue_len -= 1
+        self._state[timer] = IDLE
+        return timer
+
+    def ms_until_next(self, limit_ms):
+        """
+        Milliseconds until the next timer expires, or limit_ms if none does
+        before then. Looks at the slots up to limit_ms ahead.
+        """
+        if self._queue_len:
+            return 0
+        if not self._running:
+            return limit_ms
+        late = ticks_diff(ticks_us(), self._last)
+        for ahead in range(1, min(limit_ms // self.tick_ms + 2, self.slots + 1)):
+            timer = self._head[(self._position + ahead) & self._mask]
+            while timer >= 0:
+                if not self._rounds[timer]:
+                    wait = (ahead * self._tick_us - late + 999) // 1000
+                    if wait < 0:
+                        return 0
+                    return wait if wait < limit_ms else limit_ms
+                timer = self._next[timer]
+        return limit_ms
@@ -0,0 +1,101 @@
+# bench_import.py Time and heap cost of importing the game's modules
+#
+# Runs on the Pico or the host:
+#   mpremote run tools/bench_import.py
+#   python3 tools/bench_import.py
+# On the Pico, run it with the sources installed and again after
+# tools/build_mpy.py --deploy (or with frozen firmware) to see what
+# precompiling saves. On the host the simulator stands in for the hardware
+# modules and the numbers are CPython's: good for comparing one version of a
+# module with another, not .py with .mpy.
+#
+# Modules are imported one at a time in dependency order, so each line is
+# mostly that module's own cost. "used" is what the import allocated, "kept"
+# what is still allocated after a collection: the module's code and data.
+
+import gc
+import sys
+
+try:
+    from utime import ticks_us, ticks_diff
+    import os
+
+    def heap_used():
+        return gc.mem_alloc()
+
+    def heap_peak():
+        return gc.mem_alloc()  # Nothing is freed until the next collection
+
+    def reset_peak():
+        pass
+
+    def has_file(name):
+        try:
+            os.stat(name)
+            return True
+        except OSError:
+            return False
+except ImportError:
+    import os
+    import tracemalloc
+    from time import perf_counter_ns
+
+    def ticks_us():
+        return perf_counter_ns() // 1000
+
+    def ticks_diff(new, old):
+        return new - old
+
+    def heap_used():
+        return tracemalloc.get_traced_memory()[0]
+
+    def heap_peak():
+        return tracemalloc.get_traced_memory()[1]
+
+    def reset_peak():
+        tracemalloc.reset_peak()
+
+    def has_file(name):
+        return os.path.exists(name)
+
+    ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+    sys.path.insert(0, ROOT)
+    from sim import Simulation
+    Simulation(flash_dir=os.getcwd()).install()
+    tracemalloc.start()
+
+MODULES = ("vector3d", "imu", "lcd_api", "i2c_lcd", "sounds", "gesture_model", "gestures",
+           "orientation", "detectors", "glyphs", "console", "i2c_profile", "i2c_arbiter", "looptimer",
+           "stats", "heapcheck", "eventlog", "recorder", "replay", "telemetry")
+
+
+def measure(name):
+    gc.collect()
+    before = heap_used()
+    reset_peak()
+    start = ticks_us()
+    __import__(name)
+    elapsed = ticks_diff(ticks_us(), start)
+    used = heap_peak() - before
+    gc.collect()
+    kept = heap_used() - before
+    return elapsed, used, kept
+
+
+def main():
+    # After tools/build_mpy.py main.py is a stub that starts the game, and
+    # the game itself is beepit
+    game = "beepit" if has_file("beepit.mpy") else "main"
+    print("%-14s %9s %9s %9s" % ("module", "us", "used", "kept"))
+    totals = [0, 0, 0]
+    for name in MODULES + (game,):
+        if name in sys.modules:
+            continue  # Already imported by an earlier module
+        result = measure(name)
+        for i in range(3):
+            totals[i] += result[i]
+        print("%-14s %9d %9d %9d" % ((name,) + result))
+    print("%-14s %9d %9d %9d" % tuple(["total"] + totals))
+
+
+main()
@@ -0,0 +1,60 @@
+# bench_orientation.py Check the orientation filter keeps up with the IMU
+#
+# Runs on the Pico or the host:
+#   mpremote cp orientation.py : + run tools/bench_orientation.py
+#   python3 tools/bench_orientation.py
+# Feeds FIFO sized bursts of synthetic samples through Orientation.feed_fifo
+# and reports the sustained sample rate against the 200 Hz the IMU produces.
+
+import sys
+
+try:
+    from utime import ticks_us, ticks_diff
+except ImportError:
+    import os
+    from time import perf_counter_ns
+
+    def ticks_us():
+        return perf_counter_ns() // 1000
+
+    def ticks_diff(new, old):
+        return new - old
+
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from orientation import Orientation, SAMPLE_RATE, SAMPLE_BYTES
+
+BURST = 20     # Samples drained per 100 ms game loop iteration
+BURSTS = 50
+
+
+def make_burst():
+    buf = bytearray(BURST * SAMPLE_BYTES)
+    for n in range(BURST):
+        values = (1200 + n * 37, -800, 16000, 300 - n * 11, -150, 2000)
+        for i, v in enumerate(values):
+            v &= 0xFFFF
+            buf[n * SAMPLE_BYTES + 2 * i] = v >> 8
+            buf[n * SAMPLE_BYTES + 2 * i + 1] = v & 0xFF
+    return buf
+
+
+def main():
+    orientation = Orientation()
+    buf = make_burst()
+    worst = 0
+    start = ticks_us()
+    for _ in range(BURSTS):
+        t = ticks_us()
+        orientation.feed_fifo(buf, len(buf))
+        worst = max(worst, ticks_diff(ticks_us(), t))
+    total = ticks_diff(ticks_us(), start)
+    samples = BURST * BURSTS
+    rate = samples * 1000000 // max(total, 1)
+    print("samples:", samples, "total us:", total)
+    print("per sample us:", total // samples, "worst burst us:", worst)
+    print("sustained rate:", rate, "Hz, needs", SAMPLE_RATE, "Hz:", "OK" if rate >= SAMPLE_RATE else "TOO SLOW")
+    print("pitch %d roll %d yaw rate %d" % (orientation.pitch, orientation.roll, orientation.yaw_rate))
+
+
+main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""Precompile the game for the Pico, or stage it for freezing into firmware.
+
+Every module copied to the Pico as source is compiled on each boot, which
+takes time and enough RAM to fragment the heap. Compiled .mpy files skip
+that, and frozen modules also run their bytecode and constant data straight
+from flash.
+
+    python3 tools/build_mpy.py                  # build/mpy/*.mpy
+    python3 tools/build_mpy.py --deploy         # ... and copy them over with mpremote
+    python3 tools/build_mpy.py --freeze         # build/frozen/ and its manifest.py
+
+main.py can't be compiled under its own name, since the Pico only runs a
+main.py source file at boot, so it becomes beepit.mpy and a two line main.py
+starts it. The .mpy files need mpy-cross from the same MicroPython release
+as the firmware (pip install mpy-cross==<version>). Settings such as
+REPLAY_PATH are baked into beepit.mpy, so rebuild after changing them.
+
+For firmware, build MicroPython with the staged manifest:
+    make -C ports/rp2 BOARD=RPI_PICO FROZEN_MANIFEST=<repo>/build/frozen/manifest.py
+and replace the sources on the Pico with build/frozen/main.py. Measure with
+tools/bench_import.py.
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+GAME_MODULE = "beepit"   # What main.py is compiled as
+
+STUB = """# main.py Starts the precompiled game in {0} (see tools/build_mpy.py)
+from {0} import main
+main()
+""".format(GAME_MODULE)
+
+MANIFEST = """# manifest.py Generated by tools/build_mpy.py --freeze
+include("$(PORT_DIR)/boards/manifest.py")
+"""
+
+
+def modules():
+    """
+    (source path, module name) of everything that runs on the Pico
+    """
+    found = []
+    for name in sorted(os.listdir(ROOT)):
+        if name.endswith(".py"):
+            module = name[:-3]
+            found.append((os.path.join(ROOT, name), GAME_MODULE if module == "main" else module))
+    return found
+
+
+def compile_all(out, mpy_cross, opt):
+    if os.path.isdir(out):
+        shutil.rmtree(out)
+    os.makedirs(out)
+    total_source = total_mpy = 0
+    for source, module in modules():
+        target = os.path.join(out, module + ".mpy")
+        command = mpy_cross + ["-O%d" % opt, "-march=armv6m", "-s", module + ".py", "-o", target, source]
+        try:
+            subprocess.run(command, check=True)
+        except FileNotFoundError:
+            sys.exit("%s not found: pip install mpy-cross, or pass --mpy-cross" % mpy_cross[0])
+        source_size = os.path.getsize(source)
+        mpy_size = os.path.getsize(target)
+        total_source += source_size
+        total_mpy += mpy_size
+        print("%-16s %7d -> %6d bytes" % (module, source_size, mpy_size))
+    with open(os.path.join(out, "main.py"), "w") as f:
+        f.write(STUB)
+    print("%-16s %7d -> %6d bytes in %s" % ("total", total_source, total_mpy, out))
+
+
+def deploy(out):
+    """
+    Copy the build to the Pico and remove the sources it replaces, which
+    would otherwise be imported in preference to the .mpy files
+    """
+    files = sorted(os.path.join(out, name) for name in os.listdir(out))
+    subprocess.run(["mpremote", "cp"] + files + [":"], check=True)
+    for source, module in modules():
+        if module != GAME_MODULE:
+            subprocess.run(["mpremote", "rm", ":" + module + ".py"], stderr=subprocess.DEVNULL)
+
+
+def stage_frozen(out, opt):
+    if os.path.isdir(out):
+        shutil.rmtree(out)
+    os.makedirs(out)
+    manifest = MANIFEST
+    for source, module in modules():
+        shutil.copyfile(source, os.path.join(out, module + ".py"))
+        manifest += 'module("%s.py", opt=%d)\n' % (module, opt)
+    with open(os.path.join(out, "manifest.py"), "w") as f:
+        f.write(manifest)
+    with open(os.path.join(out, "main.py"), "w") as f:
+        f.write(STUB)
+    print("Staged %d modules and manifest.py in %s" % (len(modules()), out))
+    print("Build the firmware with FROZEN_MANIFEST=%s" % os.path.abspath(os.path.join(out, "manifest.py")))
+    print("and replace the sources on the Pico with just %s" % os.path.join(out, "main.py"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompile or freeze the game's modules")
+    parser.add_argument("--freeze", action="store_true", help="stage sources and a manifest for a firmware build")
+    parser.add_argument("--deploy", action="store_true", help="copy the .mpy build to the Pico with mpremote")
+    parser.add_argument("--out", help="output directory (default build/mpy or build/frozen)")
+    parser.add_argument("--mpy-cross", default="mpy-cross",
+                        help="mpy-cross command (default mpy-cross; \"python3 -m mpy_cross\" also works)")
+    parser.add_argument("--opt", type=int, default=0, choices=range(4),
+                        help="optimisation level; 3 drops asserts and line numbers from tracebacks")
+    args = parser.parse_args()
+
+    if args.freeze:
+        stage_frozen(args.out or os.path.join(ROOT, "build", "frozen"), args.opt)
+        return
+    out = args.out or os.path.join(ROOT, "build", "mpy")
+    compile_all(out, args.mpy_cross.split(), args.opt)
+    if args.deploy:
+        deploy(out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+# capture_imu.py Print labelled IMU samples as CSV for tools/train_gestures.py
+#
+# Runs on the Pico, e.g.
+#   mpremote cp imu.py vector3d.py : + run tools/capture_imu.py > shake.csv
+# Edit LABEL and perform only that gesture while it records.
+#
+# Each FIFO burst is written with one call, since a print per sample at
+# 200 Hz is slow enough over USB to overflow the FIFO. If it overflows
+# anyway, a "break" row marks the gap so no training window spans it;
+# tools/train_gestures.py reports how many it found.
+
+import struct
+import sys
+from machine import I2C, Pin
+from utime import sleep_ms, ticks_ms, ticks_diff
+from imu import MPU6050
+
+LABEL = "shake"        # idle, bump or shake
+SECONDS = 30
+MPU_SDA_PIN = 2
+MPU_SCL_PIN = 3
+SAMPLE_BYTES = 12
+MAX_SAMPLES = 16       # Samples per FIFO read
+BREAK = "break,0,0,0,0,0,0\n"
+
+
+def main():
+    i2c = I2C(1, sda=Pin(MPU_SDA_PIN), scl=Pin(MPU_SCL_PIN), freq=400000)
+    mpu = MPU6050(i2c)
+    mpu.filter_range = 3  # 41 Hz low pass, 1 kHz internal rate
+    mpu.sample_rate = 4   # 1 kHz / (1 + 4) = 200 Hz
+    mpu.fifo_start()
+    buf = bytearray(MAX_SAMPLES * SAMPLE_BYTES)
+    views = tuple(memoryview(buf)[:n * SAMPLE_BYTES] for n in range(MAX_SAMPLES + 1))
+    prefix = LABEL + ","
+    sys.stdout.write("label,ax,ay,az,gx,gy,gz\n")
+    start = ticks_ms()
+    while ticks_diff(ticks_ms(), start) < SECONDS * 1000:
+        count = mpu.fifo_count
+        if count >= 1024:
+            # Overflowed: samples were lost and the stream is no longer aligned
+            mpu.fifo_start()
+            sys.stdout.write(BREAK)
+            continue
+        samples = count // SAMPLE_BYTES
+        lines = []
+        while samples:
+            n = min(samples, MAX_SAMPLES)
+            mpu.read_fifo_into(views[n])
+            for i in range(0, n * SAMPLE_BYTES, SAMPLE_BYTES):
+                lines.append(prefix + "%d,%d,%d,%d,%d,%d\n" % struct.unpack_from(">6h", buf, i))
+            samples -= n
+        if lines:
+            sys.stdout.write("".join(lines))
+        sleep_ms(20)
+
+
+main()
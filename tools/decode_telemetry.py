@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""Decode the binary telemetry stream from telemetry.py on the host.
+
+Capture straight from the Pico (needs pyserial) or from a file of raw bytes:
+    python3 tools/decode_telemetry.py --port /dev/ttyACM0 --seconds 30 --out run1
+    python3 tools/decode_telemetry.py capture.bin --out run1
+
+Writes run1_imu.csv and run1_inputs.csv, or run1.npz with --npz (needs
+NumPy). Times are in microseconds, unwrapped from the 30 bit ticks_us. IMU
+samples are read from the FIFO in bursts that share one timestamp, so each
+burst is spread back over the sample period before it. Anything that isn't a
+frame with a good checksum, such as printed text, is skipped, and gaps in the
+sequence numbers are reported as lost frames.
+"""
+
+import argparse
+import csv
+import struct
+import sys
+import time
+
+TICKS_PERIOD = 1 << 30
+SYNC = b"\xa5\x5a"
+FRAME_SIZE = 21
+TM_IMU = 1
+TM_INPUTS = 2
+IMU_RATE = 200
+
+
+class Decoder(object):
+    """Feed bytes in any chunking; complete frames collect in imu and inputs."""
+
+    def __init__(self, imu_rate=IMU_RATE):
+        self.imu_period_us = 1000000 // imu_rate
+        self.pending = bytearray()
+        self.imu = []      # [time_us, ax, ay, az, gx, gy, gz]
+        self.inputs = []   # [time_us, joystick_x, joystick_y, slider, touch]
+        self.frames = 0
+        self.bad = 0       # Sync found but checksum wrong
+        self.lost = 0      # Frames missing according to the sequence numbers
+        self.skipped = 0   # Bytes that weren't part of any frame
+        self._seq = None
+        self._last_ticks = None
+        self._epoch = 0
+        self._burst = []
+
+    def _unwrap(self, ticks):
+        if self._last_ticks is not None and ticks < self._last_ticks - TICKS_PERIOD // 2:
+            self._epoch += TICKS_PERIOD
+        self._last_ticks = ticks
+        return self._epoch + ticks
+
+    def feed(self, data):
+        self.pending += data
+        buf = self.pending
+        i = 0
+        while True:
+            start = buf.find(SYNC, i)
+            if start < 0:
+                keep = len(buf) - 1 if buf.endswith(SYNC[:1]) else len(buf)
+                self.skipped += keep - i
+                i = keep
+                break
+            self.skipped += start - i
+            if start + FRAME_SIZE > len(buf):
+                i = start
+                break
+            frame = buf[start:start + FRAME_SIZE]
+            if sum(frame[2:20]) & 0xFF != frame[20]:
+                self.bad += 1
+                i = start + 1
+                continue
+            self._frame(frame)
+            i = start + FRAME_SIZE
+        del buf[:i]
+
+    def _frame(self, frame):
+        kind, seq, ticks = struct.unpack_from("<BBI", frame, 2)
+        if self._seq is not None:
+            self.lost += (seq - self._seq - 1) & 0xFF
+        self._seq = seq
+        self.frames += 1
+        t = self._unwrap(ticks)
+        if kind == TM_IMU:
+            values = list(struct.unpack_from(">6h", frame, 8))
+            if self._burst and self._burst[0][0] != t:
+                self._end_burst()
+            self._burst.append([t] + values)
+        elif kind == TM_INPUTS:
+            self.inputs.append([t] + list(struct.unpack_from("<4H", frame, 8)))
+
+    def _end_burst(self):
+        n = len(self._burst)
+        for k, sample in enumerate(self._burst):
+            sample[0] -= (n - 1 - k) * self.imu_period_us
+        self.imu.extend(self._burst)
+        self._burst = []
+
+    def finish(self):
+        if self._burst:
+            self._end_burst()
+
+
+def read_port(port, seconds, decoder):
+    try:
+        import serial
+    except ImportError:
+        sys.exit("--port needs pyserial: pip install pyserial")
+    end = time.monotonic() + seconds
+    with serial.Serial(port, timeout=0.1) as s:
+        while time.monotonic() < end:
+            decoder.feed(s.read(4096))
+
+
+def write_csv(path, header, rows):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
+    print("Wrote %s (%d rows)" % (path, len(rows)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Decode Beep It binary telemetry")
+    parser.add_argument("path", nargs="?", help="file of captured bytes")
+    parser.add_argument("--port", help="serial port to capture from instead")
+    parser.add_argument("--seconds", type=float, default=10, help="how long to capture from --port")
+    parser.add_argument("--out", default="telemetry", help="output file prefix")
+    parser.add_argument("--npz", action="store_true", help="write one NumPy .npz instead of CSV files")
+    parser.add_argument("--imu-rate", type=int, default=IMU_RATE)
+    args = parser.parse_args()
+
+    decoder = Decoder(args.imu_rate)
+    if args.port:
+        read_port(args.port, args.seconds, decoder)
+    elif args.path:
+        with open(args.path, "rb") as f:
+            decoder.feed(f.read())
+    else:
+        parser.error("give a capture file or --port")
+    decoder.finish()
+
+    print("%d frames, %d lost, %d bad checksums, %d other bytes skipped" % (
+        decoder.frames, decoder.lost, decoder.bad, decoder.skipped))
+    if args.npz:
+        import numpy as np
+        np.savez(args.out + ".npz",
+                 imu_time_us=np.array([r[0] for r in decoder.imu], dtype=np.int64),
+                 imu=np.array([r[1:] for r in decoder.imu], dtype=np.int16).reshape(-1, 6),
+                 inputs_time_us=np.array([r[0] for r in decoder.inputs], dtype=np.int64),
+                 inputs=np.array([r[1:] for r in decoder.inputs], dtype=np.uint16).reshape(-1, 4))
+        print("Wrote %s.npz" % args.out)
+    else:
+        write_csv(args.out + "_imu.csv", ["time_us", "ax", "ay", "az", "gx", "gy", "gz"], decoder.imu)
+        write_csv(args.out + "_inputs.csv", ["time_us", "joystick_x", "joystick_y", "slider", "touch"],
+                  decoder.inputs)
+
+
+if __name__ == "__main__":
+    main()
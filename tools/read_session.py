@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""Summarise a recorded session, or convert it to CSV, on the host.
+
+Copy a recording off the Pico with
+    mpremote cp :session000.bin .
+then
+    python3 tools/read_session.py session000.bin
+    python3 tools/read_session.py session000.bin --csv session000.csv
+
+The CSV has one row per record: ticks_ms, type and up to six values. IMU
+rows hold ax, ay, az, gx, gy, gz as signed raw counts; the other types hold
+the payload fields listed in recorder.py.
+"""
+
+import argparse
+import collections
+import csv
+import os
+import struct
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import recorder  # noqa: E402
+
+PAYLOADS = {
+    recorder.REC_IMU: ">6h",
+    recorder.REC_ADC: "<HH",
+    recorder.REC_TOUCH: "<H",
+    recorder.REC_PROMPT: "<HH",
+    recorder.REC_OUTCOME: "<HHHH",
+    recorder.REC_IMU_RESET: "<H",
+}
+
+
+def decode(kind, payload):
+    fmt = PAYLOADS.get(kind)
+    if fmt is None:
+        return ()
+    return struct.unpack_from(fmt, payload)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarise or convert a recorded session")
+    parser.add_argument("path")
+    parser.add_argument("--csv", help="write every record to this CSV file")
+    args = parser.parse_args()
+
+    counts = collections.Counter()
+    scores = []
+    first = last = None
+    with open(args.path, "rb") as f, (open(args.csv, "w", newline="") if args.csv else open(os.devnull, "w")) as out:
+        version, seed, start = recorder.read_header(f)
+        writer = csv.writer(out)
+        writer.writerow(["ticks_ms", "type", "v0", "v1", "v2", "v3", "v4", "v5"])
+        for kind, ticks, payload in recorder.read_records(f):
+            values = decode(kind, payload)
+            counts[recorder.REC_NAMES.get(kind, kind)] += 1
+            first = ticks if first is None else first
+            last = ticks
+            if kind == recorder.REC_OUTCOME and values[0] == recorder.OUTCOME_GAME_OVER:
+                scores.append(values[2])
+            writer.writerow([ticks, recorder.REC_NAMES.get(kind, kind)] + list(values))
+
+    print("%s: version %d, seed %d" % (args.path, version, seed))
+    if first is not None:
+        print("%.1f s recorded" % (((last - first) & recorder.TICKS_MASK) / 1000))
+    for name, count in sorted(counts.items()):
+        print("  %-8s %8d" % (name, count))
+    print("games finished: %d, scores: %s" % (len(scores), " ".join(str(s) for s in scores) or "-"))
+    if args.csv:
+        print("Wrote %s" % args.csv)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""Train and evaluate the IMU gesture decision tree on the host.
+
+Input is one or more CSV files with a header of
+    label,ax,ay,az,gx,gy,gz
+holding raw readings at 200 Hz, as written by tools/capture_imu.py. A row
+labelled "break" marks samples lost to a FIFO overflow. Runs of the same
+label between breaks are cut into windows, reduced with
+gestures.extract_features (the same code that runs on the Pico) and used to
+grow a small CART tree. The last fifth of each run is held out for
+evaluation; pass captures recorded separately with --test to use those
+instead.
+
+    python3 tools/train_gestures.py idle.csv bump.csv shake.csv --write
+"""
+
+import argparse
+import csv
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import gestures  # noqa: E402
+
+BREAK = "break"
+MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "gesture_model.py")
+
+
+def load_runs(paths):
+    """Return a list of runs, each a list of (features, label) pairs, one per
+    complete window in capture order. A run ends at a label change, a break
+    row or the end of a file."""
+    runs = []
+    breaks = 0
+    for path in paths:
+        with open(path, newline="") as f:
+            rows = list(csv.DictReader(f))
+        run_label, samples = None, []
+        for row in rows + [None]:
+            label = row["label"] if row else None
+            if label != run_label or len(samples) == gestures.WINDOW * 6:
+                if len(samples) == gestures.WINDOW * 6:
+                    features = [0] * gestures.N_FEATURES
+                    gestures.extract_features(samples, features)
+                    runs[-1].append((features, gestures.LABELS.index(run_label)))
+                if label != run_label and label not in (None, BREAK):
+                    runs.append([])
+                run_label, samples = label, []
+            if label == BREAK:
+                breaks += 1
+                run_label = None
+            elif row:
+                samples.extend(int(row[k]) for k in ("ax", "ay", "az", "gx", "gy", "gz"))
+    if breaks:
+        print(f"{breaks} FIFO overflows in the captures; no window spans one")
+    return [run for run in runs if run]
+
+
+def split(runs):
+    """Hold out the last fifth of each run as one contiguous block.
+
+    Neighbouring windows of a run are nearly alike, so holding out every
+    fifth window would test on near copies of the training data.
+    """
+    train, test = [], []
+    for run in runs:
+        cut = len(run) - len(run) // 5
+        train += run[:cut]
+        test += run[cut:]
+    return train, test
+
+
+def gini(labels):
+    n = len(labels)
+    if not n:
+        return 0.0
+    return 1.0 - sum((labels.count(c) / n) ** 2 for c in set(labels))
+
+
+def majority(labels):
+    return max(set(labels), key=labels.count)
+
+
+def grow(windows, depth, max_depth, min_leaf, nodes):
+    """Append the subtree for windows to nodes and return its index."""
+    index = len(nodes)
+    labels = [label for _, label in windows]
+    nodes.append((-1, majority(labels), 0, 0))
+    if depth >= max_depth or len(set(labels)) == 1 or len(windows) < 2 * min_leaf:
+        return index
+
+    best = None
+    for feature in range(gestures.N_FEATURES):
+        values = sorted(set(f[feature] for f, _ in windows))
+        for lo, hi in zip(values, values[1:]):
+            threshold = (lo + hi) // 2
+            left = [label for f, label in windows if f[feature] <= threshold]
+            right = [label for f, label in windows if f[feature] > threshold]
+            if len(left) < min_leaf or len(right) < min_leaf:
+                continue
+            score = (len(left) * gini(left) + len(right) * gini(right)) / len(windows)
+            if best is None or score < best[0]:
+                best = (score, feature, threshold)
+    if best is None or best[0] >= gini(labels):
+        return index
+
+    _, feature, threshold = best
+    left = grow([w for w in windows if w[0][feature] <= threshold], depth + 1, max_depth, min_leaf, nodes)
+    right = grow([w for w in windows if w[0][feature] > threshold], depth + 1, max_depth, min_leaf, nodes)
+    nodes[index] = (feature, threshold, left, right)
+    return index
+
+
+def evaluate(tree, windows):
+    n = len(gestures.LABELS)
+    confusion = [[0] * n for _ in range(n)]
+    start = time.perf_counter()
+    for features, label in windows:
+        confusion[label][gestures.predict(tree, features)] += 1
+    elapsed = time.perf_counter() - start
+    correct = sum(confusion[i][i] for i in range(n))
+    print("Confusion (rows are truth, columns are predictions):")
+    print("        " + "".join(f"{name:>8}" for name in gestures.LABELS))
+    for i, name in enumerate(gestures.LABELS):
+        print(f"{name:>8}" + "".join(f"{c:>8}" for c in confusion[i]))
+    if windows:
+        print(f"Accuracy: {correct / len(windows):.1%} over {len(windows)} windows")
+        print(f"Host predict time: {elapsed / len(windows) * 1e6:.1f} us per window")
+
+
+def format_model(tree, command):
+    lines = [
+        "# gesture_model.py Decision tree used by gestures.py",
+        "#",
+        "# Generated by tools/train_gestures.py. Rebuild it with",
+        "#   " + command,
+        "# Each node is (feature, threshold, left, right); leaves are (-1, label, 0, 0).",
+        "# Features: " + ", ".join(f"{i} {name}" for i, name in enumerate(gestures.FEATURE_NAMES)),
+        "# Labels: " + ", ".join(f"{i} {name}" for i, name in enumerate(gestures.LABELS)),
+        "",
+        "TREE = (",
+    ]
+    lines += [f"    {node}," for node in tree]
+    lines += [")", ""]
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("csv", nargs="+", help="labelled sample files")
+    parser.add_argument("--test", nargs="+", metavar="CSV",
+                        help="evaluate on these captures instead of holding out part of each run")
+    parser.add_argument("--max-depth", type=int, default=4)
+    parser.add_argument("--min-leaf", type=int, default=5)
+    parser.add_argument("--write", action="store_true", help="overwrite gesture_model.py")
+    args = parser.parse_args()
+
+    if args.test:
+        train = [w for run in load_runs(args.csv) for w in run]
+        test = [w for run in load_runs(args.test) for w in run]
+    else:
+        train, test = split(load_runs(args.csv))
+    print(f"{len(train)} training and {len(test)} test windows")
+
+    print("\nCurrent model")
+    evaluate(gestures.TREE, test)
+
+    nodes = []
+    grow(train, 0, args.max_depth, args.min_leaf, nodes)
+    tree = tuple(nodes)
+    print("\nTrained model")
+    evaluate(tree, test)
+
+    command = " ".join(["python3 tools/train_gestures.py"] + sys.argv[1:])
+    if args.write:
+        with open(MODEL_PATH, "w") as f:
+            f.write(format_model(tree, command))
+        print(f"\nWrote {os.path.normpath(MODEL_PATH)}")
+    else:
+        print("\n" + format_model(tree, command))
+
+
+if __name__ == "__main__":
+    main()
@@ -81,27 +81,33 @@ class Vector3d(object):
         '''
         return list(map(lambda val, offset: val - offset, self._vector, self.cal))
 
+    def _axis(self, n):
+        '''
+        Corrected value of one vehicle relative axis, without building
+        the whole calibrated vector
+        '''
+        i = self._transpose[n]
+        return (self._vector[i] - self.cal[i]) * self._scale[n]
+
     @property
     def x(self):                                # Corrected, vehicle relative floating point values
         self.update()
-        return self._calvector[self._transpose[0]] * self._scale[0]
+        return self._axis(0)
 
     @property
     def y(self):
         self.update()
-        return self._calvector[self._transpose[1]] * self._scale[1]
+        return self._axis(1)
 
     @property
     def z(self):
         self.update()
-        return self._calvector[self._transpose[2]] * self._scale[2]
+        return self._axis(2)
 
     @property
     def xyz(self):
         self.update()
-        return (self._calvector[self._transpose[0]] * self._scale[0],
-                self._calvector[self._transpose[1]] * self._scale[1],
-                self._calvector[self._transpose[2]] * self._scale[2])
+        return (self._axis(0), self._axis(1), self._axis(2))
 
     @property
     def magnitude(self):